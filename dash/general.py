@@ -6,13 +6,14 @@ import sys
 import altair as alt
 from pathlib import Path
 
-from utils.load import load_data
+from utils.load import load_data, load_snapshots
 from utils.general_page import print_last_registered_matches, print_general_ranking, print_ranking_last_matches
 
 root_path = os.path.abspath(os.path.join(os.getcwd(), ".."))
 sys.path.append(root_path)
 
 from src.config import load_config
+from src.storage import base_columns
 
 
 # -----------------------------------
@@ -24,10 +25,12 @@ config_path = os.path.join(root_path, config_file)
 config = load_config(config_path) 
 
 # Train test dataframes import 
-TRAIN_PATH = os.path.join(os.path.join(root_path, config['preprocessed_dir']), config['preprocessed_train_df_name'] + '.csv') 
-TEST_PATH = os.path.join(os.path.join(root_path, config['preprocessed_dir']), config['preprocessed_test_df_name'] + '.csv')
+TRAIN_PATH = os.path.join(os.path.join(root_path, config['preprocessed_dir']), config['preprocessed_train_df_name']) 
+TEST_PATH = os.path.join(os.path.join(root_path, config['preprocessed_dir']), config['preprocessed_test_df_name'])
+SNAPSHOTS_PATH = os.path.join(root_path, config['preprocessed_dir'], config['matchday_snapshots_name'] + '.joblib')
 DATE_COL = config['date_column']
-df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL)
+df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL, base_columns(config)) # only the columns used by the page
+snapshots = load_snapshots(SNAPSHOTS_PATH, df, config)
 
 start_date = df[DATE_COL].min().date()
 end_date = df[DATE_COL].max().date()
@@ -51,7 +54,7 @@ def render_general():
     end_date = df[DATE_COL].max().date()
 
     print_last_registered_matches(df, DATE_COL, HOME_COL, AWAY_COL, HOME_GOALS, AWAY_GOALS)
-    print_general_ranking(df, SEASON_COL, FINAL_RESULT, HOME_COL, AWAY_COL, HOME_GOALS, AWAY_GOALS)
+    print_general_ranking(df, SEASON_COL, FINAL_RESULT, HOME_COL, AWAY_COL, HOME_GOALS, AWAY_GOALS, snapshots)
     print_ranking_last_matches(df, HOME_COL, AWAY_COL, HOME_GOALS, AWAY_GOALS)
 
     st.markdown("<hr/>", unsafe_allow_html=True)
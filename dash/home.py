@@ -12,6 +12,7 @@ root_path = os.path.abspath(os.path.join(os.getcwd(), ".."))
 sys.path.append(root_path)
 
 from src.config import load_config
+from src.storage import base_columns
 
 
 # -----------------------------------
@@ -23,10 +24,10 @@ config_path = os.path.join(root_path, config_file)
 config = load_config(config_path) 
 
 # Train test dataframes import 
-TRAIN_PATH = os.path.join(os.path.join(root_path, config['preprocessed_dir']), config['preprocessed_train_df_name'] + '.csv') 
-TEST_PATH = os.path.join(os.path.join(root_path, config['preprocessed_dir']), config['preprocessed_test_df_name'] + '.csv')
+TRAIN_PATH = os.path.join(os.path.join(root_path, config['preprocessed_dir']), config['preprocessed_train_df_name']) 
+TEST_PATH = os.path.join(os.path.join(root_path, config['preprocessed_dir']), config['preprocessed_test_df_name'])
 DATE_COL = config['date_column']
-df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL)
+df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL, base_columns(config)) # dataset shared with the other pages
 
 start_date = df[DATE_COL].min().date()
 end_date = df[DATE_COL].max().date()
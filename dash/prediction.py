@@ -7,10 +7,12 @@ import altair as alt
 
 from scipy.stats import poisson
 from pathlib import Path
-from utils.load import load_data
+from utils.load import load_data, load_feature_state
 from utils.prediction_page import build_preprocessed_input_row, primary_prediction, secondary_prediction
 from src.config import load_config
+from src.storage import base_columns
 from src.feature_engineering import create_diff_features
+from src.prediction import DIFF_PATTERNS
 
 
 # -------------------
@@ -23,8 +25,9 @@ config_file = 'config.yaml'
 config_path = os.path.join(root_path, config_file)
 config = load_config(config_path)
 
-TRAIN_PATH = os.path.join(root_path, config['preprocessed_dir'], config['preprocessed_train_df_name'] + '.csv')
-TEST_PATH = os.path.join(root_path, config['preprocessed_dir'], config['preprocessed_test_df_name'] + '.csv')
+TRAIN_PATH = os.path.join(root_path, config['preprocessed_dir'], config['preprocessed_train_df_name'])
+TEST_PATH = os.path.join(root_path, config['preprocessed_dir'], config['preprocessed_test_df_name'])
+STATE_PATH = os.path.join(root_path, config['preprocessed_dir'], config['preprocessing_state_name'] + '.joblib')
 DATE_COL = config['date_column']
 SEASON_COL = config['season_column']
 HOME_COL = config['home_column']
@@ -32,7 +35,8 @@ AWAY_COL = config['away_column']
 HOME_GOALS = config['nb_goals_home_column']
 AWAY_GOALS = config['nb_goals_away_column']
 FINAL_RESULT = config['final_result_column']
-df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL)
+df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL, base_columns(config)) # teams, seasons and matches of the feature state
+state = load_feature_state(STATE_PATH, df, config)
 
 
 # ---------------------------------------------------------
@@ -47,7 +51,7 @@ def render_prediction():
     # Team selection
     # ---------------------------------------------------------
     teams = sorted(pd.unique(df[[HOME_COL, AWAY_COL]].values.ravel()))
-    seasons = sorted(pd.unique(df[[SEASON_COL]].values.ravel()))
+    seasons = state.seasons[-1:] # only the last season: indicators of a past season would use the matches of the later seasons
 
     st.subheader("⚽ Select match context")
 
@@ -86,17 +90,9 @@ def render_prediction():
     if st.button("🔮 Predict match"):
         with st.spinner("Computing prediction..."):
 
-            input_row = build_preprocessed_input_row(df, home_team, away_team, season, odd_home, odd_draw, odd_away, config)
-            input_row = pd.DataFrame([input_row])
-
-            patterns = [
-                    ("_home_team_ranking_at_home", "_away_team_ranking_away"),
-                    ("_home_team_at_home", "_away_team_away"),
-                    ("_home_team", "_away_team"),
-                    ("_at_home", "_away"),
-                    ("_home", "_away")
-            ]
-            input_row_processed = create_diff_features(input_row, patterns=patterns)
+            input_row = build_preprocessed_input_row(state, home_team, away_team, season, odd_home, odd_draw, odd_away, config)
+
+            input_row_processed = create_diff_features(input_row, patterns=DIFF_PATTERNS)
 
             
             proba_home, proba_draw, proba_away = primary_prediction(
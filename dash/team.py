@@ -10,6 +10,7 @@ from utils.load import load_data
 from utils.team_page import compute_team_history, compute_season_kpis
 from src.data_analysis import ClubAnalysis
 from src.config import load_config
+from src.storage import base_columns
 
 
 # -------------------
@@ -22,8 +23,8 @@ config_file = 'config.yaml'
 config_path = os.path.join(root_path, config_file)
 config = load_config(config_path)
 
-TRAIN_PATH = os.path.join(root_path, config['preprocessed_dir'], config['preprocessed_train_df_name'] + '.csv')
-TEST_PATH = os.path.join(root_path, config['preprocessed_dir'], config['preprocessed_test_df_name'] + '.csv')
+TRAIN_PATH = os.path.join(root_path, config['preprocessed_dir'], config['preprocessed_train_df_name'])
+TEST_PATH = os.path.join(root_path, config['preprocessed_dir'], config['preprocessed_test_df_name'])
 DATE_COL = config['date_column']
 SEASON_COL = config['season_column']
 HOME_COL = config['home_column']
@@ -31,7 +32,7 @@ AWAY_COL = config['away_column']
 HOME_GOALS = config['nb_goals_home_column']
 AWAY_GOALS = config['nb_goals_away_column']
 FINAL_RESULT = config['final_result_column']
-df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL)
+df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL, base_columns(config)) # only the columns used by the page
 
 
 # ---------------------
@@ -40,7 +41,7 @@ df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL)
 def render_team():
     st.set_page_config(page_title="Team", page_icon="🎯", layout="wide")
 
-    df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL)
+    df = load_data(TRAIN_PATH, TEST_PATH, DATE_COL, base_columns(config)) # no reading unless the files have changed
     
     st.title("🎯 Team Dashboard")
     
@@ -22,15 +22,47 @@ def print_last_registered_matches(df, DATE_COL, HOME_COL, AWAY_COL, HOME_GOALS,
     st.dataframe(last_matches_display)
 
 
-def print_general_ranking(df, SEASON_COL, FINAL_RESULT, HOME_COL, AWAY_COL, HOME_GOALS, AWAY_GOALS):
+def print_general_ranking(df, SEASON_COL, FINAL_RESULT, HOME_COL, AWAY_COL, HOME_GOALS, AWAY_GOALS, snapshots=None):
     """
     Compute and display the general ranking table for the current season
+    The table is read from the matchday snapshots when they are given, and computed from the matches otherwise
     """
     current_season = df[SEASON_COL].max()
-    df_season = df[df[SEASON_COL] == current_season].copy()
 
     st.header(f"🏆 Current table — Season {current_season}")
 
+    if snapshots is not None:
+        table = snapshots.as_of(current_season)
+        table = table[table['played'] > 0].sort_values(by='ranking')
+        ranking = pd.DataFrame({
+            'Points': table['points'],
+            'Played Matches': table['played'],
+            'Goals scored': table['goals_scored'],
+            'Goals conceded': table['goals_conceded'],
+            'Goal difference': table['goal_diff']
+        })
+    else:
+        ranking = _compute_general_ranking(df[df[SEASON_COL] == current_season].copy(), FINAL_RESULT, HOME_COL, AWAY_COL, HOME_GOALS, AWAY_GOALS)
+    ranking.index.name = 'Team'
+
+    st.dataframe(
+        ranking[['Points', 'Played Matches', 'Goals scored', 'Goals conceded', 'Goal difference']]
+        .style.format({
+            'Points': '{:.0f}',
+            'Played Matches': '{:.0f}',
+            'Goals scored': '{:.0f}',
+            'Goals conceded': '{:.0f}',
+            'Goal difference': '{:.0f}'
+        })
+        .set_properties(**{'text-align': 'center'})
+        .set_properties(subset=['Points'], **{'font-weight': 'bold'})
+    )
+
+
+def _compute_general_ranking(df_season, FINAL_RESULT, HOME_COL, AWAY_COL, HOME_GOALS, AWAY_GOALS):
+    """
+    Compute the general ranking table from the matches of a season
+    """
     # Point mapping
     df_season['home_points'] = df_season[FINAL_RESULT].map({'home': 3, 'draw': 1, 'away': 0})
     df_season['away_points'] = df_season[FINAL_RESULT].map({'home': 0, 'draw': 1, 'away': 3})
@@ -57,21 +89,7 @@ def print_general_ranking(df, SEASON_COL, FINAL_RESULT, HOME_COL, AWAY_COL, HOME
     ranking['Goals conceded'] = ranking['goals_conceded_home'] + ranking['goals_conceded_away']
     ranking['Goal difference'] = ranking['Goals scored'] - ranking['Goals conceded']
 
-    ranking = ranking.sort_values(by=['Points', 'Goal difference'], ascending=False)
-    ranking.index.name = 'Team'
-
-    st.dataframe(
-        ranking[['Points', 'Played Matches', 'Goals scored', 'Goals conceded', 'Goal difference']]
-        .style.format({
-            'Points': '{:.0f}',
-            'Played Matches': '{:.0f}',
-            'Goals scored': '{:.0f}',
-            'Goals conceded': '{:.0f}',
-            'Goal difference': '{:.0f}'
-        })
-        .set_properties(**{'text-align': 'center'})
-        .set_properties(subset=['Points'], **{'font-weight': 'bold'})
-    )
+    return ranking.sort_values(by=['Points', 'Goal difference'], ascending=False)
 
 
 def print_ranking_last_matches(df, HOME_COL, AWAY_COL, HOME_GOALS, AWAY_GOALS, LAST_N_MATCHES=5):
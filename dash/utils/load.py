@@ -1,11 +1,57 @@
+import os
+import threading
 import pandas as pd
 
 
-def load_data(TRAIN_PATH, TEST_PATH, DATE_COL):
+# Datasets loaded by the pages of the process: (train path, test path, date column, columns) -> (files and mtimes, read-only dataframe)
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def load_data(TRAIN_PATH, TEST_PATH, DATE_COL, columns=None):
+    """
+    Load and merge the train/test preprocessed datasets (paths without extension: columnar files are preferred to csv files)
+    Only the given columns are read if columns is specified
+    The merged dataset is loaded once per process and reloaded only when one of the files changes: each call returns a shallow copy of
+    it, whose arrays are read-only (pages may add columns to it, not modify it in place)
+    """
+    from src.storage import dataframe_path, load_dataframe, read_only
+
+    key = (os.path.abspath(TRAIN_PATH), os.path.abspath(TEST_PATH), DATE_COL, None if columns is None else tuple(columns))
+    signature = tuple((filepath, os.path.getmtime(filepath)) for filepath in (dataframe_path(TRAIN_PATH), dataframe_path(TEST_PATH)))
+
+    with _datasets_lock:
+        cached = _datasets.get(key)
+        if cached is None or cached[0] != signature:
+            train = load_dataframe(TRAIN_PATH, DATE_COL, columns)
+            test = load_dataframe(TEST_PATH, DATE_COL, columns)
+            df = pd.concat([train, test], ignore_index=True)
+            cached = (signature, read_only(df.sort_values(DATE_COL)))
+            _datasets[key] = cached
+    return cached[1].copy(deep=False)
+
+
+def load_snapshots(SNAPSHOTS_PATH, df, config):
     """
-    Load and merge the train/test preprocessed datasets
+    Load the matchday snapshots written during preprocessing, or build them from the loaded dataset if they have not been persisted or if
+    they do not match it (different number of matches or last date, e.g. new matches added by the incremental preprocessing)
     """
-    train = pd.read_csv(TRAIN_PATH, parse_dates=[DATE_COL])
-    test = pd.read_csv(TEST_PATH, parse_dates=[DATE_COL])
-    df = pd.concat([train, test], ignore_index=True)
-    return df.sort_values(DATE_COL)
\ No newline at end of file
+    from src.engines import MatchdaySnapshots
+    from src.preprocessing import build_matchday_snapshots
+
+    if os.path.exists(SNAPSHOTS_PATH):
+        snapshots = MatchdaySnapshots.load(SNAPSHOTS_PATH)
+        same_matches = getattr(snapshots, 'nb_matches', None) == len(df) and (len(df) == 0 or
+                                                                             snapshots.last_date == pd.to_datetime(df[config['date_column']]).max())
+        if same_matches:
+            return snapshots
+    return build_matchday_snapshots(df, config)
+
+
+def load_feature_state(STATE_PATH, df, config):
+    """
+    Load the running state of the indicators written during preprocessing, or build it from the loaded dataset if it has not been persisted
+    """
+    from src.prediction import load_feature_state as load_state
+
+    return load_state(STATE_PATH, df, config)
\ No newline at end of file
@@ -1,26 +1,88 @@
 import pandas as pd
+import numpy as np
 import os
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Sequence, Mapping, Tuple
 from datetime import datetime
 
 
+def file_hash(filepath: str) -> str:
+    """
+    Returns the SHA-256 digest of the content of a file
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_raw_season(filepath: str,
+                    columns: Mapping[str, str]=None,
+                    cache_dir: str=None) -> pd.DataFrame:
+    """
+    Reads the raw file of a season, with only the given columns and their types
+
+    Args:
+        filepath: path of the raw csv file
+        columns: keys are the columns to read, values are their types (all the columns are read, with inferred types, if None)
+            Columns missing from the file (bookmaker not covering the season) are filled with missing values
+        cache_dir: folder where the parsed season is cached; the cache entry is keyed by the hash of the file and of the columns, so
+            that an unchanged season is read from the cache instead of being parsed again
+
+    Returns:
+        A Pandas dataframe with the matchs of the season (empty lines removed)
+    """
+    cache_path = None
+    if cache_dir is not None:
+        key = hashlib.sha256((file_hash(filepath) + json.dumps(columns, sort_keys=True)).encode()).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        cache_path = os.path.join(cache_dir, f'{name}.{key}.parquet')
+        if os.path.exists(cache_path):
+            return pd.read_parquet(cache_path)
+
+    if columns is None:
+        data = pd.read_csv(filepath)
+    else:
+        data = pd.read_csv(filepath, usecols=lambda col: col in columns,
+                           dtype={col: dtype for col, dtype in columns.items()})
+        data = data.reindex(columns=list(columns))
+        data = data.astype({col: dtype for col, dtype in columns.items() if dtype != 'str'}) # types of the missing columns
+    data.dropna(how = 'all', inplace = True)
+    data.reset_index(drop=True, inplace=True)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        data.to_parquet(cache_path, index=False)
+    return data
+
+
 def import_raw_aggregated_dataset(first_year: int,
                                   last_year: int,
-                                  raw_data_file: str) -> pd.DataFrame:
+                                  raw_data_file: str,
+                                  columns: Mapping[str, str]=None,
+                                  cache_dir: str=None,
+                                  max_workers: int=None) -> pd.DataFrame:
     """
     Allows to save an aggregated dataset with all the Ligue 1 matchs from a season to another season
     All the files have a name like 'ligue1_firstYear_lastYear'
+    Seasons are read in parallel by a pool of threads (cf read_raw_season)
     
     Args:
         first_year: first year of the first season we want to save (e.g. 2012 for 2012/2013)
         last_year: last year of the last season we want to save (e.g. 2015 for 2014/2015)
         raw_data_file: folder with all the raw data to aggregate
+        columns: keys are the columns to read, values are their types (cf config['raw_columns']); all the columns if None
+        cache_dir: folder where parsed seasons are cached, keyed by file hash (no cache if None)
+        max_workers: number of threads reading the seasons (default of ThreadPoolExecutor if None)
 
     Returns:
         A Pandas dataframe with all the matchs from the first season to the last season
     """
 
-    df_list = []
+    filepaths = []
 
     for year in range(first_year, last_year):
         filename = f'ligue1_{year}_{year + 1}.csv'
@@ -30,13 +92,14 @@ def import_raw_aggregated_dataset(first_year: int,
             print(f"File not found: {filepath} (ignored)")
             continue
 
-        data = pd.read_csv(filepath)
-        data.dropna(how = 'all', inplace = True)
-        df_list.append(data)
+        filepaths.append(filepath)
 
-    if not df_list:
+    if not filepaths:
         raise ValueError("No data has been loaded")
 
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        df_list = list(executor.map(lambda filepath: read_raw_season(filepath, columns, cache_dir), filepaths))
+
     df = pd.concat(df_list, ignore_index=True)
     return df
 
@@ -82,7 +145,7 @@ def convert_dates_column(df: pd.DataFrame,
     """
     Converts a date column in a dataframe to datetime objects, handling multiple formats
 
-    This function attempts to parse each value in the specified column using two common date formats:
+    The format of each value is detected from the length of its year, and all the values of a same format are parsed at once:
     - '%d/%m/%y' (e.g., 12/08/23)
     - '%d/%m/%Y' (e.g., 12/08/2023)
 
@@ -92,18 +155,26 @@ def convert_dates_column(df: pd.DataFrame,
 
     Returns:
         The dataframe with the date column converted to datetime objects
-    """
 
-    def parse_date(value: str):
-        for fmt in ("%d/%m/%y", "%d/%m/%Y"):
-            try:
-                return datetime.strptime(value, fmt)
-            except (ValueError, TypeError):
-                continue
-        raise ValueError(f"Unrecognized date format: {value}")
+    Raises:
+        ValueError if a value matches none of the two formats
+    """
 
     df = df.copy()
-    df[date_column] = df[date_column].apply(parse_date)
+    values = df[date_column]
+    year_length = values.str.rsplit('/', n=1).str[-1].str.len()
+
+    dates = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    for fmt, length in (("%d/%m/%y", 2), ("%d/%m/%Y", 4)):
+        mask = year_length == length
+        if mask.any():
+            dates[mask] = pd.to_datetime(values[mask], format=fmt, errors='coerce')
+
+    unparsed = dates.isna()
+    if unparsed.any():
+        raise ValueError(f"Unrecognized date format: {values[unparsed].iloc[0]}")
+
+    df[date_column] = dates
 
     return df
 
@@ -129,4 +200,26 @@ def season(date: datetime.date) -> str:
     if month >= 8: # a ligue 1 season starts in August min
         season = season + str(year) + '/' + str(year + 1)
 
-    return season
\ No newline at end of file
+    return season
+
+
+def seasons(dates: pd.Series) -> pd.Series:
+    """
+    Vectorized version of season: returns the season of each date of a datetime column, under the format 'year1/year2'
+    The season strings are built once per distinct (year, month) couple, then mapped on the whole column
+
+    Args:
+        dates: datetime column with the dates of the matches
+
+    Returns:
+        A column with the season of each match (same index as dates)
+    """
+    year = dates.dt.year.to_numpy()
+    month = dates.dt.month.to_numpy()
+    first_year = np.where(month <= 6, year - 1, year) # a ligue 1 season ends in June max and starts in August min
+
+    first_years, codes = np.unique(first_year, return_inverse=True)
+    labels = np.array([f'{y}/{y + 1}' for y in first_years], dtype=object)
+    values = labels[codes]
+    values[month == 7] = '' # no season in July
+    return pd.Series(values, index=dates.index, name=dates.name)
\ No newline at end of file
@@ -16,11 +16,12 @@ class ClubAnalysis:
             raise AttributeError(f"{self.club} not in the providen dataframe")
 
         if ('home_points' not in self.df.columns) and ('away_points' not in self.df.columns):
-            self.df['home_points'] = self.df[config['final_result_column']].map({'home': 3, 'draw': 1, 'away': 0})
-            self.df['away_points'] = self.df[config['final_result_column']].map({'home': 0, 'draw': 1, 'away': 3})
+            # Points added to a new dataframe: the providen one may be shared (dashboard) and is left untouched
+            self.df = self.df.assign(home_points=self.df[config['final_result_column']].map({'home': 3, 'draw': 1, 'away': 0}),
+                                     away_points=self.df[config['final_result_column']].map({'home': 0, 'draw': 1, 'away': 3}))
             
-        self.all_seasons = sorted(df[self.config['season_column']].unique())
-        self.club_matches = df[(df[self.config['home_column']] == club_name) | (df[self.config['away_column']] == club_name)].copy()
+        self.all_seasons = sorted(self.df[self.config['season_column']].unique())
+        self.club_matches = self.df[(self.df[self.config['home_column']] == club_name) | (self.df[self.config['away_column']] == club_name)].copy()
         self._prepare_points()
         self._prepare_ranks()
         self._prepare_goals()
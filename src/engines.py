@@ -0,0 +1,1040 @@
+import copy
+import joblib
+import numpy as np
+import pandas as pd
+from collections import deque
+from src.utils import _nargsort
+
+
+HOME_POINTS = {'home': 3, 'draw': 1, 'away': 0}
+AWAY_POINTS = {'home': 0, 'draw': 1, 'away': 3}
+
+
+def _positions(order, size) -> np.ndarray:
+    """
+    Converts an ordering of team codes into a ranking array (1 for the first team, -1 for teams not ranked)
+    """
+    ranks = np.full(size, -1, dtype=np.int64)
+    ranks[order] = np.arange(1, len(order) + 1)
+    return ranks
+
+
+class SeasonTable:
+    """
+    Running league table of one season, fed matchday by matchday
+
+    For each club, the table keeps cumulative counters (points, goals scored, goals conceded), overall and split between home and away matches
+    A snapshot of the table taken before the matches of a date gives the current season indicators of these matches, with the same values as
+    the ones computed by src.utils functions on the matches played strictly before that date (-1 when a club has no such match)
+    """
+    COUNTERS = ('played', 'points', 'goals_scored', 'goals_conceded',
+                'home_played', 'home_points', 'home_goals_scored', 'home_goals_conceded',
+                'away_played', 'away_points', 'away_goals_scored', 'away_goals_conceded',
+                'away_side_goals')
+
+    FIELDS = ('points', 'goals_scored', 'goals_conceded', 'goal_diff', 'ranking', 'attack_ranking', 'defense_ranking',
+              'home_points', 'home_goals_scored', 'home_goals_conceded', 'home_ranking',
+              'away_points', 'away_goals_scored', 'away_goals_conceded', 'away_ranking',
+              'played')
+
+    def __init__(self):
+        self.teams = {}
+        self.names = []
+        self.totals = np.zeros((0, len(self.COUNTERS)), dtype=np.int64)
+        self._col = {name: j for j, name in enumerate(self.COUNTERS)}
+        self._alphabetical_order = np.zeros(0, dtype=np.intp)
+        self._snapshot = None # snapshot of the current state, dropped when matches are added
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_snapshot'] = None # cache not persisted
+        return state
+
+
+    def _codes(self, teams) -> np.ndarray:
+        """
+        Returns the codes of the teams given in input, registering the teams never seen before
+        """
+        new_teams = [t for t in dict.fromkeys(teams) if t not in self.teams]
+        if new_teams:
+            for t in new_teams:
+                self.teams[t] = len(self.names)
+                self.names.append(t)
+            self.totals = np.vstack([self.totals, np.zeros((len(new_teams), len(self.COUNTERS)), dtype=np.int64)])
+            self._alphabetical_order = np.argsort(np.array(self.names, dtype=object), kind='stable')
+        return np.array([self.teams[t] for t in teams], dtype=np.intp)
+
+
+    def add_matches(self, home, away, goals_home, goals_away, final_result):
+        """
+        Adds played matches to the table
+
+        Args:
+            home: home teams of the matches
+            away: away teams of the matches
+            goals_home: number of goals scored by the home teams
+            goals_away: number of goals scored by the away teams
+            final_result: categorical final results ('home', 'draw' or 'away')
+        """
+        h = self._codes(list(home))
+        a = self._codes(list(away))
+        goals_home = np.asarray(goals_home, dtype=np.int64)
+        goals_away = np.asarray(goals_away, dtype=np.int64)
+        points_home = np.array([HOME_POINTS[r] for r in final_result], dtype=np.int64)
+        points_away = np.array([AWAY_POINTS[r] for r in final_result], dtype=np.int64)
+        ones = np.ones(len(h), dtype=np.int64)
+        zeros = np.zeros(len(h), dtype=np.int64)
+
+        # One row of increments per match and per side, columns ordered as SeasonTable.COUNTERS
+        # The last counter sums the goals of the away side of the match, whoever the club is (cf attack / defense rankings in snapshot)
+        home_increments = np.column_stack([ones, points_home, goals_home, goals_away,
+                                           ones, points_home, goals_home, goals_away,
+                                           zeros, zeros, zeros, zeros,
+                                           goals_away])
+        away_increments = np.column_stack([ones, points_away, goals_away, goals_home,
+                                           zeros, zeros, zeros, zeros,
+                                           ones, points_away, goals_away, goals_home,
+                                           goals_away])
+        np.add.at(self.totals, h, home_increments)
+        np.add.at(self.totals, a, away_increments)
+        self._snapshot = None
+
+
+    def _alphabetical(self, mask) -> np.ndarray:
+        """
+        Codes of the teams selected by mask, in alphabetical order (order of a groupby on team names)
+        """
+        order = self._alphabetical_order
+        return order[mask[order]]
+
+
+    def snapshot(self) -> np.ndarray:
+        """
+        Returns the current state of the table as a matrix with one row per registered team and one column per field of SeasonTable.FIELDS
+        Fields of a team without any match (or without any home / away match for home / away fields) are set to -1, except the number of
+        matches played
+
+        NB: attack and defense rankings rank the clubs on the goals scored by the away side of their matches, as the preprocessing always did
+        The snapshot is computed once per state of the table and returned read only
+        """
+        if getattr(self, '_snapshot', None) is not None:
+            return self._snapshot
+
+        t = self.totals
+        c = self._col
+        n = len(self.names)
+        snap = np.full((n, len(self.FIELDS)), -1, dtype=np.int64)
+        if n == 0:
+            snap.flags.writeable = False
+            return snap
+
+        played = t[:, c['played']] > 0
+        home_played = t[:, c['home_played']] > 0
+        away_played = t[:, c['away_played']] > 0
+        goal_diff = t[:, c['goals_scored']] - t[:, c['goals_conceded']]
+        home_goal_diff = t[:, c['home_goals_scored']] - t[:, c['home_goals_conceded']]
+        away_goal_diff = t[:, c['away_goals_scored']] - t[:, c['away_goals_conceded']]
+
+        # General, attack and defense rankings (points then goal difference, ties in alphabetical order)
+        codes = self._alphabetical(played)
+        general = codes[np.lexsort((-goal_diff[codes], -t[codes, c['points']]))]
+        attack = codes[_nargsort(t[codes, c['away_side_goals']], ascending=False)]
+        defense = codes[_nargsort(t[codes, c['away_side_goals']], ascending=True)]
+
+        # Home and away rankings
+        home_codes = self._alphabetical(home_played)
+        home = home_codes[np.lexsort((-home_goal_diff[home_codes], -t[home_codes, c['home_points']]))]
+        away_codes = self._alphabetical(away_played)
+        away = away_codes[np.lexsort((-away_goal_diff[away_codes], -t[away_codes, c['away_points']]))]
+
+        f = {name: j for j, name in enumerate(self.FIELDS)}
+        snap[played, f['points']] = t[played, c['points']]
+        snap[played, f['goals_scored']] = t[played, c['goals_scored']]
+        snap[played, f['goals_conceded']] = t[played, c['goals_conceded']]
+        snap[played, f['goal_diff']] = goal_diff[played]
+        snap[:, f['ranking']] = _positions(general, n)
+        snap[:, f['attack_ranking']] = _positions(attack, n)
+        snap[:, f['defense_ranking']] = _positions(defense, n)
+
+        snap[home_played, f['home_points']] = t[home_played, c['home_points']]
+        snap[home_played, f['home_goals_scored']] = t[home_played, c['home_goals_scored']]
+        snap[home_played, f['home_goals_conceded']] = t[home_played, c['home_goals_conceded']]
+        snap[:, f['home_ranking']] = _positions(home, n)
+
+        snap[away_played, f['away_points']] = t[away_played, c['away_points']]
+        snap[away_played, f['away_goals_scored']] = t[away_played, c['away_goals_scored']]
+        snap[away_played, f['away_goals_conceded']] = t[away_played, c['away_goals_conceded']]
+        snap[:, f['away_ranking']] = _positions(away, n)
+
+        snap[:, f['played']] = t[:, c['played']]
+
+        snap.flags.writeable = False
+        self._snapshot = snap
+        return snap
+
+
+    def lookup(self, snapshot, teams) -> np.ndarray:
+        """
+        Returns the rows of a snapshot for the teams given in input (rows full of -1 for teams unknown when the snapshot was taken)
+        """
+        out = np.full((len(teams), len(self.FIELDS)), -1, dtype=np.int64)
+        for k, team in enumerate(teams):
+            code = self.teams.get(team)
+            if code is not None and code < len(snapshot):
+                out[k] = snapshot[code]
+        return out
+
+
+def _date_boundaries(dates) -> np.ndarray:
+    """
+    Start positions of each date block in an array of dates sorted chronologically (the end of the array is appended)
+    """
+    dates = np.asarray(dates)
+    if len(dates) == 0:
+        return np.array([0], dtype=np.intp)
+    starts = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+    return np.concatenate([[0], starts, [len(dates)]])
+
+
+def current_season_features(df, date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the current season indicators of all the matches of df in a single chronological pass per season
+
+    Args:
+        df: dataframe with the matches, sorted by date
+        date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col: names of the corresponding columns of df
+
+    Returns:
+        Two matrices (home team, away team) with one row per match of df and one column per field of SeasonTable.FIELDS
+    """
+    snapshots = MatchdaySnapshots.from_matches(df, date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col)
+    return snapshots.features(df, date_col, season_col, home_col, away_col)
+
+
+class MatchdaySnapshots:
+    """
+    Store of the league tables of each season as of each matchday ("state of the league before kickoff")
+
+    For each season, the snapshot of the SeasonTable is kept before each date with matches, plus the table after the last registered date
+    The table as of any date D (matches played strictly before D) is then a lookup, without recomputing the table from the matches
+    """
+    def __init__(self):
+        self.seasons = {}   # season -> {'dates', 'teams', 'names', 'tables'}, tables of shape (nb dates + 1, nb teams, nb fields)
+        self.index = {}     # (season, date) -> position of the date in the tables of the season
+        self.last_date = None
+        self.nb_matches = 0
+
+
+    @classmethod
+    def from_matches(cls, df, date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col) -> 'MatchdaySnapshots':
+        """
+        Builds the store from the matches of df (sorted by date), with one chronological pass per season
+
+        Args:
+            df: dataframe with the matches, sorted by date
+            date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col: names of the corresponding columns of df
+        """
+        store = cls()
+        dates = pd.to_datetime(df[date_col]).to_numpy()
+        homes = df[home_col].to_numpy()
+        aways = df[away_col].to_numpy()
+        goals_home = df[goals_home_col].to_numpy()
+        goals_away = df[goals_away_col].to_numpy()
+        results = df[result_col].to_numpy()
+
+        for season, positions in df.groupby(season_col, sort=False, observed=True).indices.items():
+            table = SeasonTable()
+            bounds = _date_boundaries(dates[positions])
+            snapshots = []
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                day = positions[start:end]
+                # State of the league before kickoff: matches of the same day are not taken into account
+                snapshots.append(table.snapshot())
+                table.add_matches(homes[day], aways[day], goals_home[day], goals_away[day], results[day])
+            snapshots.append(table.snapshot())
+
+            # Clubs registered during the season get rows of -1 in the snapshots taken before their first match
+            tables = np.full((len(snapshots), len(table.names), len(SeasonTable.FIELDS)), -1, dtype=np.int16) # season totals fit in int16
+            for k, snapshot in enumerate(snapshots):
+                tables[k, :len(snapshot)] = snapshot
+            season_dates = dates[positions][bounds[:-1]]
+            store.seasons[season] = {'dates': season_dates, 'teams': dict(table.teams), 'names': list(table.names), 'tables': tables}
+            store.index.update({(season, pd.Timestamp(date)): k for k, date in enumerate(season_dates)})
+
+        store.last_date = pd.Timestamp(dates.max()) if len(dates) > 0 else None
+        store.nb_matches = len(df)
+        return store
+
+
+    def save(self, path):
+        """
+        Persists the store on disk
+        """
+        joblib.dump(self, path)
+
+
+    @staticmethod
+    def load(path) -> 'MatchdaySnapshots':
+        """
+        Loads a store persisted with MatchdaySnapshots.save
+        """
+        return joblib.load(path)
+
+
+    def _position(self, season, date=None) -> int:
+        """
+        Position of the table of the season as of date (matches played strictly before date), the last table if date is None
+        """
+        tables = self.seasons[season]['tables']
+        if date is None:
+            return len(tables) - 1
+        date = pd.Timestamp(date)
+        position = self.index.get((season, date))
+        if position is None:
+            position = int(np.searchsorted(self.seasons[season]['dates'], date.to_datetime64(), side='left'))
+        return position
+
+
+    def table(self, season, date=None) -> np.ndarray:
+        """
+        Returns the table of the season as of date (all the registered matches of the season if date is None), as a matrix with one row per
+        club of the season and one column per field of SeasonTable.FIELDS
+        """
+        return self.seasons[season]['tables'][self._position(season, date)]
+
+
+    def as_of(self, season, date=None) -> pd.DataFrame:
+        """
+        Returns the table of the season as of date (all the registered matches of the season if date is None), as a dataframe indexed by club
+        with one column per field of SeasonTable.FIELDS (-1 for a club without any match before date)
+        """
+        table = pd.DataFrame(self.table(season, date), index=pd.Index(self.seasons[season]['names'], name='team'), columns=list(SeasonTable.FIELDS))
+        return table
+
+
+    def lookup(self, season, teams, date=None) -> np.ndarray:
+        """
+        Returns the rows of the table of the season as of date for the teams given in input (rows full of -1 for unknown teams)
+        """
+        out = np.full((len(teams), len(SeasonTable.FIELDS)), -1, dtype=np.int64)
+        if season not in self.seasons:
+            return out
+        table = self.table(season, date)
+        codes = self.seasons[season]['teams']
+        for k, team in enumerate(teams):
+            code = codes.get(team)
+            if code is not None:
+                out[k] = table[code]
+        return out
+
+
+    def features(self, df, date_col, season_col, home_col, away_col) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the current season indicators of the matches of df (tables as of the date of each match)
+
+        Returns:
+            Two matrices (home team, away team) with one row per match of df and one column per field of SeasonTable.FIELDS
+        """
+        home_out = np.full((len(df), len(SeasonTable.FIELDS)), -1, dtype=np.int64)
+        away_out = np.full((len(df), len(SeasonTable.FIELDS)), -1, dtype=np.int64)
+        dates = pd.to_datetime(df[date_col]).to_numpy()
+
+        for season, positions in df.groupby(season_col, sort=False, observed=True).indices.items():
+            if season not in self.seasons:
+                continue
+            stored = self.seasons[season]
+            tables = stored['tables']
+            tables = np.concatenate([tables, np.full((len(tables), 1, len(SeasonTable.FIELDS)), -1, dtype=tables.dtype)], axis=1) # row of unknown clubs
+            unknown = len(stored['names'])
+            k = np.searchsorted(stored['dates'], dates[positions], side='left')
+            home_codes = np.array([stored['teams'].get(team, unknown) for team in df[home_col].to_numpy()[positions]], dtype=np.intp)
+            away_codes = np.array([stored['teams'].get(team, unknown) for team in df[away_col].to_numpy()[positions]], dtype=np.intp)
+            home_out[positions] = tables[k, home_codes]
+            away_out[positions] = tables[k, away_codes]
+
+        return home_out, away_out
+
+
+def team_match_log(df, date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col) -> pd.DataFrame:
+    """
+    Builds the long view of the matches of df: one row per team and per match
+
+    Args:
+        df: dataframe with the matches, sorted by date
+        date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col: names of the corresponding columns of df
+
+    Returns:
+        A dataframe with columns 'match' (position of the match in df), 'is_home', 'season', 'date', 'team', 'opponent', 'points',
+        'goals_scored', 'goals_conceded' and 'win', sorted by season, team and match position
+    """
+    n = len(df)
+    results = df[result_col].to_numpy()
+    goals_home = df[goals_home_col].to_numpy(dtype=np.int64)
+    goals_away = df[goals_away_col].to_numpy(dtype=np.int64)
+    points_home = np.array([HOME_POINTS[r] for r in results], dtype=np.int64)
+    points_away = np.array([AWAY_POINTS[r] for r in results], dtype=np.int64)
+
+    log = pd.DataFrame({
+        'match': np.concatenate([np.arange(n), np.arange(n)]),
+        'is_home': np.concatenate([np.ones(n, dtype=bool), np.zeros(n, dtype=bool)]),
+        'season': np.concatenate([df[season_col].to_numpy(), df[season_col].to_numpy()]),
+        'date': np.concatenate([df[date_col].to_numpy(), df[date_col].to_numpy()]),
+        'team': np.concatenate([df[home_col].to_numpy(), df[away_col].to_numpy()]),
+        'opponent': np.concatenate([df[away_col].to_numpy(), df[home_col].to_numpy()]),
+        'points': np.concatenate([points_home, points_away]),
+        'goals_scored': np.concatenate([goals_home, goals_away]),
+        'goals_conceded': np.concatenate([goals_away, goals_home]),
+        'win': np.concatenate([points_home == 3, points_away == 3]).astype(np.int64)
+    })
+    return log.sort_values(by=['season', 'team', 'match'], kind='stable').reset_index(drop=True)
+
+
+def _window_sums(values, starts, ends) -> np.ndarray:
+    """
+    Sums of values over the slices [starts, ends) of a same array, from a single cumulative sum
+    """
+    cumsum = np.concatenate([[0], np.cumsum(values)])
+    return cumsum[ends] - cumsum[starts]
+
+
+def first_match_keys(dates, homes, aways, keys=None) -> dict:
+    """
+    Registers the first match of each club of a season: key (date, home, away, side) of its first match, side being 0 for the home team
+    and 1 for the away team. The key only depends on the matches, not on their order (e.g. matches played on a same date)
+
+    Args:
+        dates, homes, aways: dates and clubs of matches of the season
+        keys: dictionary {club: key} of the matches already registered, updated in place (new dictionary if None)
+
+    Returns:
+        The dictionary {club: key}
+    """
+    keys = {} if keys is None else keys
+    for date, home, away in zip(dates, homes, aways):
+        for team, key in ((home, (date, home, away, 0)), (away, (date, home, away, 1))):
+            if team not in keys or key < keys[team]:
+                keys[team] = key
+    return keys
+
+
+def tie_order(keys) -> list:
+    """
+    Order in which ties of the recent ranking are broken: clubs in order of their first match of the season (matches ordered by date, home
+    team and away team, home team first), from the keys of first_match_keys
+    Shared by recent_form_features and FeatureState, so that a club only known from its past matches is ranked the same way by both
+    """
+    return sorted(keys, key=keys.get)
+
+
+def tie_orders(df, date_col, season_col, home_col, away_col) -> dict:
+    """
+    Tie order of the recent ranking of each season of df (cf tie_order), independent from the row order of df
+
+    Returns:
+        A dictionary {season: array of clubs}
+    """
+    dates, homes, aways = pd.to_datetime(df[date_col]).tolist(), df[home_col].tolist(), df[away_col].tolist()
+    orders = {}
+    for season, positions in df.groupby(season_col, sort=False, observed=True).indices.items():
+        keys = first_match_keys([dates[i] for i in positions], [homes[i] for i in positions], [aways[i] for i in positions])
+        orders[season] = np.array(tie_order(keys), dtype=object)
+    return orders
+
+
+def recent_form_features(df, date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col, max_matches) -> tuple[dict, dict]:
+    """
+    Computes the absolute recent form indicators of all the matches of df: statistics of the max_matches last matches of each team in the
+    current season, played strictly before the match date, and ranking of all the clubs of the season on these last matches
+
+    Args:
+        df: dataframe with the matches, sorted by date
+        date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col: names of the corresponding columns of df
+        max_matches: length of the window of last matches
+
+    Returns:
+        Two dictionaries (home team, away team) of arrays with one value per match of df, with keys 'points_by_match', 'goals_scored_by_match',
+        'goals_conceded_by_match', 'goal_diff' and 'ranking' (-1 when a team has not played yet in the season)
+    """
+    log = team_match_log(df, date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col)
+
+    # Position of each entry in its (season, team) group, and number of matches of the team played strictly before the entry date
+    group_keys = [log['season'], log['team']]
+    rank_in_group = log.groupby(group_keys, sort=False).cumcount().to_numpy()
+    same_date_rank = log.groupby(group_keys + [log['date']], sort=False).cumcount().to_numpy()
+    group_start = np.arange(len(log)) - rank_in_group
+    nb_prior = rank_in_group - same_date_rank
+
+    # Rolling window of the max_matches last matches, as [start, end) slices of the log
+    window_end = group_start + nb_prior
+    window_start = group_start + np.maximum(nb_prior - max_matches, 0)
+    nb_matches = window_end - window_start
+
+    points = _window_sums(log['points'].to_numpy(), window_start, window_end)
+    goals_scored = _window_sums(log['goals_scored'].to_numpy(), window_start, window_end)
+    goals_conceded = _window_sums(log['goals_conceded'].to_numpy(), window_start, window_end)
+    has_played = nb_matches > 0
+    safe_nb_matches = np.where(has_played, nb_matches, 1)
+
+    entries = {
+        'points_by_match': np.where(has_played, points / safe_nb_matches, -1.0),
+        'goals_scored_by_match': np.where(has_played, goals_scored / safe_nb_matches, -1.0),
+        'goals_conceded_by_match': np.where(has_played, goals_conceded / safe_nb_matches, -1.0),
+        'goal_diff': np.where(has_played, goals_scored - goals_conceded, -1),
+        'ranking': np.full(len(log), -1, dtype=np.int64)
+    }
+
+    # Recent ranking: at each date of a season, all the clubs of the season are ranked on their window as of that date
+    log_season = log['season'].to_numpy()
+    log_team = log['team'].to_numpy()
+    log_date = log['date'].to_numpy()
+    log_points = log['points'].to_numpy()
+    log_goal_diff = (log['goals_scored'] - log['goals_conceded']).to_numpy()
+    orders = tie_orders(df, date_col, season_col, home_col, away_col)
+    for season, positions in df.groupby(season_col, sort=False, observed=True).indices.items():
+        season_df = df.iloc[positions]
+        dates = np.unique(season_df[date_col].to_numpy())
+        teams = orders[season]
+
+        window_points = np.empty((len(dates), len(teams)), dtype=np.int64)
+        window_goal_diff = np.empty((len(dates), len(teams)), dtype=np.int64)
+        team_entries = {}
+        for j, team in enumerate(teams):
+            idx = np.flatnonzero((log_season == season) & (log_team == team))
+            team_entries[team] = idx
+            end = np.searchsorted(log_date[idx], dates, side='left')
+            start = np.maximum(end - max_matches, 0)
+            played = end > 0
+            window_points[:, j] = np.where(played, _window_sums(log_points[idx], start, end), -1)
+            window_goal_diff[:, j] = np.where(played, _window_sums(log_goal_diff[idx], start, end), -1)
+
+        order = np.lexsort((-window_goal_diff, -window_points), axis=1)
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(1, len(teams) + 1)[None, :].repeat(len(dates), axis=0), axis=1)
+
+        for j, team in enumerate(teams):
+            idx = team_entries[team]
+            entries['ranking'][idx] = ranks[np.searchsorted(dates, log_date[idx]), j]
+
+    # Back to one value per match, for home and away teams
+    home_features, away_features = {}, {}
+    is_home = log['is_home'].to_numpy()
+    match = log['match'].to_numpy()
+    for key, values in entries.items():
+        home_features[key] = np.empty(len(df), dtype=values.dtype)
+        away_features[key] = np.empty(len(df), dtype=values.dtype)
+        home_features[key][match[is_home]] = values[is_home]
+        away_features[key][match[~is_home]] = values[~is_home]
+
+    return home_features, away_features
+
+
+def season_summaries(df, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col) -> tuple[list, dict, dict]:
+    """
+    Builds the final table of each season of df (points, goals scored, goals conceded and ranking of each club), once per season
+
+    Args:
+        df: dataframe with the matches, sorted by date
+        season_col, home_col, away_col, goals_home_col, goals_away_col, result_col: names of the corresponding columns of df
+
+    Returns:
+        - the seasons, in chronological order
+        - a dictionary giving the column of each club in the matrices below
+        - a dictionary of matrices (one row per season, one column per club) with keys 'points', 'goals_scored', 'goals_conceded' and
+          'ranking' (-1 when a club did not play the season)
+    """
+    seasons = list(df.groupby(season_col, sort=False, observed=True).indices.keys()) # df is sorted by date: order of first appearance is chronological
+    teams = {team: j for j, team in enumerate(pd.unique(np.concatenate([df[home_col].to_numpy(), df[away_col].to_numpy()])))}
+    summaries = {key: np.full((len(seasons), len(teams)), -1, dtype=np.int64) for key in ('points', 'goals_scored', 'goals_conceded', 'ranking')}
+
+    fields = {name: j for j, name in enumerate(SeasonTable.FIELDS)}
+    for k, (season, positions) in enumerate(df.groupby(season_col, sort=False, observed=True).indices.items()):
+        season_df = df.iloc[positions]
+        table = SeasonTable()
+        table.add_matches(season_df[home_col].to_numpy(), season_df[away_col].to_numpy(), season_df[goals_home_col].to_numpy(),
+                          season_df[goals_away_col].to_numpy(), season_df[result_col].to_numpy())
+        snapshot = table.snapshot()
+        codes = np.array([teams[team] for team in table.names], dtype=np.intp)
+        for key in summaries:
+            summaries[key][k, codes] = snapshot[:, fields[key]]
+
+    return seasons, teams, summaries
+
+
+def historical_form_features(df, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col) -> tuple[dict, dict]:
+    """
+    Computes the absolute historical form indicators of all the matches of df: averages by season of the final points, goals scored, goals
+    conceded and ranking of each team over all the previous seasons of df (a season without the team counts as -1)
+
+    Args:
+        df: dataframe with the matches, sorted by date
+        season_col, home_col, away_col, goals_home_col, goals_away_col, result_col: names of the corresponding columns of df
+
+    Returns:
+        Two dictionaries (home team, away team) of arrays with one value per match of df, with keys 'points', 'goals_scored', 'goals_conceded'
+        and 'ranking' (-1 for matches of the first season)
+
+    NB: seasons are assumed not to overlap, i.e. all the matches of a previous season are played before the first match of the next one
+    """
+    seasons, teams, summaries = season_summaries(df, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col)
+
+    # Cumulative sums over seasons: row k holds the totals of the k first seasons
+    season_index = {season: k for k, season in enumerate(seasons)}
+    nb_past_seasons = df[season_col].map(season_index).to_numpy()
+    has_history = nb_past_seasons > 0
+    safe_nb_past_seasons = np.where(has_history, nb_past_seasons, 1)
+
+    home_codes = np.array([teams[team] for team in df[home_col]], dtype=np.intp)
+    away_codes = np.array([teams[team] for team in df[away_col]], dtype=np.intp)
+
+    home_features, away_features = {}, {}
+    for key, values in summaries.items():
+        cumulated = np.vstack([np.zeros((1, len(teams)), dtype=np.int64), np.cumsum(values, axis=0)])
+        home_features[key] = np.where(has_history, cumulated[nb_past_seasons, home_codes] / safe_nb_past_seasons, -1.0)
+        away_features[key] = np.where(has_history, cumulated[nb_past_seasons, away_codes] / safe_nb_past_seasons, -1.0)
+
+    return home_features, away_features
+
+
+class HeadToHeadStore:
+    """
+    Index of the confrontations between each pair of clubs
+
+    Matches are grouped by pair key (unordered pair of clubs, or (home, away) couple when ordered=True) and, inside each pair, cumulative
+    arrays of points, goals and wins are kept for both clubs of the pair. Statistics of the last confrontations before any match are then
+    differences of two cumulative values, whatever the window length
+    """
+    def __init__(self, df, home_col, away_col, goals_home_col, goals_away_col, result_col, ordered=False):
+        """
+        Args:
+            df: dataframe with the matches, sorted by date
+            home_col, away_col, goals_home_col, goals_away_col, result_col: names of the corresponding columns of df
+            ordered: if True, TeamA vs TeamB and TeamB vs TeamA are two different pairs (home / away order kept)
+        """
+        self.ordered = ordered
+        home = df[home_col].to_numpy()
+        away = df[away_col].to_numpy()
+        results = df[result_col].to_numpy()
+        goals_home = df[goals_home_col].to_numpy(dtype=np.int64)
+        goals_away = df[goals_away_col].to_numpy(dtype=np.int64)
+        points_home = np.array([HOME_POINTS[r] for r in results], dtype=np.int64)
+        points_away = np.array([AWAY_POINTS[r] for r in results], dtype=np.int64)
+
+        # Pair key: first and second clubs of the pair
+        if ordered:
+            first, second = home, away
+        else:
+            home_first = home <= away
+            first, second = np.where(home_first, home, away), np.where(home_first, away, home)
+        self.first_is_home = first == home
+
+        # Matches grouped by pair, in chronological order inside each pair
+        keys = pd.DataFrame({'first': first, 'second': second})
+        self.order = np.lexsort((np.arange(len(df)), pd.factorize(keys['second'])[0], pd.factorize(keys['first'])[0]))
+        sorted_keys = keys.iloc[self.order]
+        rank_in_pair = sorted_keys.groupby(['first', 'second'], sort=False).cumcount().to_numpy()
+        self.pair_start = np.arange(len(df)) - rank_in_pair
+        self.rank_in_pair = rank_in_pair
+
+        # Cumulative arrays of the first and second clubs of each pair, in pair order
+        o = self.order
+        first_home = self.first_is_home[o]
+        stats = {
+            'points': (np.where(first_home, points_home[o], points_away[o]), np.where(first_home, points_away[o], points_home[o])),
+            'goals_scored': (np.where(first_home, goals_home[o], goals_away[o]), np.where(first_home, goals_away[o], goals_home[o])),
+        }
+        stats['wins'] = ((stats['points'][0] == 3).astype(np.int64), (stats['points'][1] == 3).astype(np.int64))
+        self.cumulated = {key: tuple(np.concatenate([[0], np.cumsum(values)]) for values in pair) for key, pair in stats.items()}
+
+
+    def features(self, max_matches) -> tuple[dict, dict]:
+        """
+        Computes the relative recent form indicators of all the stored matches, based on the max_matches previous confrontations of the pair
+
+        Returns:
+            Two dictionaries (home team, away team) of arrays with one value per stored match (in the order of df), with keys 'points_by_match',
+            'goals_scored_by_match', 'goals_conceded_by_match', 'goal_diff' and 'percentage_victory' (-1 when the pair has never met before)
+        """
+        end = np.arange(len(self.order))
+        start = self.pair_start + np.maximum(self.rank_in_pair - max_matches, 0)
+        nb_matches = end - start
+        has_met = nb_matches > 0
+        safe_nb_matches = np.where(has_met, nb_matches, 1)
+
+        sums = {key: tuple(c[end] - c[start] for c in pair) for key, pair in self.cumulated.items()}
+        first = {
+            'points': sums['points'][0],
+            'goals_scored': sums['goals_scored'][0],
+            'goals_conceded': sums['goals_scored'][1],
+            'wins': sums['wins'][0]
+        }
+        second = {
+            'points': sums['points'][1],
+            'goals_scored': sums['goals_scored'][1],
+            'goals_conceded': sums['goals_scored'][0],
+            'wins': sums['wins'][1]
+        }
+
+        first_home = self.first_is_home[self.order]
+        home_features, away_features = {}, {}
+        for features, is_first in ((home_features, first_home), (away_features, ~first_home)):
+            team = {key: np.where(is_first, first[key], second[key]) for key in first}
+            in_pair_order = {
+                'points_by_match': np.where(has_met, team['points'] / safe_nb_matches, -1.0),
+                'goals_scored_by_match': np.where(has_met, team['goals_scored'] / safe_nb_matches, -1.0),
+                'goals_conceded_by_match': np.where(has_met, team['goals_conceded'] / safe_nb_matches, -1.0),
+                'goal_diff': np.where(has_met, team['goals_scored'] - team['goals_conceded'], -1).astype(np.float64),
+                'percentage_victory': np.where(has_met, 100 * (team['wins'] / safe_nb_matches), -1.0)
+            }
+            for key, values in in_pair_order.items():
+                features[key] = np.empty(len(values), dtype=values.dtype)
+                features[key][self.order] = values
+
+        return home_features, away_features
+
+
+def club_seasons_features(df, season_col, home_col, away_col) -> tuple[dict, dict]:
+    """
+    Computes the external factors related to the presence of the clubs in the championship, from club x season presence matrices
+
+    Args:
+        df: dataframe with the matches
+        season_col, home_col, away_col: names of the corresponding columns of df
+
+    Returns:
+        Two dictionaries (home team, away team) of arrays with one value per match of df, with keys:
+        - 'nb_past_seasons': number of previous seasons in which the club played (at home for the home team, away for the away team)
+        - 'promoted': 1 if the club did not play at home the previous season, 0 otherwise (always 0 for the first season of df)
+    """
+    years = df[season_col].str.split('/').str[0].astype(int).to_numpy() # season start year (e.g. 2014 for 2014/2015)
+    all_years = np.unique(years)
+    year_idx = np.searchsorted(all_years, years)
+
+    codes, clubs = pd.factorize(np.concatenate([df[home_col].to_numpy(), df[away_col].to_numpy()]))
+    home_codes, away_codes = codes[:len(df)], codes[len(df):]
+
+    # Presence matrices (one row per club, one column per season start year) and number of seasons of presence strictly before each year
+    presence = {}
+    nb_previous = {}
+    for side, side_codes in (('home', home_codes), ('away', away_codes)):
+        presence[side] = np.zeros((len(clubs), len(all_years)), dtype=bool)
+        presence[side][side_codes, year_idx] = True
+        nb_previous[side] = np.cumsum(presence[side], axis=1) - presence[side]
+
+    # Previous season of each match, if present in df
+    previous_idx = np.searchsorted(all_years, years - 1)
+    has_previous = (previous_idx < len(all_years)) & (all_years[np.minimum(previous_idx, len(all_years) - 1)] == years - 1)
+    previous_idx = np.minimum(previous_idx, len(all_years) - 1)
+    first_season = years == all_years[0]
+
+    home_features, away_features = {}, {}
+    for features, side, side_codes in ((home_features, 'home', home_codes), (away_features, 'away', away_codes)):
+        features['nb_past_seasons'] = nb_previous[side][side_codes, year_idx].astype(np.int64)
+        played_previous = has_previous & presence['home'][side_codes, previous_idx]
+        features['promoted'] = np.where(first_season, 0, (~played_previous).astype(np.int64))
+
+    return home_features, away_features
+
+
+class FeatureState:
+    """
+    Running state of all the indicators computed from the matches (phases 2 to 7 of the preprocessing), fed matchday by matchday
+
+    The state keeps the league table of each season, the list of the last matches of each club in each season, the last confrontations of
+    each pair of clubs and the seasons of presence of each club. The indicators of new matches are then computed from the state only, with the
+    same values as the ones computed on the whole history by the other functions of this module
+    Matches given to the state must be played strictly after the last date already known by the state
+    """
+    def __init__(self, date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col,
+                 abs_max_matches, rel_max_matches, strict_rel_max_matches):
+        """
+        Args:
+            date_col, season_col, home_col, away_col, goals_home_col, goals_away_col, result_col: names of the columns of the matches
+            abs_max_matches, rel_max_matches, strict_rel_max_matches: window lengths of absolute, relative and strict relative recent form
+        """
+        self.date_col = date_col
+        self.season_col = season_col
+        self.home_col = home_col
+        self.away_col = away_col
+        self.goals_home_col = goals_home_col
+        self.goals_away_col = goals_away_col
+        self.result_col = result_col
+        self.abs_max_matches = abs_max_matches
+        self.rel_max_matches = rel_max_matches
+        self.strict_rel_max_matches = strict_rel_max_matches
+
+        self.last_date = None
+        self.nb_matches = 0
+        self.seasons = []            # seasons in chronological order
+        self.tables = {}             # season -> SeasonTable
+        self.season_teams = {}       # season -> club -> key of its first match (tie order of the recent ranking, cf first_match_keys)
+        self.recent = {}             # (season, team) -> deque of (points, goals scored, goals conceded) of the last matches
+        self.pairs = {}              # sorted pair of clubs -> deque of (points, goals, wins) of both clubs, in pair order
+        self.strict_pairs = {}       # (home, away) -> deque of (points, goals, wins) of both clubs, home team first
+        self.presence = {'home': {}, 'away': {}} # side -> club -> season start years
+
+
+    @classmethod
+    def from_history(cls, df, *args, **kwargs) -> 'FeatureState':
+        """
+        Builds the state from the matches of df (sorted by date), without computing their indicators
+        Other arguments are the ones of the constructor
+        """
+        state = cls(*args, **kwargs)
+        state.update(df)
+        return state
+
+
+    def save(self, path):
+        """
+        Persists the state on disk
+        """
+        joblib.dump(self, path)
+
+
+    @staticmethod
+    def load(path) -> 'FeatureState':
+        """
+        Loads a state persisted with FeatureState.save
+        """
+        return joblib.load(path)
+
+
+    def _check_dates(self, df):
+        if len(df) > 0 and self.last_date is not None and not (df[self.date_col] > self.last_date).all():
+            raise ValueError(f"New matches must be played strictly after the last known date ({self.last_date})")
+
+
+    def _register(self, df):
+        """
+        Registers the seasons and the clubs of the matches of df, before any computation (as a batch computation sees the whole seasons)
+        """
+        for date, season, home, away in zip(df[self.date_col], df[self.season_col], df[self.home_col], df[self.away_col]):
+            if season not in self.tables:
+                self.seasons.append(season)
+                self.tables[season] = SeasonTable()
+                self.season_teams[season] = {}
+            first_match_keys([pd.Timestamp(date)], [home], [away], self.season_teams[season])
+
+
+    def update(self, df):
+        """
+        Adds the matches of df (sorted by date) to the state
+        """
+        self._check_dates(df)
+        if len(df) == 0:
+            return
+        self._register(df)
+
+        homes = df[self.home_col].to_numpy()
+        aways = df[self.away_col].to_numpy()
+        goals_home = df[self.goals_home_col].to_numpy(dtype=np.int64)
+        goals_away = df[self.goals_away_col].to_numpy(dtype=np.int64)
+        results = df[self.result_col].to_numpy()
+        seasons = df[self.season_col].to_numpy()
+
+        # League tables: one update per season
+        for season, positions in df.groupby(self.season_col, sort=False, observed=True).indices.items():
+            self.tables[season].add_matches(homes[positions], aways[positions], goals_home[positions], goals_away[positions], results[positions])
+
+        for season, home, away, gh, ga, result in zip(seasons, homes, aways, goals_home, goals_away, results):
+            ph, pa = HOME_POINTS[result], AWAY_POINTS[result]
+            year = int(season.split('/')[0])
+
+            # Last matches of the season
+            for key, match in (((season, home), (ph, gh, ga)), ((season, away), (pa, ga, gh))):
+                self.recent.setdefault(key, deque(maxlen=self.abs_max_matches)).append(match)
+
+            # Last confrontations, stored with the clubs in pair order
+            home_stats, away_stats = (ph, int(gh), int(ph == 3)), (pa, int(ga), int(pa == 3))
+            pair = (home, away) if home <= away else (away, home)
+            confrontation = home_stats + away_stats if home <= away else away_stats + home_stats
+            self.pairs.setdefault(pair, deque(maxlen=self.rel_max_matches)).append(confrontation)
+            self.strict_pairs.setdefault((home, away), deque(maxlen=self.strict_rel_max_matches)).append(home_stats + away_stats)
+
+            # Seasons of presence
+            self.presence['home'].setdefault(home, set()).add(year)
+            self.presence['away'].setdefault(away, set()).add(year)
+
+        self.last_date = df[self.date_col].iloc[-1]
+        self.nb_matches += len(df)
+
+
+    def _current_season(self, df) -> tuple[np.ndarray, np.ndarray]:
+        home_out = np.full((len(df), len(SeasonTable.FIELDS)), -1, dtype=np.int64)
+        away_out = np.full((len(df), len(SeasonTable.FIELDS)), -1, dtype=np.int64)
+        for season, positions in df.groupby(self.season_col, sort=False, observed=True).indices.items():
+            table = self.tables[season]
+            snapshot = table.snapshot()
+            home_out[positions] = table.lookup(snapshot, df[self.home_col].to_numpy()[positions])
+            away_out[positions] = table.lookup(snapshot, df[self.away_col].to_numpy()[positions])
+        return home_out, away_out
+
+
+    def _recent_form(self, df) -> tuple[dict, dict]:
+        # Window of each club of the involved seasons: (nb matches, points, goals scored, goals conceded)
+        windows, rankings = {}, {}
+        for season in pd.unique(df[self.season_col]):
+            teams = tie_order(self.season_teams[season])
+            for team in teams:
+                matches = self.recent.get((season, team), ())
+                windows[(season, team)] = (len(matches), *(sum(m[k] for m in matches) for k in range(3)))
+            points = np.array([windows[(season, t)][1] if windows[(season, t)][0] > 0 else -1 for t in teams], dtype=np.int64)
+            goal_diff = np.array([windows[(season, t)][2] - windows[(season, t)][3] if windows[(season, t)][0] > 0 else -1 for t in teams], dtype=np.int64)
+            order = np.lexsort((-goal_diff, -points))
+            rankings.update({(season, team): rank for team, rank in zip(teams, _positions(order, len(teams)))})
+
+        home_features, away_features = {}, {}
+        for features, team_col in ((home_features, self.home_col), (away_features, self.away_col)):
+            keys = list(zip(df[self.season_col], df[team_col]))
+            nb, points, goals_scored, goals_conceded = (np.array([windows[key][k] for key in keys], dtype=np.int64) for k in range(4))
+            has_played = nb > 0
+            safe_nb = np.where(has_played, nb, 1)
+            features['points_by_match'] = np.where(has_played, points / safe_nb, -1.0)
+            features['goals_scored_by_match'] = np.where(has_played, goals_scored / safe_nb, -1.0)
+            features['goals_conceded_by_match'] = np.where(has_played, goals_conceded / safe_nb, -1.0)
+            features['goal_diff'] = np.where(has_played, goals_scored - goals_conceded, -1)
+            features['ranking'] = np.array([rankings[key] for key in keys], dtype=np.int64)
+        return home_features, away_features
+
+
+    def _historical_form(self, df) -> tuple[dict, dict]:
+        # Final tables of the seasons (values of the current season are never used for its own matches)
+        fields = {name: j for j, name in enumerate(SeasonTable.FIELDS)}
+        snapshots = {season: self.tables[season].snapshot() for season in self.seasons}
+        keys = ('points', 'goals_scored', 'goals_conceded', 'ranking')
+
+        home_features, away_features = {key: np.empty(len(df)) for key in keys}, {key: np.empty(len(df)) for key in keys}
+        for k, (season, home, away) in enumerate(zip(df[self.season_col], df[self.home_col], df[self.away_col])):
+            past_seasons = self.seasons[:self.seasons.index(season)]
+            for features, team in ((home_features, home), (away_features, away)):
+                for key in keys:
+                    if not past_seasons:
+                        features[key][k] = -1.0
+                        continue
+                    total = 0
+                    for past in past_seasons:
+                        table = self.tables[past]
+                        code = table.teams.get(team)
+                        total += snapshots[past][code, fields[key]] if code is not None else -1
+                    features[key][k] = total / len(past_seasons)
+        return home_features, away_features
+
+
+    def _head_to_head(self, df, pairs, strict) -> tuple[dict, dict]:
+        keys = ('points_by_match', 'goals_scored_by_match', 'goals_conceded_by_match', 'goal_diff', 'percentage_victory')
+        home_features, away_features = {key: np.empty(len(df)) for key in keys}, {key: np.empty(len(df)) for key in keys}
+        for k, (home, away) in enumerate(zip(df[self.home_col], df[self.away_col])):
+            home_first = strict or home <= away
+            pair = (home, away) if home_first else (away, home)
+            confrontations = pairs.get(pair, ())
+            nb = len(confrontations)
+            # Sums of (points, goals, wins) of the first and second clubs of the pair
+            sums = [sum(c[j] for c in confrontations) for j in range(6)]
+            first, second = sums[:3], sums[3:]
+            for features, team, opponent in ((home_features, first, second), (away_features, second, first)) if home_first \
+                    else ((home_features, second, first), (away_features, first, second)):
+                if nb == 0:
+                    for key in keys:
+                        features[key][k] = -1.0
+                    continue
+                features['points_by_match'][k] = team[0] / nb
+                features['goals_scored_by_match'][k] = team[1] / nb
+                features['goals_conceded_by_match'][k] = opponent[1] / nb
+                features['goal_diff'][k] = team[1] - opponent[1]
+                features['percentage_victory'][k] = 100 * (team[2] / nb)
+        return home_features, away_features
+
+
+    def _ext_factors(self, df) -> tuple[dict, dict]:
+        first_year = min((int(season.split('/')[0]) for season in self.seasons), default=None)
+        home_features = {'nb_past_seasons': np.empty(len(df), dtype=np.int64), 'promoted': np.empty(len(df), dtype=np.int64)}
+        away_features = {'nb_past_seasons': np.empty(len(df), dtype=np.int64), 'promoted': np.empty(len(df), dtype=np.int64)}
+        for k, (season, home, away) in enumerate(zip(df[self.season_col], df[self.home_col], df[self.away_col])):
+            year = int(season.split('/')[0])
+            for features, team, side in ((home_features, home, 'home'), (away_features, away, 'away')):
+                features['nb_past_seasons'][k] = sum(1 for y in self.presence[side].get(team, ()) if y < year)
+                features['promoted'][k] = 0 if year == first_year else int(year - 1 not in self.presence['home'].get(team, ()))
+        return home_features, away_features
+
+
+    def features(self, df) -> dict:
+        """
+        Computes the indicators of the matches of df, all played on a same date, from the current state (the matches are registered but not
+        added to the state)
+
+        Returns:
+            A dictionary with keys 'current_season', 'absolute_recent', 'absolute_historical', 'relative_recent', 'strict_relative_recent' and
+            'ext_factors', giving for each phase the (home team, away team) outputs in the format of the corresponding function of this module
+        """
+        self._register(df)
+        return {
+            'current_season': self._current_season(df),
+            'absolute_recent': self._recent_form(df),
+            'absolute_historical': self._historical_form(df),
+            'relative_recent': self._head_to_head(df, self.pairs, strict=False),
+            'strict_relative_recent': self._head_to_head(df, self.strict_pairs, strict=True),
+            'ext_factors': self._ext_factors(df)
+        }
+
+
+    def query(self, df) -> dict:
+        """
+        Computes the indicators of hypothetical matches (e.g. fixtures to predict) as if they were played on the next matchday, without
+        modifying the state, which can then be shared by concurrent callers
+        Matches must belong to the last registered season or to a new one: the matches of an older season would be computed with the
+        confrontations and tables of the later seasons
+
+        Args:
+            df: dataframe with the season, home and away columns of the matches (the date column is optional)
+
+        Returns:
+            A dictionary with the same structure as FeatureState.features, with one value per match of df
+
+        Raises:
+            ValueError if a match belongs to a season older than the last registered one
+        """
+        past_seasons = sorted(set(pd.unique(df[self.season_col])) & set(self.seasons[:-1]))
+        if past_seasons:
+            raise ValueError(f"Matches of past seasons cannot be queried (last registered season: {self.seasons[-1]}): {past_seasons}")
+        if self.date_col not in df.columns:
+            next_date = self.last_date + pd.Timedelta(days=1) if self.last_date is not None else pd.Timestamp.today().normalize()
+            df = df.assign(**{self.date_col: next_date})
+
+        # Registration of the matches on a view of the state: containers modified by _register are copied, the others are shared
+        view = copy.copy(self)
+        view.seasons = list(self.seasons)
+        view.tables = dict(self.tables)
+        view.season_teams = {season: dict(keys) for season, keys in self.season_teams.items()}
+        return view.features(df)
+
+
+    def process(self, df) -> dict:
+        """
+        Computes the indicators of the new matches of df (sorted by date) matchday by matchday, and adds them to the state
+
+        Returns:
+            A dictionary with the same structure as FeatureState.features, with one value per match of df
+        """
+        self._check_dates(df)
+        self._register(df)
+
+        outputs = []
+        bounds = _date_boundaries(df[self.date_col].to_numpy())
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            day = df.iloc[start:end]
+            outputs.append(self.features(day))
+            self.update(day)
+
+        if not outputs:
+            return self.features(df)
+        result = {}
+        for phase in outputs[0]:
+            home = [output[phase][0] for output in outputs]
+            away = [output[phase][1] for output in outputs]
+            if isinstance(home[0], dict):
+                result[phase] = ({key: np.concatenate([h[key] for h in home]) for key in home[0]},
+                                 {key: np.concatenate([a[key] for a in away]) for key in away[0]})
+            else:
+                result[phase] = (np.concatenate(home), np.concatenate(away))
+        return result
@@ -1,18 +1,32 @@
 import os
+import json
+import time
+import threading
+import warnings
 import joblib
 import numpy as np
 import pandas as pd
+from collections import OrderedDict, deque
+from itertools import zip_longest
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from scipy.stats import rankdata
 
-from sklearn.model_selection import StratifiedKFold, KFold, GridSearchCV, cross_val_score, train_test_split
+from sklearn.model_selection import StratifiedKFold, KFold, GridSearchCV, ParameterGrid, cross_val_score, train_test_split
+from sklearn.experimental import enable_halving_search_cv # noqa: F401 (enables HalvingGridSearchCV)
+from sklearn.model_selection import HalvingGridSearchCV
+from sklearn.base import BaseEstimator, TransformerMixin, clone
+from sklearn.exceptions import FitFailedWarning
+from sklearn.utils import _safe_indexing
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, confusion_matrix, mean_absolute_error, mean_squared_error, r2_score
 from sklearn.linear_model import LogisticRegression, PoissonRegressor
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.multioutput import MultiOutputRegressor
 from xgboost import XGBClassifier, XGBRegressor
 
-from sklearn.metrics import make_scorer, f1_score, accuracy_score, log_loss
+from sklearn.metrics import make_scorer, f1_score, accuracy_score, log_loss, get_scorer
 import optuna
 from optuna.samplers import TPESampler
 
@@ -26,6 +40,121 @@ def _make_cv_reg(n_splits=5, random_state=42):
     return KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
 
 
+def _resolve_cv(cv_splits, make_cv):
+    """Cross validation splitter from a number of folds (shuffled splitter built by make_cv) or from a splitter (e.g. WalkForwardSplit)"""
+    return make_cv(n_splits=cv_splits) if isinstance(cv_splits, int) else cv_splits
+
+
+class WalkForwardSplit:
+    """
+    Time-aware cross validation splitter: matches are tested in chronological order, each test block being scored by a model trained on the
+    matches played before it only, so that no future match leaks into a training fold and the scores show how a model ages over a season
+
+    - refit='season': one fold per test season
+    - refit='matchday': one fold per block of matchdays_per_fold matchdays (dates) of the test seasons, i.e. a refit before each matchday
+      with matchdays_per_fold=1 (many folds: a few hundred per season)
+    - window='expanding': all the matches played before the test block are used for training
+    - window='sliding': only the matches of the train_seasons previous seasons (and of the test season before the test block)
+
+    The first train_seasons seasons are only used for training. Folds are computed once, at creation, from the dates and seasons of the rows
+    of the data to split (same order), and are deterministic: the cached preprocessing of a fold (cf FoldPreprocessingCache) is reused by
+    all the searches run on the same data
+    """
+    def __init__(self, dates, seasons, window='expanding', refit='season', train_seasons=3, test_seasons=None, matchdays_per_fold=1):
+        """
+        Args:
+            - dates, seasons: date and season of each row of the data to split
+            - window: 'expanding' or 'sliding'
+            - refit: 'season' or 'matchday'
+            - train_seasons: number of seasons before the first test season (and length of the sliding window)
+            - test_seasons: number of (last) seasons tested, all the seasons after the first train_seasons ones if None
+            - matchdays_per_fold: number of matchdays of a test block with refit='matchday'
+        """
+        if window not in ('expanding', 'sliding'):
+            raise ValueError(f"Unknown window: {window}, expected 'expanding' or 'sliding'")
+        if refit not in ('season', 'matchday'):
+            raise ValueError(f"Unknown refit: {refit}, expected 'season' or 'matchday'")
+        if train_seasons < 1 or matchdays_per_fold < 1:
+            raise ValueError("train_seasons and matchdays_per_fold must be at least 1")
+
+        self.dates = pd.to_datetime(np.asarray(dates)).to_numpy()
+        self.seasons = np.asarray(seasons).astype(str)
+        self.window = window
+        self.refit = refit
+        self.train_seasons = train_seasons
+        self.test_seasons = test_seasons
+        self.matchdays_per_fold = matchdays_per_fold
+        self.folds = self._make_folds()
+
+
+    def _make_folds(self) -> list:
+        order = np.argsort(self.dates, kind='stable')
+        chronological_seasons = pd.unique(self.seasons[order])
+        season_rank = pd.Series(np.arange(len(chronological_seasons)), index=chronological_seasons)[self.seasons].to_numpy()
+
+        test_ranks = range(self.train_seasons, len(chronological_seasons))
+        if self.test_seasons is not None:
+            test_ranks = test_ranks[max(len(test_ranks) - self.test_seasons, 0):]
+
+        folds = []
+        for rank in test_ranks:
+            in_season = np.flatnonzero(season_rank == rank)
+            if self.refit == 'season':
+                blocks = [in_season]
+            else:
+                days = np.unique(self.dates[in_season])
+                blocks = [in_season[np.isin(self.dates[in_season], days[i:i + self.matchdays_per_fold])]
+                          for i in range(0, len(days), self.matchdays_per_fold)]
+            for test in blocks:
+                train = self.dates < self.dates[test].min()
+                if self.window == 'sliding':
+                    train &= season_rank >= rank - self.train_seasons
+                folds.append((np.flatnonzero(train), test))
+        return folds
+
+
+    def split(self, X=None, y=None, groups=None):
+        if X is not None and len(X) != len(self.dates):
+            raise ValueError(f"X has {len(X)} rows, the splitter was built with {len(self.dates)} dates")
+        yield from self.folds
+
+
+    def get_n_splits(self, X=None, y=None, groups=None) -> int:
+        return len(self.folds)
+
+
+def _prefix_grid(param_grid):
+    """Prefixes the keys of a param grid with the name of the estimator step ('clf__'), unless already done"""
+    new_grid = {}
+    for key, value in param_grid.items():
+        if not key.startswith('clf'):
+            new_grid[f"clf__{key}"] = value
+        else:
+            new_grid[key] = value
+    return new_grid
+
+
+def _with_fold_cache(X, y, pipeline, param_grid, cache_dir):
+    """
+    Data and pipeline to give to a scikit-learn search so that the preprocessing steps are read from the FoldPreprocessingCache of the process
+    (cf _CachedPreprocessing): X with a RangeIndex (a DataFrame), and pipeline with its preprocessing steps wrapped in a single step
+    Returns X and pipeline unchanged if cache_dir is None or if the grid tunes other parameters than the ones of the final step
+    """
+    final_name = pipeline.steps[-1][0]
+    if cache_dir is None or not all(param.startswith(f"{final_name}__") for param in param_grid):
+        return X, pipeline
+    data_key = joblib.hash([X, y])
+    X = X.reset_index(drop=True) if isinstance(X, pd.DataFrame) else pd.DataFrame(X)
+    return X, Pipeline([('pre', _CachedPreprocessing(pipeline[:-1], data_key, cache_dir)), pipeline.steps[-1]])
+
+
+def _without_fold_cache(model):
+    """Fitted pipeline of a search run with _with_fold_cache, with the fitted preprocessing steps in place of the cached step"""
+    if not isinstance(model.steps[0][1], _CachedPreprocessing):
+        return model
+    return Pipeline(list(model.steps[0][1].pre_.steps) + [model.steps[-1]])
+
+
 def _save_model(model, path):
     os.makedirs(os.path.dirname(path), exist_ok=True)
     joblib.dump(model, path)
@@ -33,77 +162,625 @@ def _save_model(model, path):
 
 
 # GridSearch implementations
-def run_grid_search(X, y, param_grid, preprocessing_pipeline, scoring='f1_macro', cv=None, n_jobs=-1, verbose=2):
-    """Grid Search according to a param grid and a preprocessing pipeline."""
+def run_grid_search(X, y, param_grid, preprocessing_pipeline, scoring='f1_macro', cv=None, n_jobs=-1, verbose=2, cache_dir=None):
+    """Grid Search according to a param grid and a preprocessing pipeline (cv: shuffled stratified folds by default, or any splitter such as WalkForwardSplit).
+    With cache_dir, the transformed feature matrices of each fold are materialised once in cache_dir and reused by all the candidates and by the
+    other searches run on the same data and folds (cf FoldPreprocessingCache)."""
     if cv is None:
         cv = _make_cv()
 
-    new_grid = {}
-    for key, value in param_grid.items():
-        if not key.startswith('clf'):
-            new_grid[f"clf__{key}"] = value
-        else:
-            new_grid[key] = value
+    new_grid = _prefix_grid(param_grid)
+    X_search, pipeline = _with_fold_cache(X, y, preprocessing_pipeline, new_grid, cache_dir)
 
-    gs = GridSearchCV(preprocessing_pipeline, new_grid, scoring=scoring, cv=cv, n_jobs=n_jobs, verbose=verbose)
-    gs.fit(X, y)
+    gs = GridSearchCV(pipeline, new_grid, scoring=scoring, cv=cv, n_jobs=n_jobs, verbose=verbose)
+    gs.fit(X_search, y)
+    gs.best_estimator_ = _without_fold_cache(gs.best_estimator_) # saved model independent of the cache
     print("Best params:", gs.best_params_, f"best {scoring}:", gs.best_score_)
     return gs    
 
 
-def run_primary_modeling(X, y, param_grid_lr, param_grid_rf, param_grid_xgb, preprocessing_pipeline_lr, preprocessing_pipeline_rf, preprocessing_pipeline_xgb, outdir, scoring='f1_macro', cv_splits=5, n_jobs=-1):
-                        
-    cv = _make_cv(n_splits=cv_splits)
+def run_halving_search(X, y, param_grid, preprocessing_pipeline, scoring='f1_macro', cv=None, n_jobs=-1, verbose=0, resource='auto', factor=3, cache_dir=None):
+    """
+    Successive halving alternative to run_grid_search, returning the fitted HalvingGridSearchCV (same attributes as the GridSearchCV of run_grid_search)
+    All the candidates are first evaluated with a small resource, and only the best 1/factor of them go on to the next iteration, with a
+    resource multiplied by factor
+
+    Args:
+        - X, y, param_grid, preprocessing_pipeline, scoring, cv, n_jobs, verbose, cache_dir: as in run_grid_search
+        - resource: 'clf__n_estimators' (number of trees), 'n_samples' (number of training samples) or 'auto': n_estimators if the grid tunes
+          it, n_samples otherwise. With n_estimators, the values of the grid only set the range of the resource: the last iteration uses the
+          largest value, and the previous ones the largest value divided by powers of factor (not below the smallest value)
+        - factor: proportion of candidates kept at each iteration (1/factor) and growth of the resource
+
+    Returns:
+        The fitted HalvingGridSearchCV (best_estimator_, best_params_, best_score_, cv_results_)
+    """
+    if cv is None:
+        cv = _make_cv()
+
+    new_grid = _prefix_grid(param_grid)
+    if resource == 'auto':
+        resource = 'clf__n_estimators' if 'clf__n_estimators' in new_grid else 'n_samples'
+
+    if resource == 'n_samples':
+        min_resources, max_resources = 'exhaust', 'auto'
+    else:
+        # The last iteration uses the largest value: number of iterations limited by the range of values and by the number of candidates
+        values = new_grid.pop(resource)
+        max_resources = max(values)
+        nb_candidates = len(ParameterGrid(new_grid))
+        nb_iterations = 1 + int(np.floor(min(np.log(max_resources / min(values)), np.log(nb_candidates)) / np.log(factor) + 1e-9))
+        min_resources = max(1, int(max_resources // factor ** (nb_iterations - 1)))
+
+    X_search, pipeline = _with_fold_cache(X, y, preprocessing_pipeline, new_grid, cache_dir) # resource: parameter of the final step or n_samples
+    hs = HalvingGridSearchCV(pipeline, new_grid, factor=factor, resource=resource,
+                             min_resources=min_resources, max_resources=max_resources, scoring=scoring, cv=cv, n_jobs=n_jobs,
+                             verbose=verbose, random_state=42)
+    hs.fit(X_search, y)
+    hs.best_estimator_ = _without_fold_cache(hs.best_estimator_) # saved model independent of the cache
+    print("Best params:", hs.best_params_, f"best {scoring}:", hs.best_score_)
+    return hs
+
+
+class SearchTask:
+    """
+    Hyperparameter search to run with run_searches: one grid of candidates evaluated on the folds of a cross validation, the best candidate
+    being refitted on the whole data and saved
+    """
+    def __init__(self, name, X, y, param_grid, pipeline, scoring, cv, path):
+        """
+        Args:
+            - name: name of the search, unique among the searches run together (key of the returned results)
+            - X, y: training data
+            - param_grid: hyperparameter grid (keys without the 'clf__' prefix are prefixed, as in run_grid_search)
+            - pipeline: pipeline to tune
+            - scoring: scikit-learn scoring name
+            - cv: cross validation splitter (splits computed once, at creation)
+            - path: file where the refitted best pipeline is saved (not saved if None)
+        """
+        self.name = name
+        self.X = X
+        self.y = y
+        self.param_grid = _prefix_grid(param_grid)
+        self.pipeline = pipeline
+        self.scoring = scoring
+        self.folds = list(cv.split(X, y))
+        self.path = path
+        self.candidates = list(ParameterGrid(self.param_grid))
+
+
+    def fingerprint(self) -> str:
+        """
+        Hash of everything a fold score depends on besides the candidate: data, pipeline, scoring and folds
+        """
+        return joblib.hash([self.X, self.y, self.pipeline, self.scoring, self.folds])
+
+
+    def data_fingerprint(self) -> str:
+        """
+        Hash of the data, shared by the searches run on the same data: key of their transformed folds in FoldPreprocessingCache (with the
+        positions of the folds and the parameters of the preprocessing steps)
+        """
+        return joblib.hash([self.X, self.y])
+
+
+class SearchCheckpoint:
+    """
+    Per-fold scores of a search, appended to a JSON lines file as soon as they are computed
+    A search interrupted (or extended with new candidates) and run again only evaluates the (candidate, fold) couples missing from the file
+    Failed fits (nan score, e.g. after a transient error) are only kept in memory, so that a search run again fits them again
+    """
+    def __init__(self, path=None):
+        """
+        Args:
+            - path: JSON lines file of the checkpoint (scores only kept in memory if None)
+        """
+        self.path = path
+        self._scores = {} # (candidate key, fold) -> (score, fit time)
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                content = f.read()
+            if content and not content.endswith('\n'): # last line truncated: next records start on a new line
+                with open(path, 'a') as f:
+                    f.write('\n')
+            for line in content.splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError: # line truncated by an interruption
+                    continue
+                if record['score'] is not None and not np.isnan(record['score']): # failed fits written by a previous version fitted again
+                    self._scores[(record['params'], record['fold'])] = (record['score'], record['fit_time'])
+
+
+    def get(self, key, fold):
+        return self._scores.get((key, fold))
+
+
+    def add(self, key, fold, score, fit_time):
+        self._scores[(key, fold)] = (score, fit_time)
+        if self.path is not None and not np.isnan(score):
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'params': key, 'fold': fold, 'score': score, 'fit_time': fit_time}) + '\n')
+
+
+class SearchResult:
+    """
+    Outcome of a search run by run_searches or run_optuna_search, with the attributes of a fitted GridSearchCV: best_estimator_, best_params_, best_score_,
+    best_index_ and cv_results_
+    """
+    def __init__(self, candidates, scores, fit_times, best_estimator):
+        """
+        Args:
+            - candidates: list of the evaluated hyperparameter dictionaries
+            - scores, fit_times: arrays of shape (number of candidates, number of folds)
+            - best_estimator: best pipeline, refitted on the whole data
+        """
+        means = scores.mean(axis=1)
+        ranks = rankdata(-np.where(np.isnan(means), -np.inf, means), method='min').astype(np.int32) # failed candidates ranked last
+
+        self.cv_results_ = {'params': candidates, 'mean_test_score': means, 'std_test_score': scores.std(axis=1), 'rank_test_score': ranks,
+                            'mean_fit_time': fit_times.mean(axis=1)}
+        for fold in range(scores.shape[1]):
+            self.cv_results_[f'split{fold}_test_score'] = scores[:, fold]
+        for name in candidates[0]:
+            self.cv_results_[f'param_{name}'] = [candidate[name] for candidate in candidates]
+
+        self.best_index_ = int(ranks.argmin())
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = means[self.best_index_]
+        self.best_estimator_ = best_estimator
+
+
+# Searches of the current worker process (set once by the pool initializer, so that data is not sent with each task)
+_worker_tasks = {}
+
+
+def _init_search_worker(tasks):
+    _worker_tasks.clear()
+    _worker_tasks.update({task.name: task for task in tasks})
+
+
+class FoldPreprocessingCache:
+    """
+    Preprocessing steps of a pipeline (all the steps but the final one) fitted once per fold and shared by all the candidates of a search,
+    which only differ by the parameters of the final step ('clf__'), and by all the searches run on the same data
+
+    Fitted steps and transformed folds are kept on disk with a cache directory (one joblib file per entry), and in memory for the last
+    max_entries used ones only (least recently used ones dropped, then read again from disk if any), so that a search over many folds (e.g.
+    WalkForwardSplit with refit='matchday') does not hold all their dense matrices. They are keyed by
+    a fingerprint of the data (computed once per search, the data is not hashed again at each fit), the train (and test) positions and the
+    parameters of the preprocessing steps, columns included: a change of data, folds, columns or intermediate steps invalidates them
+    """
+    def __init__(self, cache_dir=None, max_entries=32):
+        """
+        Args:
+            - cache_dir: folder of the on-disk cache (memory only if None)
+            - max_entries: maximum number of entries kept in memory
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+
+    def _entry(self, key, compute):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        path = None if self.cache_dir is None else os.path.join(self.cache_dir, f"{key}.joblib")
+        value = None
+        if path is not None and os.path.exists(path):
+            try:
+                value = joblib.load(path)
+            except Exception: # unreadable file (e.g. truncated, or written with other library versions): computed again
+                value = None
+        if value is None:
+            value = compute()
+            if path is not None:
+                # Written to a temporary file then renamed, so that the processes sharing the folder never read a partial file
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                joblib.dump(value, tmp_path)
+                os.replace(tmp_path, path)
+        self._entries[key] = value
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+
+    def fit(self, pre, data_key, train, get_train):
+        """
+        Returns the preprocessing steps pre fitted on the train positions and the transformed train matrix
+        get_train: function returning the (X, y) train data, only called if the entry is not cached
+        """
+        def compute():
+            fitted = clone(pre)
+            return fitted, fitted.fit_transform(*get_train())
+        return self._entry(joblib.hash([data_key, train, pre]), compute)
+
+
+    def transform(self, pre, data_key, train, test, fitted, get_test):
+        """
+        Returns the test matrix transformed by fitted, the preprocessing steps pre fitted on the train positions
+        get_test: function returning the X test data, only called if the entry is not cached
+        """
+        return self._entry(joblib.hash([data_key, train, test, pre]), lambda: fitted.transform(get_test()))
+
+
+    def get(self, pipeline, data_key, X, y, train, test):
+        """
+        Returns the (train, test) matrices of a fold transformed by the preprocessing steps of pipeline fitted on the train positions
+        """
+        pre = pipeline[:-1]
+        fitted, Xt_train = self.fit(pre, data_key, train, lambda: (_safe_indexing(X, train), _safe_indexing(y, train)))
+        return Xt_train, self.transform(pre, data_key, train, test, fitted, lambda: _safe_indexing(X, test))
+
+
+# Fitted preprocessing steps and transformed folds of the current process, by cache directory
+_fold_caches = {}
+
+
+def _fold_cache(cache_dir=None) -> FoldPreprocessingCache:
+    if cache_dir not in _fold_caches:
+        _fold_caches[cache_dir] = FoldPreprocessingCache(cache_dir)
+    return _fold_caches[cache_dir]
+
+
+class _CachedPreprocessing(BaseEstimator, TransformerMixin):
+    """
+    Preprocessing steps of a pipeline read from the FoldPreprocessingCache of the process, as first step of the pipelines of run_grid_search
+    and run_halving_search (cf _with_fold_cache). Rows are identified by their positions in the searched data (labels of its RangeIndex),
+    so that the data is hashed once per search and not at each fit
+    """
+    def __init__(self, pre=None, data_key=None, cache_dir=None):
+        self.pre = pre
+        self.data_key = data_key
+        self.cache_dir = cache_dir
+
+
+    def fit(self, X, y=None):
+        self.fit_transform(X, y)
+        return self
+
+
+    def fit_transform(self, X, y=None):
+        self.train_ = X.index.to_numpy()
+        self.pre_, Xt = _fold_cache(self.cache_dir).fit(self.pre, self.data_key, self.train_, lambda: (X, y))
+        return Xt
+
+
+    def transform(self, X):
+        return _fold_cache(self.cache_dir).transform(self.pre, self.data_key, self.train_, X.index.to_numpy(), self.pre_, lambda: X)
+
+
+def _fit_and_score(pipeline, params, X, y, train, test, scoring, name, fold_cache=None, data_key=None):
+    """
+    Fits a clone of pipeline with params on the train positions and scores it on the test positions
+    With a FoldPreprocessingCache and params of the final step only, only the final step is fitted, on the cached output of the other steps
+    Returns (score, fit time), the score being nan (with a FitFailedWarning) if the fit fails, as in GridSearchCV
+    """
+    final_name = pipeline.steps[-1][0]
+    use_cache = fold_cache is not None and all(param.startswith(f"{final_name}__") for param in params)
+    start = time.perf_counter()
+    try:
+        if use_cache:
+            Xt_train, Xt_test = fold_cache.get(pipeline, data_key, X, y, train, test)
+            estimator = clone(pipeline.steps[-1][1]).set_params(**{param[len(final_name) + 2:]: value for param, value in params.items()})
+            estimator.fit(Xt_train, _safe_indexing(y, train))
+            score = float(get_scorer(scoring)(estimator, Xt_test, _safe_indexing(y, test)))
+        else:
+            estimator = clone(pipeline).set_params(**params)
+            estimator.fit(_safe_indexing(X, train), _safe_indexing(y, train))
+            score = float(get_scorer(scoring)(estimator, _safe_indexing(X, test), _safe_indexing(y, test)))
+    except Exception as e:
+        warnings.warn(f"{name}: fit failed for {params}, score set to nan ({e!r})", FitFailedWarning)
+        score = np.nan
+    return score, time.perf_counter() - start
+
+
+def _run_search_unit(name, params, fold):
+    """
+    Fits a candidate of a search on a fold and returns its (score, fit time), or on the whole data (fold None) and returns the pipeline
+    """
+    task = _worker_tasks[name]
+    if fold is None:
+        return clone(task.pipeline).set_params(**params).fit(task.X, task.y)
+
+    train, test = task.folds[fold]
+    return _fit_and_score(task.pipeline, params, task.X, task.y, train, test, task.scoring, f"{name} (fold {fold})",
+                          fold_cache=_fold_cache(task.cache_dir), data_key=task.data_key)
+
+
+def run_searches(tasks, n_jobs=-1, checkpoint_dir=None, cache_dir=None):
+    """
+    Runs several hyperparameter searches at the same time in a bounded pool of processes
+    The (candidate, fold) fits of all the searches are interleaved in the pool; once all the folds of a search are scored, its best candidate
+    (best mean score, first one in case of tie as GridSearchCV) is refitted on the whole data and saved to the path of the search
+
+    Args:
+        - tasks: list of SearchTask
+        - n_jobs: number of worker processes (-1: all the cores)
+        - checkpoint_dir: folder of the per-fold checkpoints, one JSON lines file per search and fingerprint (cf SearchCheckpoint); an
+          interrupted run started again resumes where it stopped. No checkpoint if None
+        - cache_dir: folder where the preprocessing fitted on each fold is cached on disk (cf FoldPreprocessingCache); in any case, each
+          worker fits the preprocessing of a fold once and shares it between the candidates
+
+    Returns:
+        A dictionary {search name: SearchResult}, in the order of tasks
+    """
+    names = [task.name for task in tasks]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Search names must be unique: {names}")
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    tasks = {task.name: task for task in tasks}
+    keys, checkpoints, units = {}, {}, {}
+    for name, task in tasks.items():
+        keys[name] = [json.dumps(candidate, sort_keys=True, default=str) for candidate in task.candidates]
+        task.data_key = task.data_fingerprint() # transformed folds shared with the other searches on the same data
+        task.cache_dir = cache_dir
+        path = None if checkpoint_dir is None else os.path.join(checkpoint_dir, f"{name}-{task.fingerprint()[:16]}.jsonl")
+        checkpoints[name] = SearchCheckpoint(path)
+        units[name] = [(name, i, fold) for i in range(len(task.candidates)) for fold in range(len(task.folds))
+                       if checkpoints[name].get(keys[name][i], fold) is None]
+        nb_fits = len(task.candidates) * len(task.folds)
+        print(f"{name}: {len(task.candidates)} candidates x {len(task.folds)} folds, {nb_fits - len(units[name])} fits restored from checkpoint")
+
+    # Fits of the searches interleaved, so that all the searches progress together
+    queue = deque(unit for group in zip_longest(*units.values()) for unit in group if unit is not None)
+    remaining = {name: len(units[name]) for name in tasks}
+    refits = deque(name for name in tasks if remaining[name] == 0)
     results = {}
-    # Logistic regression
-    results['logistic'] = run_grid_search(X, y, param_grid_lr, preprocessing_pipeline_lr, scoring=scoring, cv=cv, n_jobs=n_jobs)
-    _save_model(results['logistic'].best_estimator_, os.path.join('..', outdir, 'logistic.joblib'))
 
-    # Random forest
-    results['rf'] = run_grid_search(X, y, param_grid_rf, preprocessing_pipeline_rf, scoring=scoring, cv=cv, n_jobs=n_jobs)
-    _save_model(results['rf'].best_estimator_, os.path.join('..', outdir, 'rf.joblib'))
+    def scores_of(name):
+        task = tasks[name]
+        values = np.array([[checkpoints[name].get(key, fold) for fold in range(len(task.folds))] for key in keys[name]], dtype=np.float64)
+        return values[:, :, 0], values[:, :, 1]
 
-    # XGBoost
-    results['xgb'] = run_grid_search(X, y, param_grid_xgb, preprocessing_pipeline_xgb, scoring=scoring, cv=cv, n_jobs=n_jobs)
-    _save_model(results['xgb'].best_estimator_, os.path.join('..', outdir, 'xgb.joblib'))
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_search_worker, initargs=(list(tasks.values()),)) as executor:
+        pending = {}
 
-    return results
+        def fill():
+            while len(pending) < 2 * n_jobs and (refits or queue):
+                if refits:
+                    name = refits.popleft()
+                    scores, _ = scores_of(name)
+                    best = SearchResult(tasks[name].candidates, scores, np.zeros_like(scores), None).best_index_
+                    pending[executor.submit(_run_search_unit, name, tasks[name].candidates[best], None)] = (name, best, None)
+                else:
+                    name, i, fold = queue.popleft()
+                    pending[executor.submit(_run_search_unit, name, tasks[name].candidates[i], fold)] = (name, i, fold)
 
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, i, fold = pending.pop(future)
+                if fold is None:
+                    scores, fit_times = scores_of(name)
+                    results[name] = SearchResult(tasks[name].candidates, scores, fit_times, future.result())
+                    print(f"{name} - Best params:", results[name].best_params_, f"best {tasks[name].scoring}:", results[name].best_score_)
+                    if tasks[name].path is not None:
+                        _save_model(results[name].best_estimator_, tasks[name].path)
+                else:
+                    score, fit_time = future.result()
+                    checkpoints[name].add(keys[name][i], fold, score, fit_time)
+                    remaining[name] -= 1
+                    if remaining[name] == 0:
+                        refits.append(name)
+            fill()
 
-def run_secondary_modeling(X_home, y_home, X_away, y_away, param_grid_poisson, param_grid_rf, param_grid_xgb, preprocessing_pipeline_poisson_home, preprocessing_pipeline_poisson_away, preprocessing_pipeline_rf_home, preprocessing_pipeline_rf_away, preprocessing_pipeline_xgb_home, preprocessing_pipeline_xgb_away, outdir, scoring='neg_mean_absolute_error', cv_splits=5, n_jobs=-1):
-    
-    cv = _make_cv_reg(n_splits=cv_splits)
+    return {name: results[name] for name in tasks}
+
+
+def run_optuna_search(X, y, param_grid, preprocessing_pipeline, scoring='f1_macro', cv=None, n_trials=50, timeout=None, random_state=42, verbose=1, cache_dir=None):
+    """
+    Adaptive alternative to run_grid_search, driven by Optuna (TPE sampler), with the same return contract (best_estimator_, best_params_,
+    best_score_, cv_results_)
+
+    The search space is the one of the grid: each hyperparameter is sampled among the values of its grid. The folds of a trial are fitted one
+    after another and the running mean score is reported after each of them, so that a trial below the median of the previous trials at the
+    same fold is pruned (remaining folds not fitted). A combination already evaluated is not fitted again
+
+    Args:
+        - X, y, param_grid, preprocessing_pipeline, scoring, cv: as in run_grid_search
+        - n_trials: maximum number of trials
+        - timeout: maximum duration of the search, in seconds (no limit if None)
+        - random_state: seed of the sampler
+        - verbose: 0 to hide the Optuna log of each trial
+        - cache_dir: folder where the preprocessing fitted on each fold is cached on disk (cf FoldPreprocessingCache); in any case, the
+          preprocessing of a fold is fitted once and shared between the trials
+
+    Returns:
+        A SearchResult over the trials (scores of the folds not fitted by a pruned trial are nan, such trials being ranked last)
+    """
+    if cv is None:
+        cv = _make_cv()
+    grid = _prefix_grid(param_grid)
+    folds = list(cv.split(X, y))
+    fold_cache = _fold_cache(cache_dir)
+    data_key = joblib.hash([X, y])
+    evaluated = {} # candidate key -> fold scores of a complete trial
+
+    def objective(trial):
+        params = {name: trial.suggest_categorical(name, values) for name, values in grid.items()}
+        key = json.dumps(params, sort_keys=True, default=str)
+        if key in evaluated:
+            trial.set_user_attr('scores', evaluated[key])
+            return float(np.mean(evaluated[key]))
+
+        scores, fit_times = [], []
+        for fold, (train, test) in enumerate(folds):
+            score, fit_time = _fit_and_score(preprocessing_pipeline, params, X, y, train, test, scoring, f"trial {trial.number}",
+                                             fold_cache=fold_cache, data_key=data_key)
+            scores.append(score)
+            fit_times.append(fit_time)
+            # Stored after each fold (storages other than the in-memory one serialize the values when they are set)
+            trial.set_user_attr('scores', scores)
+            trial.set_user_attr('fit_times', fit_times)
+            trial.report(float(np.mean(scores)), fold)
+            if np.isnan(score) or trial.should_prune():
+                raise optuna.TrialPruned()
+        evaluated[key] = scores
+        return float(np.mean(scores))
+
+    verbosity = optuna.logging.get_verbosity()
+    if verbose == 0:
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+    try:
+        study = optuna.create_study(direction='maximize', sampler=TPESampler(seed=random_state),
+                                    pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=1))
+        study.optimize(objective, n_trials=n_trials, timeout=timeout)
+    finally:
+        optuna.logging.set_verbosity(verbosity)
+
+    trials = [trial for trial in study.trials if 'scores' in trial.user_attrs]
+    if not trials:
+        raise ValueError("No trial has been evaluated: increase n_trials or timeout")
+    candidates = [trial.params for trial in trials]
+    scores = np.full((len(trials), len(folds)), np.nan)
+    fit_times = np.zeros((len(trials), len(folds)))
+    for i, trial in enumerate(trials):
+        scores[i, :len(trial.user_attrs['scores'])] = trial.user_attrs['scores']
+        trial_fit_times = trial.user_attrs.get('fit_times', [])
+        fit_times[i, :len(trial_fit_times)] = trial_fit_times
+
+    result = SearchResult(candidates, scores, fit_times, None)
+    result.best_estimator_ = clone(preprocessing_pipeline).set_params(**result.best_params_).fit(X, y)
+    result.study_ = study
+    nb_fits = sum(len(trial.user_attrs.get('fit_times', [])) for trial in trials)
+    print(f"{len(study.trials)} trials ({sum(trial.state == optuna.trial.TrialState.PRUNED for trial in study.trials)} pruned), {nb_fits} fits")
+    print("Best params:", result.best_params_, f"best {scoring}:", result.best_score_)
+    return result
+
+
+def primary_search_tasks(X, y, param_grid_lr, param_grid_rf, param_grid_xgb, preprocessing_pipeline_lr, preprocessing_pipeline_rf, preprocessing_pipeline_xgb, outdir, scoring='f1_macro', cv_splits=5):
+    """
+    Searches of the primary models (logistic regression, random forest, XGBoost), to run with run_searches
+    cv_splits is a number of shuffled folds or a cross validation splitter (e.g. WalkForwardSplit), as in the run_*_modeling functions
+    """
+    cv = _resolve_cv(cv_splits, _make_cv)
+    return [
+        SearchTask('logistic', X, y, param_grid_lr, preprocessing_pipeline_lr, scoring, cv, os.path.join('..', outdir, 'logistic.joblib')),
+        SearchTask('rf', X, y, param_grid_rf, preprocessing_pipeline_rf, scoring, cv, os.path.join('..', outdir, 'rf.joblib')),
+        SearchTask('xgb', X, y, param_grid_xgb, preprocessing_pipeline_xgb, scoring, cv, os.path.join('..', outdir, 'xgb.joblib'))
+    ]
+
+
+def secondary_search_tasks(X_home, y_home, X_away, y_away, param_grid_poisson, param_grid_rf, param_grid_xgb, preprocessing_pipeline_poisson_home, preprocessing_pipeline_poisson_away, preprocessing_pipeline_rf_home, preprocessing_pipeline_rf_away, preprocessing_pipeline_xgb_home, preprocessing_pipeline_xgb_away, outdir, scoring='neg_mean_absolute_error', cv_splits=5):
+    """
+    Searches of the secondary models (Poisson regression, random forest, XGBoost, for home and away goals), to run with run_searches
+    """
+    cv = _resolve_cv(cv_splits, _make_cv_reg)
+    return [
+        SearchTask('home_poisson', X_home, y_home, param_grid_poisson, preprocessing_pipeline_poisson_home, scoring, cv, os.path.join('..', outdir, 'home_poisson.joblib')),
+        SearchTask('away_poisson', X_away, y_away, param_grid_poisson, preprocessing_pipeline_poisson_away, scoring, cv, os.path.join('..', outdir, 'away_poisson.joblib')),
+        SearchTask('home_rf', X_home, y_home, param_grid_rf, preprocessing_pipeline_rf_home, scoring, cv, os.path.join('..', outdir, 'home_rf.joblib')),
+        SearchTask('away_rf', X_away, y_away, param_grid_rf, preprocessing_pipeline_rf_away, scoring, cv, os.path.join('..', outdir, 'away_rf.joblib')),
+        SearchTask('home_xgb', X_home, y_home, param_grid_xgb, preprocessing_pipeline_xgb_home, scoring, cv, os.path.join('..', outdir, 'home_xgb.joblib')),
+        SearchTask('away_xgb', X_away, y_away, param_grid_xgb, preprocessing_pipeline_xgb_away, scoring, cv, os.path.join('..', outdir, 'away_xgb.joblib'))
+    ]
+
+
+def joint_regressor(regressor):
+    """
+    Returns a regressor predicting the home and away numbers of goals in a single fit and a single predict call: random forest and XGBoost
+    are natively multi-output (one forest, one booster with one tree per target at each round), other regressors (Poisson regression) are
+    stacked in a MultiOutputRegressor (one clone per target)
+    """
+    if isinstance(regressor, (RandomForestRegressor, XGBRegressor)):
+        return regressor
+    return MultiOutputRegressor(regressor)
+
+
+def _joint_grid(param_grid, pipeline):
+    """Param grid of a joint secondary pipeline: parameters of a stacked regressor are those of its base estimator ('clf__estimator__')"""
+    new_grid = _prefix_grid(param_grid)
+    if isinstance(pipeline.named_steps['clf'], MultiOutputRegressor):
+        new_grid = {key if key.startswith('clf__estimator__') else f"clf__estimator__{key[len('clf__'):]}": value for key, value in new_grid.items()}
+    return new_grid
+
+
+def joint_secondary_search_tasks(X, y, param_grid_poisson, param_grid_rf, param_grid_xgb, preprocessing_pipeline_poisson, preprocessing_pipeline_rf, preprocessing_pipeline_xgb, outdir, scoring='neg_mean_absolute_error', cv_splits=5):
+    """
+    Searches of the joint secondary models (one model per algorithm predicting both numbers of goals), to run with run_searches
+    X gathers the features of both teams, y has two columns (home goals, away goals) and the final step of each pipeline is a
+    joint_regressor; the scoring is averaged over the two targets
+    """
+    cv = _resolve_cv(cv_splits, _make_cv_reg)
+    return [
+        SearchTask('joint_poisson', X, y, _joint_grid(param_grid_poisson, preprocessing_pipeline_poisson), preprocessing_pipeline_poisson, scoring, cv, os.path.join('..', outdir, 'joint_poisson.joblib')),
+        SearchTask('joint_rf', X, y, _joint_grid(param_grid_rf, preprocessing_pipeline_rf), preprocessing_pipeline_rf, scoring, cv, os.path.join('..', outdir, 'joint_rf.joblib')),
+        SearchTask('joint_xgb', X, y, _joint_grid(param_grid_xgb, preprocessing_pipeline_xgb), preprocessing_pipeline_xgb, scoring, cv, os.path.join('..', outdir, 'joint_xgb.joblib'))
+    ]
+
+
+def run_halving_searches(tasks, n_jobs=-1, cache_dir=None):
+    """
+    Runs searches one after another in successive halving mode (cf run_halving_search), each one using n_jobs processes, and saves the
+    best pipeline of each search to its path
+
+    Returns:
+        A dictionary {search name: fitted HalvingGridSearchCV}, in the order of tasks
+    """
     results = {}
-    # Poisson regression
-    # Home
-    results['home_poisson'] = run_grid_search(X_home, y_home, param_grid_poisson, preprocessing_pipeline_poisson_home, scoring=scoring, cv=cv, n_jobs=n_jobs)
-    _save_model(results['home_poisson'].best_estimator_, os.path.join('..', outdir, 'home_poisson.joblib'))
-
-    # Away
-    results['away_poisson'] = run_grid_search(X_away, y_away, param_grid_poisson, preprocessing_pipeline_poisson_away, scoring=scoring, cv=cv, n_jobs=n_jobs)
-    _save_model(results['away_poisson'].best_estimator_, os.path.join('..', outdir, 'away_poisson.joblib'))
-    
-    # Random forest
-    # Home
-    results['home_rf'] = run_grid_search(X_home, y_home, param_grid_rf, preprocessing_pipeline_rf_home, scoring=scoring, cv=cv, n_jobs=n_jobs)
-    _save_model(results['home_rf'].best_estimator_, os.path.join('..', outdir, 'home_rf.joblib'))
-
-    # Away
-    results['away_rf'] = run_grid_search(X_away, y_away, param_grid_rf, preprocessing_pipeline_rf_away, scoring=scoring, cv=cv, n_jobs=n_jobs)
-    _save_model(results['away_rf'].best_estimator_, os.path.join('..', outdir, 'away_rf.joblib'))
-    
-    # XGBoost
-    # Home
-    results['home_xgb'] = run_grid_search(X_home, y_home, param_grid_xgb, preprocessing_pipeline_xgb_home, scoring=scoring, cv=cv, n_jobs=n_jobs)
-    _save_model(results['home_xgb'].best_estimator_, os.path.join('..', outdir, 'home_xgb.joblib'))
-
-    # Away
-    results['away_xgb'] = run_grid_search(X_away, y_away, param_grid_xgb, preprocessing_pipeline_xgb_away, scoring=scoring, cv=cv, n_jobs=n_jobs)
-    _save_model(results['away_xgb'].best_estimator_, os.path.join('..', outdir, 'away_xgb.joblib'))
-    
+    for task in tasks:
+        print(f"{task.name}: successive halving over {len(task.candidates)} candidates")
+        results[task.name] = run_halving_search(task.X, task.y, task.param_grid, task.pipeline, scoring=task.scoring, cv=task.folds, n_jobs=n_jobs,
+                                                cache_dir=cache_dir)
+        _save_model(results[task.name].best_estimator_, task.path)
     return results
 
 
+def _run_tasks(tasks, search_mode, n_jobs, checkpoint_dir, cache_dir):
+    if search_mode == 'grid':
+        return run_searches(tasks, n_jobs=n_jobs, checkpoint_dir=checkpoint_dir, cache_dir=cache_dir)
+    if search_mode == 'halving':
+        return run_halving_searches(tasks, n_jobs=n_jobs, cache_dir=cache_dir)
+    raise ValueError(f"Unknown search mode: {search_mode}, expected 'grid' or 'halving'")
+
+
+def run_primary_modeling(X, y, param_grid_lr, param_grid_rf, param_grid_xgb, preprocessing_pipeline_lr, preprocessing_pipeline_rf, preprocessing_pipeline_xgb, outdir, scoring='f1_macro', cv_splits=5, n_jobs=-1, checkpoint_dir=None, cache_dir=None, search_mode='grid'):
+    """
+    Runs the searches of the three primary models and saves the best pipelines to outdir
+    - search_mode='grid': exhaustive searches run at the same time (cf run_searches)
+    - search_mode='halving': successive halving searches, with the number of trees as resource for random forest and XGBoost and the number
+      of samples for logistic regression (cf run_halving_searches, no checkpoint)
+
+    Returns:
+        A dictionary {search name: result}. In grid mode, results are SearchResult objects instead of the fitted GridSearchCV of the
+        sequential searches: they have the same best_estimator_, best_params_, best_score_, best_index_ and cv_results_ attributes but no
+        predict methods (use best_estimator_), and the best parameters are printed prefixed by the search name. In halving mode, results are
+        the fitted HalvingGridSearchCV
+    """
+    tasks = primary_search_tasks(X, y, param_grid_lr, param_grid_rf, param_grid_xgb, preprocessing_pipeline_lr, preprocessing_pipeline_rf, preprocessing_pipeline_xgb, outdir, scoring=scoring, cv_splits=cv_splits)
+    return _run_tasks(tasks, search_mode, n_jobs, checkpoint_dir, cache_dir)
+
+
+def run_secondary_modeling(X_home, y_home, X_away, y_away, param_grid_poisson, param_grid_rf, param_grid_xgb, preprocessing_pipeline_poisson_home, preprocessing_pipeline_poisson_away, preprocessing_pipeline_rf_home, preprocessing_pipeline_rf_away, preprocessing_pipeline_xgb_home, preprocessing_pipeline_xgb_away, outdir, scoring='neg_mean_absolute_error', cv_splits=5, n_jobs=-1, checkpoint_dir=None, cache_dir=None, search_mode='grid'):
+    """
+    Runs the searches of the six secondary models and saves the best pipelines to outdir
+    - search_mode='grid': exhaustive searches run at the same time (cf run_searches)
+    - search_mode='halving': successive halving searches, with the number of trees as resource for random forest and XGBoost and the number
+      of samples for Poisson regression (cf run_halving_searches, no checkpoint)
+    Returns the results of the searches, as run_primary_modeling
+    """
+    tasks = secondary_search_tasks(X_home, y_home, X_away, y_away, param_grid_poisson, param_grid_rf, param_grid_xgb, preprocessing_pipeline_poisson_home, preprocessing_pipeline_poisson_away, preprocessing_pipeline_rf_home, preprocessing_pipeline_rf_away, preprocessing_pipeline_xgb_home, preprocessing_pipeline_xgb_away, outdir, scoring=scoring, cv_splits=cv_splits)
+    return _run_tasks(tasks, search_mode, n_jobs, checkpoint_dir, cache_dir)
+
+
+def run_joint_secondary_modeling(X, y, param_grid_poisson, param_grid_rf, param_grid_xgb, preprocessing_pipeline_poisson, preprocessing_pipeline_rf, preprocessing_pipeline_xgb, outdir, scoring='neg_mean_absolute_error', cv_splits=5, n_jobs=-1, checkpoint_dir=None, cache_dir=None, search_mode='grid'):
+    """
+    Joint alternative to run_secondary_modeling: runs the searches of the three joint secondary models (cf joint_secondary_search_tasks),
+    i.e. three searches instead of six, and saves the best pipelines to outdir (joint_poisson.joblib, joint_rf.joblib, joint_xgb.joblib)
+    Returns the results of the searches, as run_primary_modeling
+    """
+    tasks = joint_secondary_search_tasks(X, y, param_grid_poisson, param_grid_rf, param_grid_xgb, preprocessing_pipeline_poisson, preprocessing_pipeline_rf, preprocessing_pipeline_xgb, outdir, scoring=scoring, cv_splits=cv_splits)
+    return _run_tasks(tasks, search_mode, n_jobs, checkpoint_dir, cache_dir)
+
+
 def load_model(path):
     """
     Loads a joblib file
@@ -115,6 +792,65 @@ def load_model(path):
     return model
 
 
+class ModelRegistry:
+    """
+    Registry of loaded models, shared by all the callers of a process
+
+    Models are loaded lazily with load_model on first access, and kept in memory until:
+    - the model file is modified (its mtime differs from the one at loading time): the model is reloaded
+    - more than max_models models are resident: the least recently used one is dropped
+    """
+    def __init__(self, max_models=6):
+        """
+        Args:
+            - max_models: maximum number of models kept in memory
+        """
+        self.max_models = max_models
+        self._models = OrderedDict() # path -> (mtime, model), least recently used first
+        self._lock = threading.Lock()
+
+
+    def get(self, path):
+        """
+        Returns the model stored in path, loaded from disk only if it is not resident or if the file has changed
+        """
+        path = os.path.abspath(path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model file not found: {path}")
+        mtime = os.path.getmtime(path)
+
+        with self._lock:
+            cached = self._models.get(path)
+            if cached is not None and cached[0] == mtime:
+                self._models.move_to_end(path)
+                return cached[1]
+
+            model = load_model(path)
+            self._models[path] = (mtime, model)
+            self._models.move_to_end(path)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return model
+
+
+    def clear(self):
+        """
+        Drops all the resident models
+        """
+        with self._lock:
+            self._models.clear()
+
+
+_model_registry = ModelRegistry()
+
+
+def get_model(path):
+    """
+    Returns the model stored in path from the registry of the process (cf ModelRegistry)
+    """
+    return _model_registry.get(path)
+
+
 def evaluate_model_metrics(model, X_test, y_test, plot_confusion=False):
     """
     Evaluates a model and returns main classification metrics
@@ -144,11 +880,15 @@ def evaluate_model_metrics(model, X_test, y_test, plot_confusion=False):
     return metrics
 
 
-def evaluate_regression_model(model, X_test, y_test):
+def evaluate_regression_model(model, X_test, y_test, output=None):
     """
     Evaluates a regression model and returns MAE, RMSE, MSE, R2.
+    For a multi-output model, output is the index of the evaluated target (all the targets averaged if None)
     """
     y_pred = model.predict(X_test)
+    if output is not None:
+        y_pred = np.asarray(y_pred)[:, output]
+        y_test = np.asarray(y_test)[:, output]
 
     metrics = {
         "MAE": mean_absolute_error(y_test, y_pred),
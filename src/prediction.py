@@ -0,0 +1,229 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+from src.config import load_config
+from src.engines import FeatureState
+from src.preprocessing import IndicatorColumns, build_feature_state
+from src.feature_engineering import create_diff_features
+from src.storage import load_dataframe, base_columns
+
+
+# Patterns used to pair home and away columns for the primary models (same as in the modeling notebook)
+DIFF_PATTERNS = [
+    ("_home_team_ranking_at_home", "_away_team_ranking_away"),
+    ("_home_team_at_home", "_away_team_away"),
+    ("_home_team", "_away_team"),
+    ("_at_home", "_away"),
+    ("_home", "_away")
+]
+
+# Model files of each available model, relative to config['primary_models_dir'] / config['secondary_models_dir']
+PRIMARY_MODEL_FILES = {
+    'LogisticRegression': 'logistic.joblib',
+    'RandomForest': 'rf.joblib',
+    'XGBoost': 'xgb.joblib'
+}
+SECONDARY_MODEL_FILES = {
+    'Poisson': ('home_poisson.joblib', 'away_poisson.joblib'),
+    'RandomForest': ('home_rf.joblib', 'away_rf.joblib'),
+    'XGBoost': ('home_xgb.joblib', 'away_xgb.joblib')
+}
+# Joint secondary models predicting both numbers of goals (used instead of SECONDARY_MODEL_FILES when config['joint_secondary_models'])
+JOINT_SECONDARY_MODEL_FILES = {
+    'Poisson': 'joint_poisson.joblib',
+    'RandomForest': 'joint_rf.joblib',
+    'XGBoost': 'joint_xgb.joblib'
+}
+
+# Config keys of the columns describing a fixture
+FIXTURE_KEYS = ['season_column', 'home_column', 'away_column', 'odd_home_column', 'odd_draw_column', 'odd_away_column']
+
+
+def load_feature_state(path, preprocessed_df, config) -> FeatureState:
+    """
+    Loads the running state of the indicators persisted during preprocessing, or builds it from the preprocessed dataframe if it has not been
+    persisted or if it does not match the dataframe or the config (different number of matches, last date or window lengths)
+    """
+    if os.path.exists(path):
+        state = FeatureState.load(path)
+        same_matches = state.nb_matches == len(preprocessed_df) and (state.nb_matches == 0 or
+                                                                    pd.Timestamp(state.last_date) == pd.to_datetime(preprocessed_df[config['date_column']]).max())
+        same_windows = ((state.abs_max_matches, state.rel_max_matches, state.strict_rel_max_matches) ==
+                        (config['abs_max_matches'], config['rel_max_matches'], config['strict_rel_max_matches']))
+        if same_matches and same_windows:
+            return state
+    return build_feature_state(preprocessed_df, config)
+
+
+def build_input_rows(state, fixtures, config) -> pd.DataFrame:
+    """
+    Builds the input rows ready for prediction of a batch of fixtures
+    All the indicators are computed by the same engine and assigned to the same columns as in the preprocessing (FeatureState.query and
+    IndicatorColumns.assign_indicators), as if the fixtures were played on the matchday following the last registered one
+
+    Args:
+        state: FeatureState of the registered matches (read only)
+        fixtures: dataframe (or dictionary of columns) with one row per fixture and the season, home, away and odds columns of config
+        config: project configuration
+
+    Returns:
+        pd.DataFrame: one input row per fixture, in the order of fixtures
+    """
+    rows = pd.DataFrame({config[key]: np.asarray(fixtures[config[key]]) for key in FIXTURE_KEYS})
+    rows[config['season_column']] = rows[config['season_column']].astype(str)
+    features = state.query(rows)
+
+    # Indicators assigned to a dictionary of columns, turned into a dataframe at once
+    columns = IndicatorColumns(config).assign_indicators({col: rows[col].to_numpy() for col in rows.columns}, features)
+    return pd.DataFrame(columns)
+
+
+def _expected_features(model) -> list:
+    """
+    Columns expected by a fitted pipeline whose 'pre' step is a ColumnTransformer with numerical then categorical transformers
+    """
+    pre = model.named_steps["pre"]
+    num_cols = pre.transformers_[0][2]
+    cat_cols = pre.transformers_[1][2]
+    return cat_cols + num_cols
+
+
+def predict_result_probabilities(model, input_rows) -> np.ndarray:
+    """
+    Predicts the final result probabilities of a batch of input rows with a single predict_proba call
+
+    Args:
+        model: fitted primary pipeline (labels encoded in alphabetical order: away, draw, home)
+        input_rows: input rows, already processed with create_diff_features
+
+    Returns:
+        np.ndarray: matrix with one row per input row and the home, draw and away probabilities as columns
+    """
+    output = model.predict_proba(input_rows[_expected_features(model)])
+    return output[:, [2, 1, 0]].astype(np.float64)
+
+
+def secondary_model_paths(secondary_model, config, models_root='.') -> list:
+    """
+    Paths of the secondary models of secondary_model: the joint model if config['joint_secondary_models'], the home and away models otherwise
+    """
+    if secondary_model not in SECONDARY_MODEL_FILES:
+        raise ValueError(f"Unknown secondary model: {secondary_model}, expected one of {list(SECONDARY_MODEL_FILES)}")
+    files = [JOINT_SECONDARY_MODEL_FILES[secondary_model]] if config['joint_secondary_models'] else SECONDARY_MODEL_FILES[secondary_model]
+    return [os.path.join(models_root, config['secondary_models_dir'], file) for file in files]
+
+
+def predict_expected_goals(models, input_rows, probabilities) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Predicts the expected number of goals of the home and away teams of a batch of input rows with a single predict call per model
+
+    Args:
+        models: fitted secondary pipelines, either (home model, away model) or (joint model,) predicting both numbers of goals
+        input_rows: input rows, not processed with create_diff_features (read only)
+        probabilities: output of predict_result_probabilities for the same rows
+    """
+    input_rows = input_rows.assign(proba_home=probabilities[:, 0], proba_draw=probabilities[:, 1], proba_away=probabilities[:, 2])
+    if len(models) == 1:
+        goals = np.asarray(models[0].predict(input_rows[_expected_features(models[0])]), dtype=np.float64)
+        return goals[:, 0], goals[:, 1]
+
+    home_model, away_model = models
+    home_goals = home_model.predict(input_rows[_expected_features(home_model)])
+    away_goals = away_model.predict(input_rows[_expected_features(away_model)])
+    return np.asarray(home_goals, dtype=np.float64), np.asarray(away_goals, dtype=np.float64)
+
+
+def predict_fixtures(state, fixtures, primary_model, secondary_model, config, models_root='.', load=None) -> pd.DataFrame:
+    """
+    Predicts the final result probabilities and the expected goals of a batch of fixtures
+    Input rows are built together, create_diff_features is applied once on the batch and each model is called once on the full matrix
+
+    Args:
+        state: FeatureState of the registered matches (read only)
+        fixtures: dataframe with one row per fixture and the season, home, away and odds columns of config
+        primary_model: key of PRIMARY_MODEL_FILES
+        secondary_model: key of SECONDARY_MODEL_FILES (joint model or home and away models, cf secondary_model_paths)
+        config: project configuration
+        models_root: directory to which config['primary_models_dir'] and config['secondary_models_dir'] are relative
+        load: function loading a model from its path (src.modeling.get_model by default)
+
+    Returns:
+        pd.DataFrame: fixtures with the columns proba_home, proba_draw, proba_away, expected_goals_home, expected_goals_away and
+        predicted_result
+    """
+    if primary_model not in PRIMARY_MODEL_FILES:
+        raise ValueError(f"Unknown primary model: {primary_model}, expected one of {list(PRIMARY_MODEL_FILES)}")
+    if load is None:
+        from src.modeling import get_model
+        load = get_model
+
+    secondary_paths = secondary_model_paths(secondary_model, config, models_root)
+    primary = load(os.path.join(models_root, config['primary_models_dir'], PRIMARY_MODEL_FILES[primary_model]))
+    secondary = [load(path) for path in secondary_paths]
+
+    input_rows = build_input_rows(state, fixtures, config)
+    probabilities = predict_result_probabilities(primary, create_diff_features(input_rows, patterns=DIFF_PATTERNS))
+    home_goals, away_goals = predict_expected_goals(secondary, input_rows, probabilities)
+
+    predictions = input_rows[[config[key] for key in FIXTURE_KEYS]].copy()
+    predictions['proba_home'] = probabilities[:, 0]
+    predictions['proba_draw'] = probabilities[:, 1]
+    predictions['proba_away'] = probabilities[:, 2]
+    predictions['expected_goals_home'] = home_goals
+    predictions['expected_goals_away'] = away_goals
+    predictions['predicted_result'] = np.array(['home', 'draw', 'away'])[probabilities.argmax(axis=1)]
+    return predictions
+
+
+def save_predictions(predictions, path):
+    """
+    Saves predictions to path, as Parquet if the extension is .parquet, as CSV otherwise
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith('.parquet'):
+        predictions.to_parquet(path, index=False)
+    else:
+        predictions.to_csv(path, index=False)
+    print(f"Predictions saved to {path}")
+
+
+def load_preprocessed_data(config, root='.', columns=None) -> pd.DataFrame:
+    """
+    Loads the preprocessed train and test dataframes of config (columnar files preferred to csv files), concatenated and sorted by date
+    """
+    paths = [os.path.join(root, config['preprocessed_dir'], config[name]) for name in ('preprocessed_train_df_name', 'preprocessed_test_df_name')]
+    df = pd.concat([load_dataframe(path, config['date_column'], columns) for path in paths])
+    return df.sort_values(config['date_column'], kind='stable').reset_index(drop=True)
+
+
+def main(argv=None):
+    """
+    Command line entry point, run from the repository root:
+    python -m src.prediction --fixtures fixtures.csv --output predictions.parquet --primary-model RandomForest --secondary-model Poisson
+    """
+    parser = argparse.ArgumentParser(description="Predicts the final result probabilities and the expected goals of a CSV of fixtures")
+    parser.add_argument('--fixtures', required=True, help="CSV file with the season, home, away and odds columns of the config")
+    parser.add_argument('--output', required=True, help="output file (.parquet for Parquet, CSV otherwise)")
+    parser.add_argument('--primary-model', default='LogisticRegression', choices=list(PRIMARY_MODEL_FILES))
+    parser.add_argument('--secondary-model', default='Poisson', choices=list(SECONDARY_MODEL_FILES))
+    parser.add_argument('--config', default='config.yaml', help="path of the config file")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    root = os.path.dirname(os.path.abspath(args.config))
+    df = load_preprocessed_data(config, root, base_columns(config))
+
+    state = load_feature_state(os.path.join(root, config['preprocessed_dir'], config['preprocessing_state_name'] + '.joblib'), df, config)
+
+    fixtures = pd.read_csv(args.fixtures)
+    predictions = predict_fixtures(state, fixtures, args.primary_model, args.secondary_model, config, models_root=root)
+    save_predictions(predictions, args.output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,181 @@
+import os
+import numpy as np
 import pandas as pd
-from src.utils import compute_team_stats, ranking_club, compute_home_away_stats, home_ranking_club, away_ranking_club, attack_ranking_club, defense_ranking_club
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.engines import SeasonTable, current_season_features, recent_form_features, historical_form_features, HeadToHeadStore, club_seasons_features, FeatureState, MatchdaySnapshots
+
+
+
+def _run_phase(df, config, method) -> pd.DataFrame:
+    """
+    Runs one phase of the preprocessing (computes_* method of Preprocessing) on df, in a worker process
+    """
+    return getattr(Preprocessing(df, config), method)()
         
 
-class Preprocessing:
+def build_feature_state(df, config) -> FeatureState:
+    """
+    Builds the running state of the indicators from the matches of df (e.g. a preprocessed dataframe), with the columns and window lengths of config
+    """
+    df = df.sort_values(by=config['date_column'], kind='stable').reset_index(drop=True) # order of a preprocessed dataframe kept
+    return FeatureState.from_history(df, config['date_column'], config['season_column'], config['home_column'], config['away_column'],
+                                     config['nb_goals_home_column'], config['nb_goals_away_column'], config['final_result_column'],
+                                     config['abs_max_matches'], config['rel_max_matches'], config['strict_rel_max_matches'])
+
+
+def build_matchday_snapshots(df, config) -> MatchdaySnapshots:
+    """
+    Builds the league tables of each season as of each matchday from the matches of df, with the columns of config
+    """
+    df = df.sort_values(by=config['date_column'], kind='stable').reset_index(drop=True)
+    return MatchdaySnapshots.from_matches(df, config['date_column'], config['season_column'], config['home_column'], config['away_column'],
+                                          config['nb_goals_home_column'], config['nb_goals_away_column'], config['final_result_column'])
+
+
+class IndicatorColumns:
+    """
+    Assignment of the indicators computed by src.engines (phases 2 to 7 of the preprocessing) to the columns named in the config file
+    Shared by the preprocessing and by the prediction of new matches, so that both produce the same columns
+    """
+
+    def __init__(self, config):
+        """
+        Args:
+            - config: dictionnary with the information specified in the config file
+        """
+        self.config = config
+
+
+    def _assign_current_season_indicators(self, df, home_stats, away_stats):
+        """
+        Adds the current season indicators to df, from the SeasonTable.FIELDS matrices of home and away teams
+        """
+        fields = {name: j for j, name in enumerate(SeasonTable.FIELDS)}
+        # Assignment
+        df[self.config['nb_points_home_team']] = home_stats[:, fields['points']]
+        df[self.config['nb_points_away_team']] = away_stats[:, fields['points']]
+        df[self.config['general_ranking_home_team']] = home_stats[:, fields['ranking']]
+        df[self.config['general_ranking_away_team']] = away_stats[:, fields['ranking']]
+        df[self.config['nb_goals_scored_home_team']] = home_stats[:, fields['goals_scored']]
+        df[self.config['nb_goals_scored_away_team']] = away_stats[:, fields['goals_scored']]
+        df[self.config['nb_goals_conceded_home_team']] = home_stats[:, fields['goals_conceded']]
+        df[self.config['nb_goals_conceded_away_team']] = away_stats[:, fields['goals_conceded']]
+        df[self.config['goal_difference_home_team']] = home_stats[:, fields['goal_diff']]
+        df[self.config['goal_difference_away_team']] = away_stats[:, fields['goal_diff']]
+        df[self.config['attack_ranking_home_team']] = home_stats[:, fields['attack_ranking']]
+        df[self.config['attack_ranking_away_team']] = away_stats[:, fields['attack_ranking']]
+        df[self.config['defense_ranking_home_team']] = home_stats[:, fields['defense_ranking']]
+        df[self.config['defense_ranking_away_team']] = away_stats[:, fields['defense_ranking']]
+        df[self.config['nb_points_home_team_at_home']] = home_stats[:, fields['home_points']]
+        df[self.config['nb_points_away_team_away']] = away_stats[:, fields['away_points']]
+        df[self.config['home_team_ranking_at_home']] = home_stats[:, fields['home_ranking']]
+        df[self.config['away_team_ranking_away']] = away_stats[:, fields['away_ranking']]
+        df[self.config['nb_goals_scored_home_team_at_home']] = home_stats[:, fields['home_goals_scored']]
+        df[self.config['nb_goals_scored_away_team_away']] = away_stats[:, fields['away_goals_scored']]
+        df[self.config['nb_goals_conceded_home_team_at_home']] = home_stats[:, fields['home_goals_conceded']]
+        df[self.config['nb_goals_conceded_away_team_away']] = away_stats[:, fields['away_goals_conceded']]
+        return df
+
+
+    def _assign_absolute_recent_form_indicators(self, df, home_form, away_form):
+        """
+        Adds the absolute recent form indicators to df, from the dictionaries of arrays of home and away teams
+        """
+        # Assignment
+        df[self.config['abs_recent_nb_points_by_match_home_team']] = home_form['points_by_match']
+        df[self.config['abs_recent_nb_points_by_match_away_team']] = away_form['points_by_match']
+        df[self.config['abs_recent_nb_goals_scored_by_match_home_team']] = home_form['goals_scored_by_match']
+        df[self.config['abs_recent_nb_goals_scored_by_match_away_team']] = away_form['goals_scored_by_match']
+        df[self.config['abs_recent_nb_goals_conceded_by_match_home_team']] = home_form['goals_conceded_by_match']
+        df[self.config['abs_recent_nb_goals_conceded_by_match_away_team']] = away_form['goals_conceded_by_match']
+        df[self.config['abs_recent_goal_difference_home_team']] = home_form['goal_diff']
+        df[self.config['abs_recent_goal_difference_away_team']] = away_form['goal_diff']
+        df[self.config['abs_recent_ranking_home_team']] = home_form['ranking']
+        df[self.config['abs_recent_ranking_away_team']] = away_form['ranking']
+        return df
+
+
+    def _assign_absolute_historical_form_indicators(self, df, home_hist, away_hist):
+        """
+        Adds the absolute historical form indicators to df, from the dictionaries of arrays of home and away teams
+        """
+        # Assignment
+        df[self.config['abs_hist_nb_points_by_season_home_team']] = home_hist['points']
+        df[self.config['abs_hist_nb_points_by_season_away_team']] = away_hist['points']
+        df[self.config['abs_hist_nb_goals_scored_by_season_home_team']] = home_hist['goals_scored']
+        df[self.config['abs_hist_nb_goals_scored_by_season_away_team']] = away_hist['goals_scored']
+        df[self.config['abs_hist_nb_goals_conceded_by_season_home_team']] = home_hist['goals_conceded']
+        df[self.config['abs_hist_nb_goals_conceded_by_season_away_team']] = away_hist['goals_conceded']
+        df[self.config['abs_hist_ranking_by_season_home_team']] = home_hist['ranking']
+        df[self.config['abs_hist_ranking_by_season_away_team']] = away_hist['ranking']
+        return df
+
+
+    def _assign_relative_recent_form_indicators(self, df, home_form, away_form):
+        """
+        Adds the relative recent form indicators to df, from the dictionaries of arrays of home and away teams
+        """
+        # Assignment
+        df[self.config['rel_recent_nb_points_by_match_home_team']] = home_form['points_by_match']
+        df[self.config['rel_recent_nb_points_by_match_away_team']] = away_form['points_by_match']
+        df[self.config['rel_recent_nb_goals_scored_by_match_home_team']] = home_form['goals_scored_by_match']
+        df[self.config['rel_recent_nb_goals_scored_by_match_away_team']] = away_form['goals_scored_by_match']
+        df[self.config['rel_recent_nb_goals_conceded_by_match_home_team']] = home_form['goals_conceded_by_match']
+        df[self.config['rel_recent_nb_goals_conceded_by_match_away_team']] = away_form['goals_conceded_by_match']
+        df[self.config['rel_recent_goal_difference_home_team']] = home_form['goal_diff']
+        df[self.config['rel_recent_goal_difference_away_team']] = away_form['goal_diff']
+        df[self.config['rel_percentage_victory_home_team']] = home_form['percentage_victory']
+        df[self.config['rel_percentage_victory_away_team']] = away_form['percentage_victory']
+        return df
+
+
+    def _assign_strict_relative_recent_form_indicators(self, df, home_form, away_form):
+        """
+        Adds the strict relative recent form indicators to df, from the dictionaries of arrays of home and away teams
+        """
+        # Assignment
+        df[self.config['strict_rel_recent_nb_points_by_match_home_team']] = home_form['points_by_match']
+        df[self.config['strict_rel_recent_nb_points_by_match_away_team']] = away_form['points_by_match']
+        df[self.config['strict_rel_recent_nb_goals_scored_by_match_home_team']] = home_form['goals_scored_by_match']
+        df[self.config['strict_rel_recent_nb_goals_scored_by_match_away_team']] = away_form['goals_scored_by_match']
+        df[self.config['strict_rel_recent_nb_goals_conceded_by_match_home_team']] = home_form['goals_conceded_by_match']
+        df[self.config['strict_rel_recent_nb_goals_conceded_by_match_away_team']] = away_form['goals_conceded_by_match']
+        df[self.config['strict_rel_recent_goal_difference_home_team']] = home_form['goal_diff']
+        df[self.config['strict_rel_recent_goal_difference_away_team']] = away_form['goal_diff']
+        df[self.config['strict_rel_percentage_victory_home_team']] = home_form['percentage_victory']
+        df[self.config['strict_rel_percentage_victory_away_team']] = away_form['percentage_victory']
+        return df
+
+
+    def _assign_ext_factors(self, df, home_ext, away_ext):
+        """
+        Adds the external factors to df, from the dictionaries of arrays of home and away teams
+        """
+        # Number of seasons before the current one
+        df[self.config['hist_nb_seasons_l1_home_team']] = home_ext['nb_past_seasons']
+        df[self.config['hist_nb_seasons_l1_away_team']] = away_ext['nb_past_seasons']
+
+        # Promoted or not? A promoted club is a club playing in Ligue 1 a season N while not having played in Ligue 1 at season N-1
+        df[self.config['promoted_home_team']] = home_ext['promoted']
+        df[self.config['promoted_away_team']] = away_ext['promoted']
+        return df
+
+
+    def assign_indicators(self, df, features) -> pd.DataFrame:
+        """
+        Adds all the indicators to df (dataframe or dictionary of columns), from the output of FeatureState.features, FeatureState.query or
+        FeatureState.process on the matches of df
+        """
+        df = self._assign_current_season_indicators(df, *features['current_season'])
+        df = self._assign_absolute_recent_form_indicators(df, *features['absolute_recent'])
+        df = self._assign_absolute_historical_form_indicators(df, *features['absolute_historical'])
+        df = self._assign_relative_recent_form_indicators(df, *features['relative_recent'])
+        df = self._assign_strict_relative_recent_form_indicators(df, *features['strict_relative_recent'])
+        df = self._assign_ext_factors(df, *features['ext_factors'])
+        return df
+
+
+class Preprocessing(IndicatorColumns):
     """
     Class which manages the preprocessing of a cleaned dataframe
 
@@ -61,82 +234,32 @@ class Preprocessing:
             raise ValueError(f"There must be the same number of home, away and draw odds columns. There are currently {len(self.home_odds_columns)} home odds columns, {len(self.away_odds_columns)} away odds columns and {len(self.draw_odds_columns)} draw odds columns")
 
 
-    def _compute_team_stats(self, df):
-        return compute_team_stats(df, self.config['home_column'], self.config['away_column'], self.config['final_result_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'])
-
-
-    def _nb_points(self, df, club):
+    def _compact_dtypes(self, df) -> pd.DataFrame:
         """
-        Returns the total number of points won by 'club' in the matches of df
+        Converts the columns of df to compact types: categories for teams, seasons and final results, int8 for goals, float32 for betting odds
+        and int16 for integer indicators (points, goals, rankings, number of seasons...). Averaged indicators are kept as float64
         """
-        stats = self._compute_team_stats(df)
-        row = stats.loc[stats['team'] == club]
-        if not row.empty:
-            return int(row['points'].values[0])
-        else:
-            return -1
+        categorical_cols = [self.config['season_column'], self.config['home_column'], self.config['away_column'], self.config['final_result_column']]
+        goals_cols = [self.config['nb_goals_home_column'], self.config['nb_goals_away_column']]
+        odds_cols = [c for c in [self.config['odd_home_column'], self.config['odd_away_column'], self.config['odd_draw_column']] + self.odds_columns if c in df.columns]
+        base_cols = [self.config['date_column']] + categorical_cols + goals_cols + odds_cols
 
+        dtypes = {c: 'category' for c in categorical_cols}
+        dtypes.update({c: np.int8 for c in goals_cols})
+        dtypes.update({c: np.float32 for c in odds_cols})
+        dtypes.update({c: np.int16 for c in df.columns if c not in base_cols and pd.api.types.is_integer_dtype(df[c])})
 
-    def _goals_scored(self, df, club):
-        """
-        Returns the total number of goals scored by 'club' in the matches of df
-        """
-        stats = self._compute_team_stats(df)
-        row = stats.loc[stats['team'] == club]
-        if not row.empty:
-            return int(row['goals_scored'].values[0])
-        else:
-            return -1
-
-
-    def _goals_conceded(self, df, club):
-        """
-        Returns the total number of goals conceded by 'club' in the matches of df
-        """
-        stats = self._compute_team_stats(df)
-        row = stats.loc[stats['team'] == club]
-        if not row.empty:
-            return int(row['goals_conceded'].values[0])
-        else:
-            return -1
+        return df.astype({c: dtype for c, dtype in dtypes.items() if df[c].dtype != dtype})
 
 
-    def _goal_diff(self, df, club):
+    def memory_footprint(self, df=None) -> float:
         """
-        Returns the goal difference of 'club' in the matches of df
+        Returns the memory used by df (self.df by default), in MB
         """
-        stats = self._compute_team_stats(df)
-        row = stats.loc[stats['team'] == club]
-        if not row.empty:
-            return int(row['goal_diff'].values[0])
-        else:
-            return -1
-
-
-    def _ranking_club(self, df, club):
-        return ranking_club(df, club, self.config['home_column'], self.config['away_column'], self.config['final_result_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'])
-
-
-    def _compute_home_away_stats(self, df, home=True):
-        return compute_home_away_stats(df, home, self.config['home_column'], self.config['away_column'], self.config['final_result_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'])
-
-
-    def _home_ranking_club(self, df, club):
-        return home_ranking_club(df, club, self.config['home_column'], self.config['away_column'], self.config['final_result_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'])
+        df = self.df if df is None else df
+        return df.memory_usage(deep=True).sum() / 1024**2
 
 
-    def _away_ranking_club(self, df, club):
-        return away_ranking_club(df, club, self.config['home_column'], self.config['away_column'], self.config['final_result_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'])
-
-
-    def _attack_ranking_club(self, df, club):
-        return attack_ranking_club(df, club, self.config['home_column'], self.config['away_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'])
-
-
-    def _defense_ranking_club(self, df, club):
-        return defense_ranking_club(df, club, self.config['home_column'], self.config['away_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'])
-        
-    
     def creation_betting_odd_variable(self) -> pd.DataFrame:
         """
         Creates a betting odd variable by averaging all the betting odds given by the columns in input
@@ -182,107 +305,10 @@ class Preprocessing:
         df = self.df.copy()
         df = df.sort_values(by=self.config['date_column']).reset_index(drop=True)
 
-        # Initialization
-        indicators = [self.config['nb_points_home_team'],
-                      self.config['nb_points_away_team'],
-                      self.config['general_ranking_home_team'],
-                      self.config['general_ranking_away_team'],
-                      self.config['nb_goals_scored_home_team'],
-                      self.config['nb_goals_scored_away_team'],
-                      self.config['nb_goals_conceded_home_team'],
-                      self.config['nb_goals_conceded_away_team'],
-                      self.config['goal_difference_home_team'],
-                      self.config['goal_difference_away_team'],
-                      self.config['attack_ranking_home_team'],
-                      self.config['attack_ranking_away_team'],
-                      self.config['defense_ranking_home_team'],
-                      self.config['defense_ranking_away_team'],
-                      self.config['nb_points_home_team_at_home'],
-                      self.config['nb_points_away_team_away'],
-                      self.config['home_team_ranking_at_home'],
-                      self.config['away_team_ranking_away'],
-                      self.config['nb_goals_scored_home_team_at_home'],
-                      self.config['nb_goals_scored_away_team_away'],
-                      self.config['nb_goals_conceded_home_team_at_home'],
-                      self.config['nb_goals_conceded_away_team_away']]
-        
-        for col in indicators:
-            df[col] = None
+        # Chronological pass: league tables of each season are updated once per matchday and snapshotted before kickoff
+        home_stats, away_stats = current_season_features(df, self.config['date_column'], self.config['season_column'], self.config['home_column'], self.config['away_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'], self.config['final_result_column'])
 
-        # Season loop
-        for season, season_df in df.groupby(self.config['season_column'], sort=False):
-            
-            for i, row in season_df.iterrows():
-                past_matches = season_df.loc[season_df[self.config['date_column']] < row[self.config['date_column']]]
-
-                # Clubs involving in the match
-                home, away = row[self.config['home_column']], row[self.config['away_column']]
-                
-                # Points, goals, goal difference
-                home_points = self._nb_points(past_matches, home)
-                away_points = self._nb_points(past_matches, away)
-
-                home_goals_for = self._goals_scored(past_matches, home)
-                away_goals_for = self._goals_scored(past_matches, away)
-
-                home_goals_against = self._goals_conceded(past_matches, home)
-                away_goals_against = self._goals_conceded(past_matches, away)
-
-                home_diff = self._goal_diff(past_matches, home)
-                away_diff = self._goal_diff(past_matches, away)
-            
-                # Rankings
-                home_rank = self._ranking_club(past_matches, home)
-                away_rank = self._ranking_club(past_matches, away)
-
-                home_rank_at_home = self._home_ranking_club(past_matches, home)
-                away_rank_away = self._away_ranking_club(past_matches, away)
-
-                home_attack_rank = self._attack_ranking_club(past_matches, home)
-                home_defense_rank = self._defense_ranking_club(past_matches, home)
-
-                away_attack_rank = self._attack_ranking_club(past_matches, away)
-                away_defense_rank = self._defense_ranking_club(past_matches, away)
-
-
-                # Home / Away specific indicators
-                past_matches_home = past_matches[past_matches[self.config['home_column']] == home]
-                past_matches_away = past_matches[past_matches[self.config['away_column']] == away]
-
-                home_points_at_home = self._nb_points(past_matches_home, home)
-                away_points_away = self._nb_points(past_matches_away, away)
-
-                home_goals_at_home = self._goals_scored(past_matches_home, home)
-                away_goals_away = self._goals_scored(past_matches_away, away)
-                
-                home_goals_conceded_at_home = self._goals_conceded(past_matches_home, home)
-                away_goals_conceded_away = self._goals_conceded(past_matches_away, away)
-                
-                # Assignment
-                df.at[i, self.config['nb_points_home_team']] = home_points
-                df.at[i, self.config['nb_points_away_team']] = away_points
-                df.at[i, self.config['general_ranking_home_team']] = home_rank
-                df.at[i, self.config['general_ranking_away_team']] = away_rank
-                df.at[i, self.config['nb_goals_scored_home_team']] = home_goals_for
-                df.at[i, self.config['nb_goals_scored_away_team']] = away_goals_for
-                df.at[i, self.config['nb_goals_conceded_home_team']] = home_goals_against
-                df.at[i, self.config['nb_goals_conceded_away_team']] = away_goals_against
-                df.at[i, self.config['goal_difference_home_team']] = home_diff
-                df.at[i, self.config['goal_difference_away_team']] = away_diff
-                df.at[i, self.config['attack_ranking_home_team']] = home_attack_rank
-                df.at[i, self.config['attack_ranking_away_team']] = away_attack_rank
-                df.at[i, self.config['defense_ranking_home_team']] = home_defense_rank
-                df.at[i, self.config['defense_ranking_away_team']] = away_defense_rank
-                df.at[i, self.config['nb_points_home_team_at_home']] = home_points_at_home
-                df.at[i, self.config['nb_points_away_team_away']] = away_points_away
-                df.at[i, self.config['home_team_ranking_at_home']] = home_rank_at_home
-                df.at[i, self.config['away_team_ranking_away']] = away_rank_away
-                df.at[i, self.config['nb_goals_scored_home_team_at_home']] = home_goals_at_home
-                df.at[i, self.config['nb_goals_scored_away_team_away']] = away_goals_away
-                df.at[i, self.config['nb_goals_conceded_home_team_at_home']] = home_goals_conceded_at_home
-                df.at[i, self.config['nb_goals_conceded_away_team_away']] = away_goals_conceded_away
-        
-        return df
+        return self._assign_current_season_indicators(df, home_stats, away_stats)
 
     
     def computes_absolute_recent_form_indicators(self, max_matches: int=None):
@@ -296,7 +322,7 @@ class Preprocessing:
         - goals scored averaged by match
         - goals conceded averaged by match
         - goal difference on last matches
-        - ranking based on last matches
+        - ranking based on last matches (ties broken by order of the first match of the clubs in the season, cf src.engines.tie_order)
         """
         df = self.df.copy()
         df = df.sort_values(by=self.config['date_column']).reset_index(drop=True)
@@ -304,81 +330,10 @@ class Preprocessing:
         if max_matches is None:
             max_matches = self.config['abs_max_matches']
 
-        # Initialization
-        indicators = [self.config['abs_recent_nb_points_by_match_home_team'],
-                      self.config['abs_recent_nb_points_by_match_away_team'],
-                      self.config['abs_recent_nb_goals_scored_by_match_home_team'],
-                      self.config['abs_recent_nb_goals_scored_by_match_away_team'],
-                      self.config['abs_recent_nb_goals_conceded_by_match_home_team'],
-                      self.config['abs_recent_nb_goals_conceded_by_match_away_team'],
-                      self.config['abs_recent_goal_difference_home_team'],
-                      self.config['abs_recent_goal_difference_away_team'],
-                      self.config['abs_recent_ranking_home_team'],
-                      self.config['abs_recent_ranking_away_team']]
-
-        for col in indicators:
-            df[col] = None
-
-        # Season loop
-        for season, season_df in df.groupby(self.config['season_column'], sort=False):
-            
-            for i, row in season_df.iterrows():
-                current_date = row[self.config['date_column']]
-                home_team = row[self.config['home_column']]
-                away_team = row[self.config['away_column']]
-                
-                # Filtrating on the last matches of home and away teams
-                past_home_matches = season_df[(season_df[self.config['date_column']] < current_date) &
-                                              ((season_df[self.config['home_column']] == home_team) | (season_df[self.config['away_column']] == home_team))]
-                past_home_matches = past_home_matches.tail(max_matches)
-                
-                past_away_matches = season_df[(season_df[self.config['date_column']] < current_date) &
-                                              ((season_df[self.config['home_column']] == away_team) | (season_df[self.config['away_column']] == away_team))]
-                past_away_matches = past_away_matches.tail(max_matches)
-                
-                # Number of points
-                avg_home_points = self._nb_points(past_home_matches, home_team) / len(past_home_matches) if len(past_home_matches) != 0 else -1
-                avg_away_points = self._nb_points(past_away_matches, away_team) / len(past_away_matches) if len(past_away_matches) != 0 else -1
-                
-                # Number of goals scored
-                avg_home_goals_scored = self._goals_scored(past_home_matches, home_team) / len(past_home_matches) if len(past_home_matches) != 0 else -1
-                avg_away_goals_scored = self._goals_scored(past_away_matches, away_team) / len(past_away_matches) if len(past_away_matches) != 0 else -1
-
-                # Number of goals conceded
-                avg_home_goals_conceded = self._goals_conceded(past_home_matches, home_team) / len(past_home_matches) if len(past_home_matches) != 0 else -1
-                avg_away_goals_conceded = self._goals_conceded(past_away_matches, away_team) / len(past_away_matches) if len(past_away_matches) != 0 else -1
-                
-                # Goal difference
-                home_goal_diff = self._goal_diff(past_home_matches, home_team)
-                away_goal_diff = self._goal_diff(past_away_matches, away_team)
-                
-                # Ranking
-                teams = pd.concat([season_df[self.config['home_column']], season_df[self.config['away_column']]]).unique()
-                ranking_table_df = pd.DataFrame({
-                    'team': teams,
-                    'points': [self._nb_points(season_df[(season_df[self.config['date_column']] < current_date) &
-                                                         ((season_df[self.config['home_column']] == t) | (season_df[self.config['away_column']] == t))].tail(max_matches), t) for t in teams],
-                    'goal_diff': [self._goal_diff(season_df[(season_df[self.config['date_column']] < current_date) &
-                                                            ((season_df[self.config['home_column']] == t) | (season_df[self.config['away_column']] == t))].tail(max_matches), t) for t in teams]
-                })
-                ranking_table_df = ranking_table_df.sort_values(by=['points', 'goal_diff'], ascending=False).reset_index(drop=True)
-
-                home_rank = ranking_table_df[ranking_table_df['team'] == home_team].index[0] + 1
-                away_rank = ranking_table_df[ranking_table_df['team'] == away_team].index[0] + 1
-                
-                # Assignment
-                df.at[i, self.config['abs_recent_nb_points_by_match_home_team']] = avg_home_points
-                df.at[i, self.config['abs_recent_nb_points_by_match_away_team']] = avg_away_points
-                df.at[i, self.config['abs_recent_nb_goals_scored_by_match_home_team']] = avg_home_goals_scored
-                df.at[i, self.config['abs_recent_nb_goals_scored_by_match_away_team']] = avg_away_goals_scored
-                df.at[i, self.config['abs_recent_nb_goals_conceded_by_match_home_team']] = avg_home_goals_conceded
-                df.at[i, self.config['abs_recent_nb_goals_conceded_by_match_away_team']] = avg_away_goals_conceded
-                df.at[i, self.config['abs_recent_goal_difference_home_team']] = home_goal_diff
-                df.at[i, self.config['abs_recent_goal_difference_away_team']] = away_goal_diff
-                df.at[i, self.config['abs_recent_ranking_home_team']] = home_rank
-                df.at[i, self.config['abs_recent_ranking_away_team']] = away_rank
+        # Long per-team match log and rolling windows of the max_matches last matches of each team
+        home_form, away_form = recent_form_features(df, self.config['date_column'], self.config['season_column'], self.config['home_column'], self.config['away_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'], self.config['final_result_column'], max_matches)
 
-        return df
+        return self._assign_absolute_recent_form_indicators(df, home_form, away_form)
 
 
     def computes_absolute_historical_form_indicators(self):
@@ -396,64 +351,10 @@ class Preprocessing:
         df = self.df.copy()
         df = df.sort_values(by=self.config['date_column']).reset_index(drop=True)
         
-        # Initialization
-        indicators = [self.config['abs_hist_nb_points_by_season_home_team'],
-                      self.config['abs_hist_nb_points_by_season_away_team'],
-                      self.config['abs_hist_nb_goals_scored_by_season_home_team'],
-                      self.config['abs_hist_nb_goals_scored_by_season_away_team'],
-                      self.config['abs_hist_nb_goals_conceded_by_season_home_team'],
-                      self.config['abs_hist_nb_goals_conceded_by_season_away_team'],
-                      self.config['abs_hist_ranking_by_season_home_team'],
-                      self.config['abs_hist_ranking_by_season_away_team']]
-
-        for col in indicators:
-            df[col] = None
-
-        # Season loop
-        for i, row in df.iterrows():
-            current_season = row[self.config['season_column']]
-            current_date = row[self.config['date_column']]
-            home_team = row[self.config['home_column']]
-            away_team = row[self.config['away_column']]
-
-            # All previous seasons
-            past_seasons = df[(df[self.config['date_column']] < current_date) & (df[self.config['season_column']] != current_season)]
-
-            if past_seasons.empty:
-                df.at[i, self.config['abs_hist_nb_points_by_season_home_team']] = -1
-                df.at[i, self.config['abs_hist_nb_points_by_season_away_team']] = -1
-                df.at[i, self.config['abs_hist_nb_goals_scored_by_season_home_team']] = -1
-                df.at[i, self.config['abs_hist_nb_goals_scored_by_season_away_team']] = -1
-                df.at[i, self.config['abs_hist_nb_goals_conceded_by_season_home_team']] = -1
-                df.at[i, self.config['abs_hist_nb_goals_conceded_by_season_away_team']] = -1
-                df.at[i, self.config['abs_hist_ranking_by_season_home_team']] = -1
-                df.at[i, self.config['abs_hist_ranking_by_season_away_team']] = -1
-                continue
-
-            # Indicators computation
-            home_points_avg = past_seasons.drop(columns=[self.config['season_column']]).groupby(past_seasons[self.config['season_column']]).apply(lambda x: self._nb_points(x, home_team)).mean()
-            away_points_avg = past_seasons.drop(columns=[self.config['season_column']]).groupby(past_seasons[self.config['season_column']]).apply(lambda x: self._nb_points(x, away_team)).mean()
+        # Final tables of each season computed once, then averaged over the previous seasons of each match
+        home_hist, away_hist = historical_form_features(df, self.config['season_column'], self.config['home_column'], self.config['away_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'], self.config['final_result_column'])
 
-            home_goals_avg = past_seasons.drop(columns=[self.config['season_column']]).groupby(past_seasons[self.config['season_column']]).apply(lambda x: self._goals_scored(x, home_team)).mean()
-            away_goals_avg = past_seasons.drop(columns=[self.config['season_column']]).groupby(past_seasons[self.config['season_column']]).apply(lambda x: self._goals_scored(x, away_team)).mean()
-
-            home_conceded_avg = past_seasons.drop(columns=[self.config['season_column']]).groupby(past_seasons[self.config['season_column']]).apply(lambda x: self._goals_conceded(x, home_team)).mean()
-            away_conceded_avg = past_seasons.drop(columns=[self.config['season_column']]).groupby(past_seasons[self.config['season_column']]).apply(lambda x: self._goals_conceded(x, away_team)).mean()
-
-            home_rank_avg = past_seasons.drop(columns=[self.config['season_column']]).groupby(past_seasons[self.config['season_column']]).apply(lambda x: self._ranking_club(x, home_team)).mean()
-            away_rank_avg = past_seasons.drop(columns=[self.config['season_column']]).groupby(past_seasons[self.config['season_column']]).apply(lambda x: self._ranking_club(x, away_team)).mean()
-
-            # Assignment
-            df.at[i, self.config['abs_hist_nb_points_by_season_home_team']] = home_points_avg
-            df.at[i, self.config['abs_hist_nb_points_by_season_away_team']] = away_points_avg
-            df.at[i, self.config['abs_hist_nb_goals_scored_by_season_home_team']] = home_goals_avg
-            df.at[i, self.config['abs_hist_nb_goals_scored_by_season_away_team']] = away_goals_avg
-            df.at[i, self.config['abs_hist_nb_goals_conceded_by_season_home_team']] = home_conceded_avg
-            df.at[i, self.config['abs_hist_nb_goals_conceded_by_season_away_team']] = away_conceded_avg
-            df.at[i, self.config['abs_hist_ranking_by_season_home_team']] = home_rank_avg
-            df.at[i, self.config['abs_hist_ranking_by_season_away_team']] = away_rank_avg
-            
-        return df
+        return self._assign_absolute_historical_form_indicators(df, home_hist, away_hist)
 
 
     def computes_relative_recent_form_indicators(self, max_matches: int=None):
@@ -475,95 +376,11 @@ class Preprocessing:
         if max_matches is None:
             max_matches = self.config['rel_max_matches']
 
-        # Initialization
-        indicators = [self.config['rel_recent_nb_points_by_match_home_team'],
-                      self.config['rel_recent_nb_points_by_match_away_team'],
-                      self.config['rel_recent_nb_goals_scored_by_match_home_team'],
-                      self.config['rel_recent_nb_goals_scored_by_match_away_team'],
-                      self.config['rel_recent_nb_goals_conceded_by_match_home_team'],
-                      self.config['rel_recent_nb_goals_conceded_by_match_away_team'],
-                      self.config['rel_recent_goal_difference_home_team'],
-                      self.config['rel_recent_goal_difference_away_team'],
-                      self.config['rel_percentage_victory_home_team'],
-                      self.config['rel_percentage_victory_away_team']]
-
-        for col in indicators:
-            df[col] = -1.0
-
-    
-        # Creation of a pair key column for each teams pair in chronological order (home away order not important here)
-        df['pair_key'] = df.apply(lambda x: tuple(sorted([x[self.config['home_column']], x[self.config['away_column']]])), axis=1)
-        grouped = df.groupby('pair_key', group_keys=False)
-
-        # Indicators computation
-        results = []
+        # Head-to-head store: confrontations indexed by pair key (home away order not important here), with cumulative statistics of both clubs
+        store = HeadToHeadStore(df, self.config['home_column'], self.config['away_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'], self.config['final_result_column'], ordered=False)
+        home_form, away_form = store.features(max_matches)
 
-        for pair, sub in grouped:
-            sub = sub.sort_values(by=self.config['date_column']).reset_index()
-            n = len(sub)
-            if n == 0:
-                continue
-
-            for i in range(n):
-                prev = sub.iloc[max(0, i - max_matches):i] # last matches between the two teams
-                if prev.empty:
-                    continue
-
-                row = sub.loc[i]
-                home = row[self.config['home_column']]
-                away = row[self.config['away_column']]
-                n_matches = len(prev)
-
-                # Number of points by match
-                home_pts_by_match = self._nb_points(prev, home) / n_matches if n_matches > 0 else - 1
-                away_pts_by_match = self._nb_points(prev, away) / n_matches if n_matches > 0 else -1
-
-                # Goals scored
-                home_goals_scored_by_match = self._goals_scored(prev, home) / n_matches if n_matches > 0 else -1
-                away_goals_scored_by_match = self._goals_scored(prev, away) / n_matches if n_matches > 0 else -1
-
-                # Goals conceded
-                home_goals_conceded_by_match = self._goals_conceded(prev, home) / n_matches if n_matches > 0 else -1
-                away_goals_conceded_by_match = self._goals_conceded(prev, away) / n_matches if n_matches > 0 else -1
-
-                # Goal difference
-                home_goal_diff = self._goal_diff(prev, home)
-                away_goal_diff = self._goal_diff(prev, away)
-
-                # Win percentage
-                home_perc_wins = len(prev[
-                                     ((prev[self.config['home_column']] == home) & (prev[self.config['final_result_column']] == 'home')) |
-                                     ((prev[self.config['away_column']] == home) & (prev[self.config['final_result_column']] == 'away'))
-                                     ]) / n_matches if n_matches > 0 else -1
-                away_perc_wins = len(prev[
-                                     ((prev[self.config['home_column']] == away) & (prev[self.config['final_result_column']] == 'home')) |
-                                     ((prev[self.config['away_column']] == away) & (prev[self.config['final_result_column']] == 'away'))
-                                     ]) / n_matches if n_matches > 0 else -1
-
-                # Assignment
-                results.append((
-                    row['index'],
-                    home_pts_by_match,
-                    away_pts_by_match,
-                    home_goals_scored_by_match,
-                    away_goals_scored_by_match,
-                    home_goals_conceded_by_match,
-                    away_goals_conceded_by_match,
-                    home_goal_diff,
-                    away_goal_diff,
-                    100 * home_perc_wins,
-                    100 * away_perc_wins
-                ))
-
-        # df update
-        if results:
-            res_df = pd.DataFrame(results, columns=['index']+indicators).set_index('index')
-            df.update(res_df)
-
-        # Deleting the temporary pair key
-        df.drop(columns=['pair_key'], inplace=True)
-
-        return df
+        return self._assign_relative_recent_form_indicators(df, home_form, away_form)
 
 
     def computes_strict_relative_recent_form_indicators(self, max_matches: int=None):
@@ -586,95 +403,11 @@ class Preprocessing:
         if max_matches is None:
             max_matches = self.config['strict_rel_max_matches']
 
-        # Initialization
-        indicators = [self.config['strict_rel_recent_nb_points_by_match_home_team'],
-                      self.config['strict_rel_recent_nb_points_by_match_away_team'],
-                      self.config['strict_rel_recent_nb_goals_scored_by_match_home_team'],
-                      self.config['strict_rel_recent_nb_goals_scored_by_match_away_team'],
-                      self.config['strict_rel_recent_nb_goals_conceded_by_match_home_team'],
-                      self.config['strict_rel_recent_nb_goals_conceded_by_match_away_team'],
-                      self.config['strict_rel_recent_goal_difference_home_team'],
-                      self.config['strict_rel_recent_goal_difference_away_team'],
-                      self.config['strict_rel_percentage_victory_home_team'],
-                      self.config['strict_rel_percentage_victory_away_team']]
-
-        for col in indicators:
-            df[col] = -1.0
+        # Head-to-head store: confrontations indexed by pair key (home away order important here), with cumulative statistics of both clubs
+        store = HeadToHeadStore(df, self.config['home_column'], self.config['away_column'], self.config['nb_goals_home_column'], self.config['nb_goals_away_column'], self.config['final_result_column'], ordered=True)
+        home_form, away_form = store.features(max_matches)
 
-    
-        # Creation of a pair key column for each teams pair in chronological order (home away order important here)
-        df['pair_key'] = df.apply(lambda x: (x[self.config['home_column']], x[self.config['away_column']]), axis=1)
-        grouped = df.groupby('pair_key', group_keys=False)
-
-        # Indicators computation
-        results = []
-
-        for pair, sub in grouped:
-            sub = sub.sort_values(by=self.config['date_column']).reset_index()
-            n = len(sub)
-            if n == 0:
-                continue
-
-            for i in range(n):
-                prev = sub.iloc[max(0, i - max_matches):i] # last matches between the two teams
-                if prev.empty:
-                    continue
-
-                row = sub.loc[i]
-                home = row[self.config['home_column']]
-                away = row[self.config['away_column']]
-                n_matches = len(prev)
-
-                # Number of points by match
-                home_pts_by_match = self._nb_points(prev, home) / n_matches if n_matches > 0 else - 1
-                away_pts_by_match = self._nb_points(prev, away) / n_matches if n_matches > 0 else -1
-
-                # Goals scored
-                home_goals_scored_by_match = self._goals_scored(prev, home) / n_matches if n_matches > 0 else -1
-                away_goals_scored_by_match = self._goals_scored(prev, away) / n_matches if n_matches > 0 else -1
-
-                # Goals conceded
-                home_goals_conceded_by_match = self._goals_conceded(prev, home) / n_matches if n_matches > 0 else -1
-                away_goals_conceded_by_match = self._goals_conceded(prev, away) / n_matches if n_matches > 0 else -1
-
-                # Goal difference
-                home_goal_diff = self._goal_diff(prev, home)
-                away_goal_diff = self._goal_diff(prev, away)
-
-                # Win percentage
-                home_perc_wins = len(prev[
-                                     ((prev[self.config['home_column']] == home) & (prev[self.config['final_result_column']] == 'home')) |
-                                     ((prev[self.config['away_column']] == home) & (prev[self.config['final_result_column']] == 'away'))
-                                     ]) / n_matches if n_matches > 0 else -1
-                away_perc_wins = len(prev[
-                                     ((prev[self.config['home_column']] == away) & (prev[self.config['final_result_column']] == 'home')) |
-                                     ((prev[self.config['away_column']] == away) & (prev[self.config['final_result_column']] == 'away'))
-                                     ]) / n_matches if n_matches > 0 else -1
-
-                # Assignment
-                results.append((
-                    row['index'],
-                    home_pts_by_match,
-                    away_pts_by_match,
-                    home_goals_scored_by_match,
-                    away_goals_scored_by_match,
-                    home_goals_conceded_by_match,
-                    away_goals_conceded_by_match,
-                    home_goal_diff,
-                    away_goal_diff,
-                    100 * home_perc_wins,
-                    100 * away_perc_wins
-                ))
-
-        # df update
-        if results:
-            res_df = pd.DataFrame(results, columns=['index']+indicators).set_index('index')
-            df.update(res_df)
-
-        # Deleting the temporary pair key
-        df.drop(columns=['pair_key'], inplace=True)
-
-        return df
+        return self._assign_strict_relative_recent_form_indicators(df, home_form, away_form)
 
 
     def computes_ext_factors(self):
@@ -690,48 +423,22 @@ class Preprocessing:
         df = self.df.copy()
         df = df.sort_values(by=self.config['date_column']).reset_index(drop=True)
 
-        # Util feature: season start year (e.g. 2014 for 2014/2015)
-        df['season_start_year'] = df[self.config['season_column']].str.split('/').str[0].astype(int)
+        # Club x season presence matrices, with cumulative counts of seasons
+        home_ext, away_ext = club_seasons_features(df, self.config['season_column'], self.config['home_column'], self.config['away_column'])
 
-        # Number of seasons before the current one
-        def nb_past_seasons(row, club_col):
-            past_seasons = df[(df[club_col] == row[club_col]) & (df['season_start_year'] < row['season_start_year'])][self.config['season_column']].nunique()
-            return past_seasons
-
-        df[self.config['hist_nb_seasons_l1_home_team']] = df.apply(lambda row: nb_past_seasons(row, self.config['home_column']), axis=1)
-        df[self.config['hist_nb_seasons_l1_away_team']] = df.apply(lambda row: nb_past_seasons(row, self.config['away_column']), axis=1)
-
-        # Promoted or not? A promoted club is a club playing in Ligue 1 a season N while not having played in Ligue 1 at season N-1
-        clubs_presence = set((club, season) for club, season in zip(df[self.config['home_column']], df['season_start_year'])) # couples (club, year of presence)
-        def is_promoted(row, club_col): # club_col: home or away column
-            if row['season_start_year'] == df['season_start_year'].min():
-                return 0  # first season of the historical data: 0 for all clubs
-            return int((row[club_col], row['season_start_year']-1) not in clubs_presence)
-
-        df[self.config['promoted_home_team']] = df.apply(lambda row: is_promoted(row, self.config['home_column']), axis=1)
-        df[self.config['promoted_away_team']] = df.apply(lambda row: is_promoted(row, self.config['away_column']), axis=1)
-        df.drop(columns=['season_start_year'], inplace=True)
-
-        return df
+        return self._assign_ext_factors(df, home_ext, away_ext)
 
 
-    def run_preprocessing_pipeline(self):
+    def _run_indicator_phases(self) -> pd.DataFrame:
         """
-        Runs all the preprocessing pipeline:
-        - computes betting odds variables
-        - computes current season indicators
-        - computes absolute recent form indicators
-        - computes absolute historical form indicators
-        - computes relative recent form indicators
-        - computes strict relative recent form indicators
-        - computes external factor indicators
+        Runs the phases 2 to 7 of the preprocessing pipeline on self.df (betting odds variables already computed)
+        Phases are run in a process pool when config['preprocessing_n_jobs'] is different from 1
         """
-        self.df = self.df.sort_values(by=self.config['date_column']).reset_index(drop=True)
-
-        # Bettings odd variables
-        print("Phase 1: creation of betting odd variables")
-        self.df = self.creation_betting_odd_variable()
-        print("Phase 1 OK \n")
+        n_jobs = self.config.get('preprocessing_n_jobs', 1)
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+        if n_jobs > 1:
+            return self._run_indicator_phases_parallel(n_jobs)
 
         # Current season indicators
         print("Phase 2: creation of current season indicators")
@@ -763,6 +470,192 @@ class Preprocessing:
         self.df = self.computes_ext_factors()
         print("Phase 7 OK \n")
 
+        return self.df
+
+
+    def _run_indicator_phases_parallel(self, n_jobs: int) -> pd.DataFrame:
+        """
+        Runs the phases 2 to 7 of the preprocessing pipeline in a pool of n_jobs processes
+        Phases only read the base columns, so they are independent: phases 4 to 7 are run on the whole dataframe, phases 2 and 3 (based on the
+        current season only) are split by season. Indicator columns are then merged back to the dataframe sorted by date
+
+        Returns:
+            The dataframe with the indicators of phases 2 to 7
+        """
+        df = self.df.sort_values(by=self.config['date_column']).reset_index(drop=True)
+        keys = [self.config['date_column'], self.config['home_column'], self.config['away_column']]
+        phases = {
+            'computes_current_season_indicators': "Phase 2: creation of current season indicators",
+            'computes_absolute_recent_form_indicators': "Phase 3: creation of absolute recent form indicators",
+            'computes_absolute_historical_form_indicators': "Phase 4: creation of absolute historical form indicators",
+            'computes_relative_recent_form_indicators': "Phase 5: creation of relative recent form indicators",
+            'computes_strict_relative_recent_form_indicators': "Phase 6: creation of strict relative recent form indicators",
+            'computes_ext_factors': "Phase 7: creation of external factor indicators"
+        }
+        per_season = ['computes_current_season_indicators', 'computes_absolute_recent_form_indicators']
+
+        # Tasks: (phase, partition), the longest ones (whole dataframe) submitted first
+        tasks = [(method, df) for method in phases if method not in per_season]
+        tasks += [(method, df.iloc[positions]) for method in per_season for positions in df.groupby(self.config['season_column'], sort=False, observed=True).indices.values()]
+
+        print(f"Phases 2 to 7: creation of indicators with {n_jobs} workers ({len(tasks)} tasks)")
+        results = {method: [] for method in phases}
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {executor.submit(_run_phase, partition, self.config, method): method for method, partition in tasks}
+            for future in as_completed(futures):
+                results[futures[future]].append(future.result())
+
+        # Merge of the indicators, in the order of the phases and aligned on the matches of df
+        index = pd.MultiIndex.from_frame(df[keys])
+        for method, message in phases.items():
+            print(message)
+            phase_df = pd.concat(results[method]).set_index(keys)
+            new_columns = [c for c in phase_df.columns if c not in df.columns]
+            aligned = phase_df.reindex(index)
+            for col in new_columns:
+                df[col] = aligned[col].to_numpy()
+            print(f"{message.split(':')[0]} OK \n")
+
+        self.df = df
+        return self.df
+
+
+    def run_preprocessing_pipeline(self):
+        """
+        Runs all the preprocessing pipeline:
+        - computes betting odds variables
+        - computes current season indicators
+        - computes absolute recent form indicators
+        - computes absolute historical form indicators
+        - computes relative recent form indicators
+        - computes strict relative recent form indicators
+        - computes external factor indicators
+        """
+        self.df = self.df.sort_values(by=self.config['date_column']).reset_index(drop=True)
+        memory_before = self.memory_footprint()
+        self.df = self._compact_dtypes(self.df)
+
+        # Bettings odd variables
+        print("Phase 1: creation of betting odd variables")
+        self.df = self._compact_dtypes(self.creation_betting_odd_variable())
+        print("Phase 1 OK \n")
+
+        # Indicators (phases 2 to 7)
+        self.df = self._compact_dtypes(self._run_indicator_phases())
+
         print("Preprocessing OK \n")
+        print(f"Memory footprint: {memory_before:.2f} MB for the input dataframe, {self.memory_footprint():.2f} MB for the preprocessed dataframe \n")
         
-        return self.df
\ No newline at end of file
+        return self.df
+
+
+    def feature_state(self, df=None) -> FeatureState:
+        """
+        Builds the running state of the indicators (league tables, last matches, last confrontations, seasons of presence) from the matches of df
+
+        Args:
+            - df: dataframe with the matches (self.df by default), e.g. a previously preprocessed dataframe
+
+        Returns:
+            The FeatureState which allows to compute the indicators of new matches only, to be persisted with FeatureState.save (e.g. in
+            config['preprocessed_dir'] under the name config['preprocessing_state_name'])
+        """
+        return build_feature_state(self.df if df is None else df, self.config)
+
+
+    def _check_consistency(self, df, new_df):
+        """
+        Compares the indicators of the new matches (new_df, incrementally computed) with the ones of a full run of the preprocessing pipeline
+        on all the matches (df), from their base columns only (betting odds are not compared)
+
+        Raises:
+            ValueError if at least one indicator differs
+        """
+        keys = [self.config['date_column'], self.config['home_column'], self.config['away_column']]
+        match_columns = [self.config['date_column'], self.config['season_column'], self.config['home_column'], self.config['away_column'],
+                         self.config['nb_goals_home_column'], self.config['nb_goals_away_column'], self.config['final_result_column']]
+        base_columns = match_columns + [self.config['odd_home_column'], self.config['odd_away_column'], self.config['odd_draw_column']]
+
+        print("Consistency check: full rebuild of the indicators")
+        rebuilt = Preprocessing(df[match_columns].copy(), self.config).run_preprocessing_pipeline()
+        merged = new_df.merge(rebuilt, on=keys, how='left', suffixes=('', '_rebuilt'))
+
+        mismatches = []
+        for col in new_df.columns:
+            if col in base_columns:
+                continue
+            incremental, full = merged[col], merged[f"{col}_rebuilt"]
+            if pd.api.types.is_float_dtype(incremental) or pd.api.types.is_float_dtype(full):
+                equal = np.isclose(incremental.astype(float), full.astype(float), equal_nan=True)
+            else:
+                equal = (incremental == full).to_numpy()
+            if not equal.all():
+                mismatches.append(col)
+        if mismatches:
+            raise ValueError(f"Incremental indicators differ from a full rebuild for the following columns: {mismatches}")
+        print("Consistency check OK \n")
+
+
+    def run_incremental_preprocessing_pipeline(self, preprocessed_df, state: FeatureState=None, check_consistency: bool=False, snapshots_path: str=None) -> tuple[pd.DataFrame, FeatureState]:
+        """
+        Runs the preprocessing pipeline on the new matches of self.df only, and appends them to a previously preprocessed dataframe
+        The indicators of the new matches are computed from the running state of the history, which is rebuilt from preprocessed_df if not given
+
+        Args:
+            - preprocessed_df: dataframe returned by a previous run of the preprocessing pipeline
+            - state: FeatureState of the matches of preprocessed_df (e.g. loaded with FeatureState.load), updated in place with the new matches
+            - check_consistency: if True, the indicators of the new matches are compared with a full rebuild of the phases 2 to 7 (slow)
+            - snapshots_path: if given, the matchday snapshots of all the matches (cf matchday_snapshots) are rebuilt and saved to this file, so
+              that the tables read by the dashboard include the new matches
+
+        Returns:
+            The preprocessed dataframe with the new matches appended, and the updated state
+
+        NB: new matches must be played strictly after the last match of preprocessed_df
+        """
+        # Dates may not be parsed yet (e.g. dataframes read from csv), as in the full pipeline
+        date = self.config['date_column']
+        self.df[date] = pd.to_datetime(self.df[date])
+        preprocessed_df = preprocessed_df.assign(**{date: pd.to_datetime(preprocessed_df[date])})
+        self.df = self.df.sort_values(by=date).reset_index(drop=True)
+
+        # Bettings odd variables
+        print("Phase 1: creation of betting odd variables")
+        df = self.creation_betting_odd_variable()
+        print("Phase 1 OK \n")
+
+        if state is None:
+            state = self.feature_state(preprocessed_df)
+        elif state.nb_matches != len(preprocessed_df):
+            raise ValueError(f"The state has been built on {state.nb_matches} matches, the preprocessed dataframe has {len(preprocessed_df)} matches")
+
+        # Indicators of the new matches, matchday by matchday
+        print("Phases 2 to 7: creation of the indicators of the new matches")
+        features = state.process(df)
+        df = self.assign_indicators(df, features)
+        print("Phases 2 to 7 OK \n")
+
+        df = df[preprocessed_df.columns]
+        self.df = self._compact_dtypes(pd.concat([preprocessed_df, df], ignore_index=True))
+
+        if check_consistency:
+            self._check_consistency(self.df, df)
+
+        if snapshots_path is not None:
+            self.matchday_snapshots().save(snapshots_path)
+
+        print("Incremental preprocessing OK \n")
+
+        return self.df, state
+
+
+    def matchday_snapshots(self) -> MatchdaySnapshots:
+        """
+        Builds the store of the league tables of each season as of each matchday (cumulative, home and away statistics and rankings of each
+        club before the matches of each date), from the matches of self.df
+
+        Returns:
+            The MatchdaySnapshots, to be persisted with MatchdaySnapshots.save (e.g. in config['preprocessed_dir'] under the name
+            config['matchday_snapshots_name'])
+        """
+        return build_matchday_snapshots(self.df, self.config)
@@ -0,0 +1,150 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+# Extensions of the supported on-disk formats, columnar formats first (order of preference when loading)
+FORMAT_EXTENSIONS = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'csv': '.csv'
+}
+
+
+def base_columns(config) -> list:
+    """
+    Columns of a cleaned dataframe without betting odds (date, season, teams, goals and final result), which are the only ones needed by the
+    general and team pages of the dashboard
+    """
+    return [config['date_column'], config['season_column'], config['home_column'], config['away_column'], config['nb_goals_home_column'],
+            config['nb_goals_away_column'], config['final_result_column']]
+
+
+def dataset_schema(df, config) -> dict:
+    """
+    Typed schema of a cleaned or preprocessed dataframe: date as datetime, season, teams and final result as strings, goals as int8 and
+    integer indicators as int16 (when their values fit). Other columns (betting odds, averaged indicators) keep their type
+
+    Returns:
+        A dictionary {column: dtype} covering all the columns of df
+    """
+    string_cols = [config['season_column'], config['home_column'], config['away_column'], config['final_result_column']]
+    goals_cols = [config['nb_goals_home_column'], config['nb_goals_away_column']]
+    int16 = np.iinfo(np.int16)
+
+    schema = {}
+    for col in df.columns:
+        if col == config['date_column']:
+            schema[col] = 'datetime64[ns]'
+        elif col in string_cols:
+            schema[col] = object
+        elif col in goals_cols:
+            schema[col] = np.int8
+        elif pd.api.types.is_integer_dtype(df[col]) and (len(df) == 0 or (df[col].min() >= int16.min and df[col].max() <= int16.max)):
+            schema[col] = np.int16
+        else:
+            schema[col] = df[col].dtype
+    return schema
+
+
+def apply_schema(df, schema) -> pd.DataFrame:
+    """
+    Casts the columns of df to the types of schema (categories are turned back into their values)
+    """
+    df = df.copy()
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        if dtype is object:
+            df[col] = df[col].astype(object)
+        elif dtype == 'datetime64[ns]':
+            df[col] = pd.to_datetime(df[col])
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def save_dataframe(df, path, config, data_format='csv') -> str:
+    """
+    Saves a cleaned or preprocessed dataframe with its typed schema (cf dataset_schema)
+
+    Args:
+        df: dataframe to save
+        path: path of the file, without extension
+        config: dictionnary with the information specified in the config file
+        data_format: 'csv', 'parquet' or 'feather' (cf config['data_format'])
+
+    Returns:
+        The path of the written file
+    """
+    if data_format not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unknown data format: {data_format}, expected one of {list(FORMAT_EXTENSIONS)}")
+
+    df = apply_schema(df, dataset_schema(df, config)).reset_index(drop=True)
+    filepath = path + FORMAT_EXTENSIONS[data_format]
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    if data_format == 'parquet':
+        df.to_parquet(filepath, index=False)
+    elif data_format == 'feather':
+        df.to_feather(filepath)
+    else:
+        df.to_csv(filepath, index=False)
+    return filepath
+
+
+def dataframe_path(path) -> str:
+    """
+    Returns the file to read for a dataframe saved with save_dataframe under path (without extension): a columnar file is preferred, unless
+    it is older than the CSV file
+
+    Raises:
+        FileNotFoundError if no file has been saved under path
+    """
+    candidates = [path + ext for ext in FORMAT_EXTENSIONS.values() if os.path.exists(path + ext)]
+    if not candidates:
+        raise FileNotFoundError(f"File not found: {path} (.parquet, .feather or .csv)")
+
+    csv_path = path + FORMAT_EXTENSIONS['csv']
+    for candidate in candidates:
+        if candidate == csv_path or not os.path.exists(csv_path) or os.path.getmtime(candidate) >= os.path.getmtime(csv_path):
+            return candidate
+    return csv_path
+
+
+def load_dataframe(path, date_column=None, columns=None) -> pd.DataFrame:
+    """
+    Loads a dataframe saved with save_dataframe (or a CSV file written before), from its columnar file when present
+
+    Args:
+        path: path of the file, without extension
+        date_column: name of the date column, parsed when reading a CSV file
+        columns: optional list of the columns to read (other columns are not parsed)
+
+    Returns:
+        The loaded dataframe
+    """
+    filepath = dataframe_path(path)
+    if filepath.endswith(FORMAT_EXTENSIONS['parquet']):
+        return pd.read_parquet(filepath, columns=columns)
+    if filepath.endswith(FORMAT_EXTENSIONS['feather']):
+        return pd.read_feather(filepath, columns=columns)
+
+    parse_dates = [date_column] if date_column is not None and (columns is None or date_column in columns) else None
+    df = pd.read_csv(filepath, usecols=columns, parse_dates=parse_dates)
+    return df if columns is None else df[columns]
+
+
+def read_only(df) -> pd.DataFrame:
+    """
+    Returns a copy of df whose column arrays are read-only: in-place writes raise a ValueError, while adding or replacing columns in a
+    shallow copy (df.copy(deep=False)) leaves the data untouched. Columns with an extension type (categories...) are copied as is
+    """
+    columns = {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, np.dtype):
+            values = df[col].to_numpy(copy=True)
+            values.flags.writeable = False
+            columns[col] = values
+        else:
+            columns[col] = df[col].copy()
+    return pd.DataFrame(columns, index=df.index, copy=False)
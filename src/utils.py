@@ -1,6 +1,189 @@
+import numpy as np
 import pandas as pd
 
 
+def _nargsort(values, ascending=True) -> np.ndarray:
+    """
+    Ordering of a single key as produced by pd.DataFrame.sort_values (default 'quicksort' kind)
+    Reproducing it keeps ties broken exactly as in the rankings computed on dataframes
+    """
+    values = np.asarray(values)
+    idx = np.arange(len(values))
+    if not ascending:
+        values = values[::-1]
+        idx = idx[::-1]
+    indexer = idx[values.argsort(kind='quicksort')]
+    if not ascending:
+        indexer = indexer[::-1]
+    return indexer
+
+
+class TeamIndex:
+    """
+    Encoding of a dataframe of matches with dense integer codes, computed once:
+    - teams are coded in alphabetical order (order of a groupby on team names), seasons in sorted order
+    - points and goals of both sides are stored as arrays aligned with the codes of home and away teams
+
+    The *_codes functions of this module work on these arrays (np.bincount aggregations), so that statistics and rankings of all the clubs
+    can be computed in loops (e.g. on the matches before each date) without any groupby on strings
+    """
+    def __init__(self,
+                 df,
+                 col_home_team='home',
+                 col_away_team='away',
+                 col_final_result='final_result',
+                 nb_goals_home_column='nb_goals_home',
+                 nb_goals_away_column='nb_goals_away',
+                 col_season=None):
+        """
+        Args:
+            df: dataframe with the matches to encode
+            col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column: same as in compute_team_stats
+            col_season: name of the column mentionning the season of the match (seasons are not encoded if None)
+        """
+        home = df[col_home_team].to_numpy()
+        away = df[col_away_team].to_numpy()
+        self.teams = np.unique(np.concatenate([home, away]).astype(object))
+        self.team_codes = {team: code for code, team in enumerate(self.teams)}
+        self.home = np.searchsorted(self.teams, home).astype(np.intp)
+        self.away = np.searchsorted(self.teams, away).astype(np.intp)
+
+        # Points as computed by a map of the final result (unknown results count as 0, as in a groupby sum)
+        self.home_points = _as_values(df[col_final_result].map({'home': 3, 'draw': 1, 'away': 0}))
+        self.away_points = _as_values(df[col_final_result].map({'home': 0, 'draw': 1, 'away': 3}))
+        self.goals_home = _as_values(df[nb_goals_home_column])
+        self.goals_away = _as_values(df[nb_goals_away_column])
+
+        if col_season is not None:
+            seasons = df[col_season].to_numpy()
+            self.seasons = np.unique(seasons.astype(object))
+            self.season = np.searchsorted(self.seasons, seasons).astype(np.intp)
+
+
+    @property
+    def n_teams(self) -> int:
+        return len(self.teams)
+
+
+    def code(self, club) -> int:
+        """
+        Returns the code of the club (-1 if the club does not play any match of the index)
+        """
+        return self.team_codes.get(club, -1)
+
+
+def _as_values(series) -> np.ndarray:
+    """
+    Values of a numeric series for aggregations: int64 for integer series, float64 with missing values set to 0 otherwise
+    """
+    if pd.api.types.is_integer_dtype(series):
+        return series.to_numpy(dtype=np.int64)
+    return np.nan_to_num(series.to_numpy(dtype=np.float64))
+
+
+def _sum_by_code(codes, values, n_teams) -> np.ndarray:
+    """
+    Sums of values by code with np.bincount, keeping integer values as integers
+    """
+    sums = np.bincount(codes, weights=values, minlength=n_teams)
+    return sums.astype(np.int64) if np.issubdtype(values.dtype, np.integer) else sums
+
+
+def team_stats_codes(home, away, home_points, away_points, goals_home, goals_away, n_teams) -> dict:
+    """
+    Fast path of compute_team_stats on code arrays (e.g. attributes of a TeamIndex, or a selection of them)
+
+    Returns:
+        A dictionary of arrays indexed by team code, with keys 'played', 'points', 'goals_scored', 'goals_conceded' and 'goal_diff'
+    """
+    codes = np.concatenate([home, away])
+    stats = {
+        'played': np.bincount(codes, minlength=n_teams),
+        'points': _sum_by_code(codes, np.concatenate([home_points, away_points]), n_teams),
+        'goals_scored': _sum_by_code(codes, np.concatenate([goals_home, goals_away]), n_teams),
+        'goals_conceded': _sum_by_code(codes, np.concatenate([goals_away, goals_home]), n_teams)
+    }
+    stats['goal_diff'] = stats['goals_scored'] - stats['goals_conceded']
+    return stats
+
+
+def side_stats_codes(teams, points, goals_scored, goals_conceded, n_teams) -> dict:
+    """
+    Fast path of compute_home_away_stats on code arrays: statistics of one side only (home teams or away teams of the matches)
+
+    Returns:
+        A dictionary of arrays indexed by team code, with keys 'played', 'points', 'goals_scored', 'goals_conceded' and 'goal_diff'
+    """
+    stats = {
+        'played': np.bincount(teams, minlength=n_teams),
+        'points': _sum_by_code(teams, points, n_teams),
+        'goals_scored': _sum_by_code(teams, goals_scored, n_teams),
+        'goals_conceded': _sum_by_code(teams, goals_conceded, n_teams)
+    }
+    stats['goal_diff'] = stats['goals_scored'] - stats['goals_conceded']
+    return stats
+
+
+def table_order_codes(stats) -> np.ndarray:
+    """
+    Codes of the teams with at least one match, ordered by points then goal difference (ties in alphabetical order)
+    """
+    codes = np.flatnonzero(stats['played'] > 0)
+    return codes[np.lexsort((-stats['goal_diff'][codes], -stats['points'][codes]))]
+
+
+def ranking_codes(stats, by='general') -> np.ndarray:
+    """
+    Rankings of all the teams from the output of team_stats_codes or side_stats_codes
+
+    Args:
+        stats: dictionary of arrays indexed by team code
+        by: 'general' (points then goal difference), 'attack' (goals scored) or 'defense' (goals conceded), the two last ones breaking ties
+            as a sort of the general table
+
+    Returns:
+        An array indexed by team code with the ranking of each team (-1 for teams without any match)
+    """
+    order = table_order_codes(stats)
+    if by == 'attack':
+        order = order[_nargsort(stats['goals_scored'][order], ascending=False)]
+    elif by == 'defense':
+        order = order[_nargsort(stats['goals_conceded'][order], ascending=True)]
+    elif by != 'general':
+        raise ValueError(f"Unknown ranking: {by}")
+    ranks = np.full(len(stats['played']), -1, dtype=np.int64)
+    ranks[order] = np.arange(1, len(order) + 1)
+    return ranks
+
+
+def _stats_table(index, stats) -> pd.DataFrame:
+    """
+    Dataframe view of the statistics of the teams with at least one match, ordered by points then goal difference
+    """
+    order = table_order_codes(stats)
+    return pd.DataFrame({
+        'team': index.teams[order],
+        'points': stats['points'][order],
+        'goals_scored': stats['goals_scored'][order],
+        'goals_conceded': stats['goals_conceded'][order],
+        'goal_diff': stats['goal_diff'][order]
+    })
+
+
+def _side_stats(index, home) -> dict:
+    """
+    Statistics of the home matches (home=True) or away matches (home=False) of the teams of a TeamIndex
+    """
+    if home:
+        return side_stats_codes(index.home, index.home_points, index.goals_home, index.goals_away, index.n_teams)
+    return side_stats_codes(index.away, index.away_points, index.goals_away, index.goals_home, index.n_teams)
+
+
+def _club_ranking(ranks, index, club) -> int:
+    code = index.code(club)
+    return int(ranks[code]) if code >= 0 else -1
+
+
 def compute_team_stats(df, 
                        col_home_team='home', 
                        col_away_team='away', 
@@ -24,24 +207,9 @@ def compute_team_stats(df,
     if df.empty:
         return pd.DataFrame(columns=['team', 'points', 'goals_scored', 'goals_conceded', 'goal_diff'])
     
-    # Points earned by home and away teams
-    df = df.copy()
-    df['home_points'] = df[col_final_result].map({'home': 3, 'draw': 1, 'away': 0})
-    df['away_points'] = df[col_final_result].map({'home': 0, 'draw': 1, 'away': 3})
-
-    # Home and away views
-    home_stats = df[[col_home_team, 'home_points', nb_goals_home_column, nb_goals_away_column]].copy()
-    home_stats.columns = ['team', 'points', 'goals_scored', 'goals_conceded']
-
-    away_stats = df[[col_away_team, 'away_points', nb_goals_away_column, nb_goals_home_column]].copy()
-    away_stats.columns = ['team', 'points', 'goals_scored', 'goals_conceded']
-
-    # Combine and aggregate
-    all_stats = pd.concat([home_stats, away_stats], ignore_index=True)
-    agg_stats = all_stats.groupby('team', as_index=False).sum()
-    agg_stats['goal_diff'] = agg_stats['goals_scored'] - agg_stats['goals_conceded']
-
-    return agg_stats.sort_values(by=['points', 'goal_diff'], ascending=False).reset_index(drop=True)
+    index = TeamIndex(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
+    stats = team_stats_codes(index.home, index.away, index.home_points, index.away_points, index.goals_home, index.goals_away, index.n_teams)
+    return _stats_table(index, stats)
 
 
 def ranking_club(df,
@@ -64,11 +232,9 @@ def ranking_club(df,
     Returns:
         The ranking of the club providen as input. The ranking is computed according to the number of points. In case of equality, the goal difference is taken into consideration
     """
-    table = compute_team_stats(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
-    try:
-        return table.index[table['team'] == club][0] + 1
-    except IndexError:
-        return -1
+    index = TeamIndex(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
+    stats = team_stats_codes(index.home, index.away, index.home_points, index.away_points, index.goals_home, index.goals_away, index.n_teams)
+    return _club_ranking(ranking_codes(stats), index, club)
 
 
 def compute_home_away_stats(df, 
@@ -96,27 +262,8 @@ def compute_home_away_stats(df,
     if df.empty:
         return pd.DataFrame(columns=['team', 'points', 'goals_scored', 'goals_conceded', 'goal_diff'])
     
-    df = df.copy()
-    if home:
-        df['points'] = df[col_final_result].map({'home': 3, 'draw': 1, 'away': 0})
-        df['goals_scored'] = df[nb_goals_home_column]
-        df['goals_conceded'] = df[nb_goals_away_column]
-        teams = df[col_home_team]
-    else:
-        df['points'] = df[col_final_result].map({'home': 0, 'draw': 1, 'away': 3})
-        df['goals_scored'] = df[nb_goals_away_column]
-        df['goals_conceded'] = df[nb_goals_home_column]
-        teams = df[col_away_team]
-    
-    stats = pd.DataFrame({
-        'team': teams,
-        'points': df['points'],
-        'goals_scored': df['goals_scored'],
-        'goals_conceded': df['goals_conceded'],
-        'goal_diff': df['goals_scored'] - df['goals_conceded']
-    })
-    agg_stats = stats.groupby('team', as_index=False).sum()
-    return agg_stats.sort_values(by=['points', 'goal_diff'], ascending=False).reset_index(drop=True)
+    index = TeamIndex(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
+    return _stats_table(index, _side_stats(index, home))
 
 
 def home_ranking_club(df, 
@@ -139,11 +286,8 @@ def home_ranking_club(df,
     Returns:
         The home ranking of the club providen as input. The ranking is computed according to the number of points. In case of equality, the goal difference is taken into consideration
     """
-    table = compute_home_away_stats(df, True, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
-    try:
-        return table.index[table['team'] == club][0] + 1
-    except IndexError:
-        return -1
+    index = TeamIndex(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
+    return _club_ranking(ranking_codes(_side_stats(index, True)), index, club)
 
 
 def away_ranking_club(df, 
@@ -166,11 +310,8 @@ def away_ranking_club(df,
     Returns:
         The away ranking of the club providen as input. The ranking is computed according to the number of points. In case of equality, the goal difference is taken into consideration
     """
-    table = compute_home_away_stats(df, False, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
-    try:
-        return table.index[table['team'] == club][0] + 1
-    except IndexError:
-        return -1
+    index = TeamIndex(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
+    return _club_ranking(ranking_codes(_side_stats(index, False)), index, club)
 
 
 def attack_ranking_club(df: pd.DataFrame,
@@ -193,11 +334,9 @@ def attack_ranking_club(df: pd.DataFrame,
     Returns:
         The attack ranking of the club providen as input
     """
-    table = compute_team_stats(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column).sort_values(by=['goals_scored'], ascending=False).reset_index(drop=True)
-    try:
-        return table.index[table['team'] == club][0] + 1
-    except IndexError:
-        return -1
+    index = TeamIndex(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
+    stats = team_stats_codes(index.home, index.away, index.home_points, index.away_points, index.goals_home, index.goals_away, index.n_teams)
+    return _club_ranking(ranking_codes(stats, by='attack'), index, club)
 
 
 def defense_ranking_club(df: pd.DataFrame,
@@ -220,8 +359,6 @@ def defense_ranking_club(df: pd.DataFrame,
     Returns:
         The defense ranking of the club providen as input
     """
-    table = compute_team_stats(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column).sort_values(by=['goals_conceded'], ascending=True).reset_index(drop=True)
-    try:
-        return table.index[table['team'] == club][0] + 1
-    except IndexError:
-        return -1
\ No newline at end of file
+    index = TeamIndex(df, col_home_team, col_away_team, col_final_result, nb_goals_home_column, nb_goals_away_column)
+    stats = team_stats_codes(index.home, index.away, index.home_points, index.away_points, index.goals_home, index.goals_away, index.n_teams)
+    return _club_ranking(ranking_codes(stats, by='defense'), index, club)
\ No newline at end of file
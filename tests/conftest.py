@@ -0,0 +1,29 @@
+import os
+import sys
+
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(root_path)
+
+import pandas as pd
+import pytest
+
+from src.config import load_config
+from src.preprocessing import Preprocessing
+from src.storage import load_dataframe
+
+
+@pytest.fixture(scope='session')
+def config():
+    return load_config(os.path.join(root_path, 'config.yaml'))
+
+
+@pytest.fixture(scope='session')
+def cleaned_df(config):
+    cleaned_dir = os.path.join(root_path, config['cleaned_dir'])
+    return pd.concat([load_dataframe(os.path.join(cleaned_dir, config['cleaned_train_df_name']), config['date_column']),
+                      load_dataframe(os.path.join(cleaned_dir, config['cleaned_test_df_name']), config['date_column'])], ignore_index=True)
+
+
+@pytest.fixture(scope='session')
+def preprocessed_df(cleaned_df, config):
+    return Preprocessing(cleaned_df.copy(), config).run_preprocessing_pipeline()
@@ -0,0 +1,173 @@
+import functools
+import os
+
+import numpy as np
+import optuna
+import pytest
+from optuna.storages import JournalStorage
+from optuna.storages.journal import JournalFileBackend
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.datasets import make_classification
+from sklearn.feature_selection import SelectKBest
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GridSearchCV, StratifiedKFold
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from src import modeling
+from src.modeling import FoldPreprocessingCache, SearchTask, run_grid_search, run_optuna_search, run_searches
+
+
+@pytest.fixture
+def data():
+    return make_classification(n_samples=200, n_features=6, n_informative=3, random_state=0)
+
+
+class FailingClassifier(ClassifierMixin, BaseEstimator):
+    """Logistic regression whose fits with C > 1 fail while the file fail_path exists (transient error)"""
+    def __init__(self, C=1.0, fail_path=None):
+        self.C = C
+        self.fail_path = fail_path
+
+    def fit(self, X, y):
+        if self.C > 1 and self.fail_path is not None and os.path.exists(self.fail_path):
+            raise MemoryError("transient failure")
+        self.model_ = LogisticRegression(C=self.C).fit(X, y)
+        self.classes_ = self.model_.classes_
+        return self
+
+    def predict(self, X):
+        return self.model_.predict(X)
+
+
+def three_step_pipeline():
+    return Pipeline([('pre', StandardScaler()), ('sel', SelectKBest(k=2)), ('clf', LogisticRegression())])
+
+
+def test_cached_grid_search_matches_grid_search_cv(data, tmp_path):
+    X, y = data
+    grid = {'C': [0.001, 1.0]}
+    cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=0)
+    expected = GridSearchCV(three_step_pipeline(), {'clf__C': grid['C']}, scoring='f1_macro', cv=cv).fit(X, y)
+
+    result = run_grid_search(X, y, grid, three_step_pipeline(), cv=cv, n_jobs=1, verbose=0, cache_dir=str(tmp_path))
+
+    assert isinstance(result, GridSearchCV)
+    np.testing.assert_allclose(result.cv_results_['mean_test_score'], expected.cv_results_['mean_test_score'])
+    assert result.best_params_ == expected.best_params_
+    assert list(result.best_estimator_.named_steps) == ['pre', 'sel', 'clf']
+
+
+def test_optuna_search_scores_the_full_pipeline(data):
+    X, y = data
+    cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=0)
+    expected = GridSearchCV(three_step_pipeline(), {'clf__C': [0.001]}, scoring='f1_macro', cv=cv).fit(X, y)
+
+    result = run_optuna_search(X, y, {'C': [0.001]}, three_step_pipeline(), cv=cv, n_trials=1, verbose=0)
+
+    np.testing.assert_allclose(result.cv_results_['mean_test_score'], expected.cv_results_['mean_test_score'])
+
+
+def test_fold_cache_keeps_the_last_entries_in_memory(data, tmp_path):
+    X, y = data
+    cache = FoldPreprocessingCache(str(tmp_path), max_entries=2)
+    folds = list(StratifiedKFold(n_splits=3).split(X, y))
+    first = [cache.get(three_step_pipeline(), 'data', X, y, train, test) for train, test in folds]
+
+    assert len(cache._entries) == 2
+    again = [cache.get(three_step_pipeline(), 'data', X, y, train, test) for train, test in folds] # evicted entries read from disk
+    for (Xt_train, Xt_test), (Xt_train_again, Xt_test_again) in zip(first, again):
+        np.testing.assert_array_equal(Xt_train, Xt_train_again)
+        np.testing.assert_array_equal(Xt_test, Xt_test_again)
+
+
+def test_fold_cache_recomputes_unreadable_files(data, tmp_path):
+    X, y = data
+    train, test = next(StratifiedKFold(n_splits=3).split(X, y))
+    expected = FoldPreprocessingCache(str(tmp_path)).get(three_step_pipeline(), 'data', X, y, train, test)
+    for path in tmp_path.iterdir(): # files truncated as by a concurrent reader of a partial write
+        path.write_bytes(path.read_bytes()[:10])
+
+    Xt_train, Xt_test = FoldPreprocessingCache(str(tmp_path)).get(three_step_pipeline(), 'data', X, y, train, test)
+
+    np.testing.assert_array_equal(Xt_train, expected[0])
+    np.testing.assert_array_equal(Xt_test, expected[1])
+    assert not [path for path in tmp_path.iterdir() if path.suffix == '.tmp']
+
+
+def test_fold_cache_is_shared_by_the_search_entry_points(data, tmp_path, monkeypatch):
+    X, y = data
+    grid = {'C': [0.001, 1.0]}
+    cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=0)
+    grid_search = run_grid_search(X, y, grid, three_step_pipeline(), cv=cv, n_jobs=1, verbose=0, cache_dir=str(tmp_path))
+    files = {path.name: path.stat().st_mtime_ns for path in tmp_path.iterdir()}
+    assert len(files) == 2 * cv.get_n_splits() + 1 # fitted steps and test matrix of each fold, fitted steps of the refit
+
+    monkeypatch.setattr(modeling, '_fold_caches', {}) # entries read from disk, as in another process
+    searches = run_searches([SearchTask('clf', X, y, grid, three_step_pipeline(), 'f1_macro', cv, None)], n_jobs=1, cache_dir=str(tmp_path))
+    monkeypatch.setattr(modeling, '_fold_caches', {})
+    optuna_search = run_optuna_search(X, y, grid, three_step_pipeline(), cv=cv, n_trials=4, verbose=0, cache_dir=str(tmp_path))
+
+    assert {path.name: path.stat().st_mtime_ns for path in tmp_path.iterdir()} == files # no fold preprocessed again
+    expected = dict(zip(grid['C'], grid_search.cv_results_['mean_test_score']))
+    for result in (searches['clf'], optuna_search):
+        for params, score in zip(result.cv_results_['params'], result.cv_results_['mean_test_score']):
+            np.testing.assert_allclose(score, expected[params['clf__C']])
+
+
+def test_search_resumes_from_checkpoint_and_retries_failed_fits(data, tmp_path, capsys):
+    X, y = data
+    fail_path = tmp_path / 'fail'
+    pipeline = Pipeline([('pre', StandardScaler()), ('clf', FailingClassifier(fail_path=str(fail_path)))])
+    cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=0)
+    run = lambda grid: run_searches([SearchTask('clf', X, y, grid, pipeline, 'f1_macro', cv, None)], n_jobs=1,
+                                    checkpoint_dir=str(tmp_path / 'checkpoints'))
+
+    first = run({'C': [0.001, 1.0]})['clf']
+    fail_path.touch()
+    failed = run({'C': [0.001, 1.0, 10.0]})['clf'] # fits of the new candidate failing (in the workers): not checkpointed
+    assert np.isnan(failed.cv_results_['mean_test_score'][2])
+    fail_path.unlink()
+    capsys.readouterr()
+    resumed = run({'C': [0.001, 1.0, 10.0]})['clf']
+
+    assert "3 candidates x 3 folds, 6 fits restored from checkpoint" in capsys.readouterr().out
+    np.testing.assert_allclose(resumed.cv_results_['mean_test_score'][:2], first.cv_results_['mean_test_score'])
+    assert not np.isnan(resumed.cv_results_['mean_test_score']).any()
+
+
+@pytest.fixture
+def journal_storage(tmp_path, monkeypatch):
+    """Studies created in a journal file: trial attributes serialized when they are set, as with any persistent storage"""
+    storage = JournalStorage(JournalFileBackend(str(tmp_path / 'journal.log')))
+    monkeypatch.setattr(optuna, 'create_study', functools.partial(optuna.create_study, storage=storage))
+
+
+def test_optuna_search_evaluates_duplicate_trials_once(data, journal_storage):
+    X, y = data
+    cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=0)
+
+    result = run_optuna_search(X, y, {'C': [0.001, 1.0]}, three_step_pipeline(), cv=cv, n_trials=6, verbose=0)
+
+    fitted = [trial for trial in result.study_.trials if 'fit_times' in trial.user_attrs]
+    assert len(result.cv_results_['params']) == 6
+    assert sorted(trial.params['clf__C'] for trial in fitted) == [0.001, 1.0] # duplicates reuse the scores of the first trial
+    assert all(len(trial.user_attrs['scores']) == 3 for trial in result.study_.trials)
+    for params, score in zip(result.cv_results_['params'], result.cv_results_['mean_test_score']):
+        expected = GridSearchCV(three_step_pipeline(), {'clf__C': [params['clf__C']]}, scoring='f1_macro', cv=cv).fit(X, y)
+        np.testing.assert_allclose(score, expected.best_score_)
+
+
+@pytest.mark.filterwarnings('ignore::sklearn.exceptions.FitFailedWarning')
+def test_optuna_search_prunes_failed_trials(data, tmp_path, journal_storage):
+    X, y = data
+    fail_path = tmp_path / 'fail'
+    fail_path.touch()
+    pipeline = Pipeline([('pre', StandardScaler()), ('clf', FailingClassifier(fail_path=str(fail_path)))])
+
+    result = run_optuna_search(X, y, {'C': [0.1, 10.0]}, pipeline, cv=StratifiedKFold(n_splits=3), n_trials=4, verbose=0)
+
+    pruned = [trial for trial in result.study_.trials if trial.state == optuna.trial.TrialState.PRUNED]
+    assert pruned and all(trial.params['clf__C'] == 10.0 for trial in pruned)
+    assert all(len(trial.user_attrs['scores']) == 1 for trial in pruned) # only the failed fold fitted
+    assert result.best_params_ == {'clf__C': 0.1}
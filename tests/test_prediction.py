@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.preprocessing import IndicatorColumns, build_feature_state
+
+TIED_MATCHDAYS = ['2019-04-14', '2022-02-12', '2025-02-02']
+
+
+def test_query_matches_preprocessing_on_held_out_matchdays(preprocessed_df, config):
+    df = preprocessed_df.sort_values(by='date', kind='stable').reset_index(drop=True)
+    history = df[df['date'] < '2019-01-01']
+    state = build_feature_state(history, config)
+    columns = IndicatorColumns(config)
+
+    # One matchday out of four (and mid-season matchdays with ties in the recent ranking) queried from the state of the previous ones, all
+    # of them being then registered
+    for k, (date, day) in enumerate(df[df['date'] >= '2019-01-01'].groupby('date')):
+        if k % 4 and str(date.date()) not in TIED_MATCHDAYS:
+            state.update(day)
+            continue
+        fixtures = day[['date', 'season', 'home', 'away']].reset_index(drop=True)
+        rows = pd.DataFrame(columns.assign_indicators({col: fixtures[col].to_numpy() for col in fixtures.columns}, state.query(fixtures)))
+        for col in rows.columns.difference(fixtures.columns):
+            np.testing.assert_allclose(rows[col].astype(float), day[col].astype(float), err_msg=f"{col} on {date.date()}")
+        state.update(day)
+
+
+def test_query_rejects_past_seasons(preprocessed_df, config):
+    state = build_feature_state(preprocessed_df, config)
+    fixtures = pd.DataFrame({'season': ['2023/2024'], 'home': ['PSG'], 'away': ['Lyon']})
+
+    with pytest.raises(ValueError, match="past seasons"):
+        state.query(fixtures)
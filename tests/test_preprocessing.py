@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.engines import MatchdaySnapshots
+from src.preprocessing import Preprocessing, build_matchday_snapshots
+
+KEYS = ['date', 'home', 'away']
+RANKINGS = ['abs_recent_ranking_home_team', 'abs_recent_ranking_away_team']
+
+
+def assert_same_indicators(df, expected):
+    merged = df.merge(expected, on=KEYS, how='left', suffixes=('', '_expected'))
+    assert len(merged) == len(df)
+    for col in df.columns:
+        if col not in KEYS and pd.api.types.is_numeric_dtype(df[col]):
+            np.testing.assert_allclose(merged[col].astype(float), merged[f"{col}_expected"].astype(float), err_msg=col)
+
+
+def test_recent_ranking_does_not_depend_on_row_order(cleaned_df, preprocessed_df, config):
+    shuffled = Preprocessing(cleaned_df.sample(frac=1, random_state=0), config).run_preprocessing_pipeline()
+
+    assert_same_indicators(shuffled[KEYS + RANKINGS], preprocessed_df)
+
+
+@pytest.mark.parametrize('cut', ['2019-04-14', '2024-09-01', '2025-03-01'])
+def test_incremental_pipeline_matches_full_pipeline(cleaned_df, preprocessed_df, config, cut):
+    old, new = cleaned_df[cleaned_df['date'] < cut], cleaned_df[cleaned_df['date'] >= cut]
+    history = Preprocessing(old.copy(), config).run_preprocessing_pipeline()
+    assert_same_indicators(history[KEYS + RANKINGS], preprocessed_df) # matches of a subset ranked as in the whole dataframe
+
+    df, state = Preprocessing(new.copy(), config).run_incremental_preprocessing_pipeline(history, check_consistency=True)
+
+    assert state.nb_matches == len(cleaned_df)
+    indicators = [col for col in df.columns if col.startswith(('current_season', 'abs_', 'rel_', 'strict_rel_', 'hist_', 'promoted'))]
+    assert_same_indicators(df[KEYS + indicators], preprocessed_df)
+
+
+def test_incremental_pipeline_parses_string_dates(cleaned_df, preprocessed_df, config):
+    cut = '2025-03-01'
+    history = Preprocessing(cleaned_df[cleaned_df['date'] < cut].copy(), config).run_preprocessing_pipeline()
+    new = cleaned_df[cleaned_df['date'] >= cut].copy()
+    history['date'], new['date'] = history['date'].dt.strftime('%Y-%m-%d'), new['date'].dt.strftime('%Y-%m-%d')
+
+    df, _ = Preprocessing(new, config).run_incremental_preprocessing_pipeline(history)
+
+    assert pd.api.types.is_datetime64_any_dtype(df['date'])
+    assert_same_indicators(df[KEYS + RANKINGS], preprocessed_df)
+
+
+def test_incremental_pipeline_rewrites_snapshots(cleaned_df, config, tmp_path):
+    cut = '2025-03-01'
+    history = Preprocessing(cleaned_df[cleaned_df['date'] < cut].copy(), config).run_preprocessing_pipeline()
+    path = str(tmp_path / 'snapshots.joblib')
+
+    Preprocessing(cleaned_df[cleaned_df['date'] >= cut].copy(), config).run_incremental_preprocessing_pipeline(history, snapshots_path=path)
+
+    snapshots = MatchdaySnapshots.load(path)
+    expected = build_matchday_snapshots(cleaned_df, config)
+    assert (snapshots.nb_matches, snapshots.last_date) == (len(cleaned_df), cleaned_df['date'].max())
+    pd.testing.assert_frame_equal(snapshots.as_of('2024/2025').sort_index(), expected.as_of('2024/2025').sort_index())